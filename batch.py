@@ -0,0 +1,170 @@
+"""
+批量模式：把 JSONL / CSV 文件中的需求逐条送入流水线
+
+输入文件：
+    JSONL 每行一个对象，包含 id（可选）和 input / question / request / content 之一
+    CSV 需要表头，列名同上
+
+用法：
+    python batch.py ideas.jsonl --output-dir batch_output --workers 4 --max-in-flight 2
+
+每条需求完成后向 <output-dir>/manifest.jsonl 追加一行结果（状态、项目目录、耗时），
+中断后重新运行同一命令会跳过已成功的条目。
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from graph import build_graph
+from nodes.work_report_node import wait_for_work_reports, work_reports
+from tools.tools import search_tool
+from tools.search_cache import search_cache_report
+from utils.budget import run_budget
+from utils.concurrency import InFlightLimiter, LimitedLLM
+from utils.llm_cache import init_llm_cache
+from utils.metrics import MetricsCallbackHandler, flush_metrics
+from utils.model_routing import enable_model_routing
+from utils.registry import get_llm
+from utils.run_state import initial_state, final_response
+
+
+INPUT_FIELDS = ("input", "question", "request", "content")
+
+
+def load_requests(path):
+    """读取批量需求，返回 [(id, input)]"""
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rows.append(json.loads(line))
+
+    requests = []
+    for index, row in enumerate(rows, start=1):
+        user_input = next((row[field] for field in INPUT_FIELDS if row.get(field)), "")
+        if not user_input:
+            print(f"[BATCH] 跳过第 {index} 条：缺少输入字段")
+            continue
+        requests.append((str(row.get("id") or index), user_input))
+    return requests
+
+
+def load_finished(manifest_path):
+    """读取清单中已成功完成的条目 id"""
+    finished = set()
+    if not os.path.exists(manifest_path):
+        return finished
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时可能留下半行，忽略
+                continue
+            if record.get("status") == "ok":
+                finished.add(record["id"])
+    return finished
+
+
+class Manifest:
+    """线程安全的结果清单，每条记录立即落盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def run_one(graph, item_id, user_input, output_dir):
+    """运行单条需求，返回清单记录"""
+    started_at = time.time()
+    state = initial_state(user_input)
+    state["base_dir"] = output_dir
+    record = {"id": item_id, "input": user_input, "started_at": started_at}
+    metrics = MetricsCallbackHandler()
+    try:
+        with run_budget(), work_reports():
+            result = graph.invoke(state, config={"callbacks": [metrics]})
+            # 只等待本条需求的后台汇报
+            wait_for_work_reports()
+        record.update({
+            "status": "ok",
+            "new_dir": result.get("new_dir", ""),
+            "response": final_response(result),
+            "budget": result.get("budget_report"),
+        })
+    except Exception as e:
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    record["metrics"] = metrics.summary()
+    record["latency_s"] = round(time.time() - started_at, 3)
+    return record
+
+
+def run_batch(input_path, output_dir, workers=2, max_in_flight=2, model="llama3.1:8b", temperature=0.7, models_path=None):
+    """批量运行，返回本次运行的清单记录"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, "manifest.jsonl"))
+    finished = load_finished(manifest.path)
+
+    pending = [(item_id, text) for item_id, text in load_requests(input_path) if item_id not in finished]
+    print(f"[BATCH] 共 {len(pending) + len(finished)} 条，已完成 {len(finished)} 条，本次运行 {len(pending)} 条")
+    if not pending:
+        return []
+
+    # 所有工作线程共享同一个模型客户端与进行中调用名额
+    init_llm_cache()
+    limiter = InFlightLimiter(max_in_flight)
+    # 启用模型路由时，各路由的模型（含备用链）同样受进行中调用名额约束；路由配置中固定的模型参数需在创建客户端前生效
+    enable_model_routing(models_path, wrap=lambda routed: LimitedLLM(routed, limiter))
+    llm = LimitedLLM(get_llm(model, temperature=temperature, streaming=True), limiter)
+    graph = build_graph(llm.bind_tools([search_tool]), llm)
+
+    records = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = {executor.submit(run_one, graph, item_id, text, output_dir): item_id for item_id, text in pending}
+        for future in as_completed(futures):
+            record = future.result()
+            manifest.append(record)
+            records.append(record)
+            print(f"[BATCH] {record['id']} {record['status']} {record['latency_s']}s {record.get('new_dir') or record.get('error', '')}")
+            flush_metrics()
+
+    print(search_cache_report())
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量运行 AutoSpec 流水线")
+    parser.add_argument("input", help="JSONL 或 CSV 需求文件")
+    parser.add_argument("--output-dir", default="batch_output", help="项目目录与清单的输出位置")
+    parser.add_argument("--workers", type=int, default=2, help="同时运行的流水线数量")
+    parser.add_argument("--max-in-flight", type=int, default=2, help="同时进行中的 LLM 调用上限")
+    parser.add_argument("--model", default="llama3.1:8b")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--models", metavar="PATH", help="按节点选择模型的路由配置（默认 models.json，不存在时所有节点使用 --model）")
+    args = parser.parse_args(argv)
+
+    records = run_batch(args.input, args.output_dir, args.workers, args.max_in_flight, args.model, args.temperature, args.models)
+    failed = [r for r in records if r["status"] != "ok"]
+    print(f"[BATCH] 完成 {len(records) - len(failed)} 条，失败 {len(failed)} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+确定性的假聊天模型，用于在没有 Ollama 的环境中测量流水线自身的开销
+
+FakeChatModel 按提示词内容识别调用类型（意图识别、各阶段文档、代码、工作汇报等），返回固定的内容：
+任务文档包含带依赖的 T 编号任务，代码响应包含带 filename= 的代码块。
+绑定工具后，每段不同的提示词（不含工具调用轮次的消息）前 tool_rounds 次返回 search_tool 调用，之后不再调用工具；
+只有以 PROBE_INSTRUCTION 结尾的调用是工具判断（探测），不调用工具时回复“不需要”。
+fused 模式下正式生成的提示词直接交给绑定了工具的模型，不调用工具时按提示词内容返回对应的文档。
+首个 token 前等待 latency 秒，之后按 tokens_per_second 的速度输出。
+设置 kv_cache 与 prefill_tokens_per_second 时模拟 Ollama 的预填充：提示词按近似的对话模板展开，
+与 FakeKVCache 中缓存的前缀相同的部分不需要预填充，其余部分按 prefill_tokens_per_second 计时。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.llm_cache import CacheKeyParams
+from utils.prompt_layout import PROBE_INSTRUCTION
+
+
+# 调用类型：按提示词中的特征文本识别，顺序即优先级（代码提示词中包含任务文档，需排在 tasks 之前）
+CALL_KINDS = [
+    ("task_code", "你正在按任务逐个实现一个项目"),
+    ("project_name", "英文驼峰命名的项目文件夹名称"),
+    ("intent", "是否与软件开发相关"),
+    ("report", "生成一份简洁的工作汇报"),
+    ("report", "你是一个汇报者"),
+    ("requirements", "生成一份详细的需求文档"),
+    ("design", "将宏观设计分解为微观"),
+    ("code", "生成相应的代码实现"),
+    ("code", "生成一份可执行的Python代码"),
+    ("tasks", "开发任务列表"),
+    ("response", "生成一个直接、简洁的回答"),
+]
+CHARS_PER_TOKEN = 4
+# 绑定工具时模板中展开的工具说明（近似 llama3.1 的模板：放在最后一条用户消息之前）
+TOOLS_TEMPLATE = "<|tools|>\n" + json.dumps({
+    "name": "search_tool",
+    "description": "搜索互联网获取与查询相关的最新资料，返回若干条结果摘要。",
+    "parameters": {"type": "object", "properties": {"query": {"type": "string", "description": "搜索关键词"}}, "required": ["query"]},
+}, ensure_ascii=False) + "\n"
+
+
+def classify_prompt(prompt):
+    """识别提示词对应的调用类型"""
+    for kind, marker in CALL_KINDS:
+        if marker in prompt:
+            return kind
+    return "other"
+
+
+class FakeLLMStats:
+    """所有假模型实例共享的调用记录"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []
+        self.probes_seen = {}
+
+    def record(self, kind, prompt_chars, completion_chars, seconds, tool_call, cached_chars=0, prefill_seconds=0.0):
+        with self._lock:
+            self.calls.append({
+                "kind": kind,
+                "prompt_chars": prompt_chars,
+                "completion_chars": completion_chars,
+                "seconds": seconds,
+                "tool_call": tool_call,
+                "cached_chars": cached_chars,
+                "prefill_seconds": prefill_seconds,
+            })
+
+    def take_probe(self, prompt, tool_rounds):
+        """同一探测内容的前 tool_rounds 次返回 True"""
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            seen = self.probes_seen.get(key, 0)
+            self.probes_seen[key] = seen + 1
+        return seen < tool_rounds
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.probes_seen.clear()
+
+    def summary(self):
+        """按调用类型汇总"""
+        with self._lock:
+            calls = list(self.calls)
+        kinds = {}
+        for call in calls:
+            item = kinds.setdefault(call["kind"], {
+                "calls": 0, "tool_calls": 0, "prompt_chars": 0, "completion_chars": 0, "seconds": 0.0,
+                "cached_chars": 0, "prefill_s": 0.0,
+            })
+            item["calls"] += 1
+            item["tool_calls"] += int(call["tool_call"])
+            item["prompt_chars"] += call["prompt_chars"]
+            item["completion_chars"] += call["completion_chars"]
+            item["seconds"] += call["seconds"]
+            item["cached_chars"] += call["cached_chars"]
+            item["prefill_s"] += call["prefill_seconds"]
+        for item in kinds.values():
+            item["prompt_tokens_est"] = item["prompt_chars"] // CHARS_PER_TOKEN
+            item["completion_tokens_est"] = item["completion_chars"] // CHARS_PER_TOKEN
+            item["seconds"] = round(item["seconds"], 4)
+            item["prefill_s"] = round(item["prefill_s"], 4)
+        return {
+            "calls": len(calls),
+            "tool_calls": sum(int(call["tool_call"]) for call in calls),
+            "prompt_chars": sum(call["prompt_chars"] for call in calls),
+            "completion_chars": sum(call["completion_chars"] for call in calls),
+            "cached_chars": sum(call["cached_chars"] for call in calls),
+            "prefill_s": round(sum(call["prefill_seconds"] for call in calls), 4),
+            "by_kind": dict(sorted(kinds.items())),
+        }
+
+
+class FakeKVCache:
+    """模拟 Ollama 服务端的 KV 缓存：每个模型 slots 个缓存槽，跨运行保留
+
+    请求复用与其公共前缀最长的槽，公共前缀部分不需要预填充。新提示词延续该槽的全部内容时原地保存，
+    只共享一部分时与 Ollama 的多槽缓存一样保留原槽，把新提示词存入最久未用的槽。
+    """
+
+    def __init__(self, slots=4):
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def lookup(self, model, rendered):
+        """返回可复用的前缀字符数，并把 rendered 存入选中的槽"""
+        with self._lock:
+            cache = self._cache.setdefault(model, [])
+            best, best_length = None, 0
+            for index, cached in enumerate(cache):
+                length = len(os.path.commonprefix([cached, rendered]))
+                if length > best_length:
+                    best, best_length = index, length
+            if best is not None and best_length == len(cache[best]):
+                cache.pop(best)
+            elif len(cache) >= self.slots:
+                cache.pop(0)
+            cache.append(rendered)
+            return best_length
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def _paragraphs(topic, scale):
+    return "\n".join(
+        f"- {topic}要点 {i}：该部分描述了模块 {i} 的职责、输入输出以及与其他模块的协作方式。" for i in range(1, scale + 1)
+    )
+
+
+def canned_document(kind, scale=8, tasks=4, tag=""):
+    """各阶段文档的固定内容，tag 附在标题后，使不同需求的文档从开头就不同"""
+    tag = f"（{tag}）" if tag else ""
+    if kind == "requirements":
+        return f"# 需求文档{tag}\n\n## 功能需求\n{_paragraphs('功能', scale)}\n\n## 非功能需求\n{_paragraphs('性能', scale // 2 or 1)}\n"
+    if kind == "design":
+        return f"# 设计概述{tag}\n\n## 架构设计\n{_paragraphs('架构', scale)}\n\n## 接口设计\n{_paragraphs('接口', scale // 2 or 1)}\n"
+    if kind == "tasks":
+        lines = [f"# 开发任务列表{tag}", "", "## 核心功能开发"]
+        for i in range(1, tasks + 1):
+            deps = "无" if i == 1 else "、".join(f"T{j}" for j in range(max(1, i - 2), i))
+            lines += [
+                f"### T{i} 模块{i}",
+                f"1. 任务描述：实现模块 {i}",
+                "2. 任务优先级：高",
+                "3. 预计工时：2 小时",
+                f"4. 依赖任务：{deps}",
+                f"5. 涉及文件：module_{i}.py",
+                "",
+            ]
+        return "\n".join(lines)
+    return ""
+
+
+def canned_code(filename, lines=40):
+    """带文件名的代码块"""
+    body = "\n".join(f"    value_{i} = {i}  # 计算步骤 {i}" for i in range(lines))
+    return (
+        f"```python filename={filename}\n"
+        f"def run():\n{body}\n    return value_{lines - 1}\n\n\n"
+        f"class Service:\n    def handle(self, request):\n        return run()\n"
+        f"```\n"
+    )
+
+
+def canned_response(kind, prompt, scale=8, tasks=4, code_lines=40):
+    """按调用类型返回固定的响应文本"""
+    if kind == "intent":
+        return "是，这是一个软件开发需求。"
+    if kind == "project_name":
+        return "BenchApp"
+    if kind in ("requirements", "design", "tasks"):
+        return canned_document(kind, scale, tasks, tag=hashlib.md5(prompt.encode("utf-8")).hexdigest()[:6])
+    if kind == "task_code":
+        match = re.search(r"###\s*(T\d+)", prompt.rsplit("当前任务", 1)[-1])
+        task_id = match.group(1).lower() if match else "task"
+        return f"以下是当前任务的实现：\n\n{canned_code(f'{task_id}.py', code_lines)}"
+    if kind == "code":
+        return "以下是完整实现：\n\n" + "\n".join(canned_code(f"module_{i}.py", code_lines) for i in range(1, tasks + 1))
+    if kind == "report":
+        return "已完成文档生成，内容覆盖主要功能与设计要点，下一步进入后续阶段。"
+    if kind == "response":
+        return "已根据需求完成全部文档与代码的生成。"
+    if kind == "probe":
+        return "不需要"
+    return "好的。"
+
+
+def _role_and_content(message):
+    if isinstance(message, dict):
+        role, content = message.get("role", "user"), message.get("content", "")
+    else:
+        role, content = getattr(message, "type", "user"), getattr(message, "content", "")
+    role = {"human": "user", "ai": "assistant"}.get(role, role)
+    return role, content if isinstance(content, str) else str(content)
+
+
+def _prompt_text(messages):
+    return "\n".join(_role_and_content(message)[1] for message in messages)
+
+
+def _is_tool_round(message):
+    """工具调用轮次中的消息：带工具调用的 AIMessage 与 ToolMessage"""
+    return isinstance(message, ToolMessage) or bool(getattr(message, "tool_calls", None))
+
+
+def _is_probe(messages):
+    """以 PROBE_INSTRUCTION 结尾的调用是工具判断"""
+    return bool(messages) and _role_and_content(messages[-1])[1] == PROBE_INSTRUCTION
+
+
+def render_prompt(messages, tools_bound=False, legacy_layout=False):
+    """按近似的对话模板展开消息，用于模拟 KV 缓存的前缀匹配
+
+    legacy_layout 模拟拆分 system 前缀之前的布局：正式生成只有一条用户消息，指令的首行在可变内容之前、
+    其余在之后；工具探测只发送可变内容。
+    """
+    messages = [_role_and_content(message) for message in messages]
+    if legacy_layout:
+        system = "\n".join(content for role, content in messages if role == "system")
+        users = [content for role, content in messages if role == "user"]
+        if tools_bound or not system:
+            content = users[0] if users else ""
+        else:
+            head, _, rest = system.partition("\n")
+            content = f"{head}\n\n" + "\n".join(users) + f"\n\n{rest}"
+        messages = [("user", content)]
+    last_user = max((i for i, (role, _) in enumerate(messages) if role == "user"), default=-1)
+    parts = []
+    for index, (role, content) in enumerate(messages):
+        tools = TOOLS_TEMPLATE if tools_bound and index == last_user else ""
+        parts.append(f"<|{role}|>\n{tools}{content}<|end|>\n")
+    return "".join(parts) + "<|assistant|>\n"
+
+
+class FakeChatModel(CacheKeyParams, BaseChatModel):
+    """确定性的假聊天模型"""
+
+    model: str = "fake"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    tool_rounds: int = 1
+    doc_scale: int = 8
+    tasks: int = 4
+    code_lines: int = 40
+    tools_bound: bool = False
+    stats: Any = None
+    kv_cache: Any = None
+    prefill_tokens_per_second: float = 0.0
+    legacy_layout: bool = False
+
+    @property
+    def _llm_type(self):
+        return "autospec-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tools_bound": True})
+
+    def _plan(self, messages):
+        """返回 (调用类型, 提示词, 响应文本, 工具调用)"""
+        prompt = _prompt_text(messages)
+        # 带探测指令（或 demo.py 中不属于任何生成类型）的工具调用是工具判断；fused 模式下绑定了工具的正式生成按提示词内容识别
+        kind = classify_prompt(prompt)
+        if self.tools_bound and (_is_probe(messages) or kind == "other"):
+            kind = "probe"
+        # 同一提示词的前 tool_rounds 次调用工具；带上的工具调用结果不改变计数的键
+        base_prompt = _prompt_text([message for message in messages if not _is_tool_round(message)])
+        if self.tools_bound and self.stats.take_probe(base_prompt, self.tool_rounds):
+            query = " ".join(prompt.split())[:40] or "autospec"
+            tool_call = {"name": "search_tool", "args": {"query": query}, "id": f"call_{hashlib.md5(prompt.encode('utf-8')).hexdigest()[:12]}"}
+            return kind, prompt, "", [tool_call]
+        return kind, prompt, canned_response(kind, prompt, self.doc_scale, self.tasks, self.code_lines), []
+
+    def _usage(self, prompt, text):
+        input_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+        output_tokens = len(text) // CHARS_PER_TOKEN + 1
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _pieces(self, text):
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _prefill(self, messages):
+        """模拟预填充，返回 (命中缓存的字符数, 预填充耗时)"""
+        if self.kv_cache is None or not self.prefill_tokens_per_second:
+            return 0, 0.0
+        rendered = render_prompt(messages, self.tools_bound, self.legacy_layout)
+        cached = self.kv_cache.lookup(self.model, rendered)
+        return cached, (len(rendered) - cached) / CHARS_PER_TOKEN / self.prefill_tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        kind, prompt, text, tool_calls = self._plan(messages)
+        cached, prefill = self._prefill(messages)
+        time.sleep(self.latency + prefill + self._token_delay() * len(self._pieces(text)))
+        message = AIMessage(content=text, tool_calls=tool_calls, usage_metadata=self._usage(prompt, text))
+        self.stats.record(kind, len(prompt), len(text), time.perf_counter() - started, bool(tool_calls), cached, prefill)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        kind, prompt, text, tool_calls = self._plan(messages)
+        cached, prefill = self._prefill(messages)
+        time.sleep(self.latency + prefill)
+        for chunk in self._chunks(prompt, text, tool_calls):
+            if chunk.message.content:
+                time.sleep(self._token_delay())
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+        self.stats.record(kind, len(prompt), len(text), time.perf_counter() - started, bool(tool_calls), cached, prefill)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        kind, prompt, text, tool_calls = self._plan(messages)
+        cached, prefill = self._prefill(messages)
+        await asyncio.sleep(self.latency + prefill + self._token_delay() * len(self._pieces(text)))
+        message = AIMessage(content=text, tool_calls=tool_calls, usage_metadata=self._usage(prompt, text))
+        self.stats.record(kind, len(prompt), len(text), time.perf_counter() - started, bool(tool_calls), cached, prefill)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        kind, prompt, text, tool_calls = self._plan(messages)
+        cached, prefill = self._prefill(messages)
+        await asyncio.sleep(self.latency + prefill)
+        for chunk in self._chunks(prompt, text, tool_calls):
+            if chunk.message.content:
+                await asyncio.sleep(self._token_delay())
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+        self.stats.record(kind, len(prompt), len(text), time.perf_counter() - started, bool(tool_calls), cached, prefill)
+
+    def _chunks(self, prompt, text, tool_calls):
+        if tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call["id"], "index": i}
+                    for i, call in enumerate(tool_calls)
+                ],
+                usage_metadata=self._usage(prompt, text),
+            ))
+            return
+        pieces = self._pieces(text)
+        for i, piece in enumerate(pieces):
+            usage = self._usage(prompt, text) if i == len(pieces) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+
+
+def fake_llm_factory(stats, **defaults):
+    """供 registry.set_llm_factory 使用的构造函数：忽略 Ollama 专用参数，只保留模型名"""
+    def factory(model, **params):
+        return FakeChatModel(model=model, stats=stats, cache=False, **defaults)
+
+    return factory
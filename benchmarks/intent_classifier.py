@@ -0,0 +1,92 @@
+"""
+本地意图分类的准确率与延迟
+
+在标注集（默认 benchmarks/intent_eval.jsonl，与训练样本不重叠）上报告：
+整体准确率、规则与模型各自处理的比例和准确率，以及在不同置信度阈值下本地直接采用的比例（其余回退到模型）与这部分的准确率。
+
+    python -m benchmarks.intent_classifier
+    python -m benchmarks.intent_classifier --eval my_labeled.jsonl --thresholds 0.8,0.9
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from utils.intent_classifier import NaiveBayesIntent, classify_intent, load_samples
+
+
+EVAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_eval.jsonl")
+
+
+def evaluate(samples, model, thresholds):
+    results = [(classify_intent(text, model), label) for text, label in samples]
+    report = {
+        "samples": len(samples),
+        "accuracy": round(sum(result.label == label for result, label in results) / len(results), 4),
+        "by_source": {},
+        "thresholds": {},
+        "errors": [(text, label, result) for (text, label), (result, _) in zip(samples, results) if result.label != label],
+    }
+    for source in ("rules", "model"):
+        subset = [(result, label) for result, label in results if result.source == source]
+        if subset:
+            report["by_source"][source] = {
+                "share": round(len(subset) / len(results), 4),
+                "accuracy": round(sum(result.label == label for result, label in subset) / len(subset), 4),
+            }
+    for threshold in thresholds:
+        accepted = [(result, label) for result, label in results if result.confidence >= threshold]
+        report["thresholds"][threshold] = {
+            "local_share": round(len(accepted) / len(results), 4),
+            "local_accuracy": round(sum(r.label == l for r, l in accepted) / len(accepted), 4) if accepted else None,
+        }
+    return report
+
+
+def measure_latency(samples, model, rounds=200):
+    """每次分类的耗时（微秒）"""
+    timings = []
+    for _ in range(rounds):
+        for text, _ in samples:
+            started = time.perf_counter()
+            classify_intent(text, model)
+            timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {
+        "p50_us": round(statistics.median(timings), 1),
+        "p99_us": round(timings[int(len(timings) * 0.99) - 1], 1),
+        "mean_us": round(statistics.fmean(timings), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地意图分类的准确率与延迟")
+    parser.add_argument("--eval", default=EVAL_PATH, help="标注集（JSONL，每行包含 text 与 label）")
+    parser.add_argument("--thresholds", default="0.7,0.8,0.85,0.9,0.95", help="逗号分隔的置信度阈值")
+    parser.add_argument("--rounds", type=int, default=200, help="测量延迟时重复的轮数")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    model = NaiveBayesIntent().fit(load_samples())
+    train_ms = (time.perf_counter() - started) * 1000
+
+    samples = load_samples(args.eval)
+    thresholds = [float(value) for value in args.thresholds.split(",") if value.strip()]
+    report = evaluate(samples, model, thresholds)
+    latency = measure_latency(samples, model, args.rounds)
+
+    print(f"训练耗时 {train_ms:.1f}ms，评估样本 {report['samples']} 条，整体准确率 {report['accuracy']:.1%}")
+    for source, item in report["by_source"].items():
+        print(f"  {source:<6} 处理 {item['share']:.1%}，准确率 {item['accuracy']:.1%}")
+    print(f"延迟: p50 {latency['p50_us']}µs，p99 {latency['p99_us']}µs，平均 {latency['mean_us']}µs")
+    print("置信度阈值  本地采用  本地准确率")
+    for threshold, item in report["thresholds"].items():
+        accuracy = f"{item['local_accuracy']:.1%}" if item["local_accuracy"] is not None else "-"
+        print(f"  {threshold:<9} {item['local_share']:>8.1%}  {accuracy:>9}")
+    for text, label, result in report["errors"]:
+        print(f"  误判: {text}（标注 {label}，结果 {result.label} {result.confidence:.2f} {result.source}）")
+
+
+if __name__ == "__main__":
+    main()
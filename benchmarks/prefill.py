@@ -0,0 +1,209 @@
+"""
+提示词布局的预填充基准测试
+
+依次运行多条不同的需求（同一个模型服务、KV 缓存跨运行保留），比较两种提示词布局的预填充量与耗时：
+    system_prefix  当前布局：各节点固定的 SYSTEM_PROMPT 在前，可变内容在后，工具探测与正式生成共享前缀
+    legacy         拆分前的布局：指令与可变内容合并为一条用户消息，工具探测只发送可变内容
+默认使用带 KV 缓存模拟的假模型（benchmarks/fake_llm.py），--ollama 时对真实的 Ollama 服务测量当前布局，
+预填充量与耗时取自响应中的 prompt_eval_count / prompt_eval_duration（只统计未命中缓存的部分）。
+
+    python -m benchmarks.prefill --runs 5
+    python -m benchmarks.prefill --runs 5 --doc-scale 32 --slots 1
+    python -m benchmarks.prefill --runs 3 --ollama llama3.1:8b
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.globals import set_llm_cache
+
+from benchmarks.fake_llm import CHARS_PER_TOKEN, FakeKVCache, FakeLLMStats, fake_llm_factory
+from benchmarks.run_pipeline import StaticSearchBackend, _main_state, _quiet_sink
+from nodes.work_report_node import wait_for_work_reports
+from tools.search_backend import set_search_backend
+from tools.search_cache import SearchCache, set_search_cache
+from utils.budget import run_budget
+from utils.registry import get_llm, get_llm_with_tools, set_llm_factory
+from utils.request_index import RequestIndex, set_request_index
+from utils.streaming import reset_token_sink, set_token_sink
+
+
+LAYOUTS = ("legacy", "system_prefix")
+REQUESTS = [
+    "创建一个简单的待办事项应用，支持添加、完成和删除任务",
+    "开发一个图书管理系统，支持借阅、归还和逾期提醒",
+    "做一个天气预报网站，显示未来一周的天气",
+    "实现一个在线投票系统，支持匿名投票和结果统计",
+    "开发一个个人记账应用，支持分类统计和月度报表",
+    "做一个博客系统，支持文章发布、评论和标签",
+    "实现一个会议室预约系统，避免时间冲突",
+    "开发一个学生成绩管理系统，支持导入和排名",
+]
+
+
+class PromptEvalCollector(BaseCallbackHandler):
+    """收集 Ollama 响应中的预填充统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tokens = 0
+        self.seconds = 0.0
+        self.calls = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                metadata = dict(getattr(message, "response_metadata", None) or {}, **(generation.generation_info or {}))
+                if "prompt_eval_count" not in metadata and "prompt_eval_duration" not in metadata:
+                    continue
+                with self._lock:
+                    self.calls += 1
+                    self.tokens += metadata.get("prompt_eval_count") or 0
+                    self.seconds += (metadata.get("prompt_eval_duration") or 0) / 1e9
+
+
+def _run(graph, request, workdir, callbacks):
+    """在临时目录中运行一条需求，返回耗时"""
+    run_dir = tempfile.mkdtemp(dir=workdir)
+    previous_dir = os.getcwd()
+    os.chdir(run_dir)
+    set_search_cache(SearchCache(os.path.join(run_dir, "search_cache.sqlite"), ttl=0))
+    set_request_index(RequestIndex(os.path.join(run_dir, "request_index.sqlite")))
+    sink_token = set_token_sink(_quiet_sink)
+    state = _main_state()
+    state["messages"] = [{"role": "user", "content": request}]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), run_budget():
+            started = time.perf_counter()
+            graph.invoke(state, config={"callbacks": callbacks, "recursion_limit": 100})
+            wait_for_work_reports()
+            return time.perf_counter() - started
+    finally:
+        reset_token_sink(sink_token)
+        os.chdir(previous_dir)
+
+
+def _build_graph(model):
+    from graph import build_graph
+    from tools.tools import search_tool
+
+    return build_graph(get_llm_with_tools(model, [search_tool]), get_llm(model))
+
+
+def run_fake(layout, args, workdir):
+    """用带 KV 缓存模拟的假模型运行，返回每次运行的预填充统计"""
+    stats = FakeLLMStats()
+    kv_cache = FakeKVCache(args.slots)
+    set_llm_factory(fake_llm_factory(
+        stats,
+        tool_rounds=args.tool_rounds,
+        doc_scale=args.doc_scale,
+        kv_cache=kv_cache,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        legacy_layout=layout == "legacy",
+    ))
+    graph = _build_graph("llama3.1:8b")
+    runs = []
+    for index in range(args.runs):
+        stats.reset()
+        wall = _run(graph, REQUESTS[index % len(REQUESTS)], workdir, [])
+        calls = list(stats.calls)
+        cached = sum(call["cached_chars"] for call in calls) // CHARS_PER_TOKEN
+        prefilled = round(sum(call["prefill_seconds"] for call in calls) * args.prefill_tokens_per_second)
+        runs.append({
+            "wall_s": round(wall, 4),
+            "calls": len(calls),
+            "prefill_s": round(sum(call["prefill_seconds"] for call in calls), 4),
+            "prefill_tokens": prefilled,
+            "cached_tokens": cached,
+            "cached_ratio": round(cached / max(1, cached + prefilled), 4),
+        })
+    return runs
+
+
+def run_ollama(args, workdir):
+    """对真实的 Ollama 服务运行当前布局，返回每次运行的预填充统计"""
+    graph = _build_graph(args.ollama)
+    runs = []
+    for index in range(args.runs):
+        collector = PromptEvalCollector()
+        wall = _run(graph, REQUESTS[index % len(REQUESTS)], workdir, [collector])
+        runs.append({
+            "wall_s": round(wall, 4),
+            "calls": collector.calls,
+            "prefill_s": round(collector.seconds, 4),
+            "prefill_tokens": collector.tokens,
+        })
+    return runs
+
+
+def _summary(runs):
+    """首次运行（冷缓存）与之后各次运行的预填充耗时中位数"""
+    warm = [run["prefill_s"] for run in runs[1:]]
+    return {
+        "cold_prefill_s": runs[0]["prefill_s"] if runs else 0.0,
+        "warm_prefill_s": round(statistics.median(warm), 4) if warm else None,
+    }
+
+
+def format_results(results):
+    lines = []
+    for layout, item in results["layouts"].items():
+        summary = item["summary"]
+        warm = f"{summary['warm_prefill_s']:.3f}s" if summary["warm_prefill_s"] is not None else "-"
+        lines.append(f"== {layout}: 首次运行预填充 {summary['cold_prefill_s']:.3f}s，之后各次中位数 {warm}")
+        for index, run in enumerate(item["runs"], start=1):
+            cached = f"，命中缓存 {run['cached_tokens']} tokens（{run['cached_ratio']:.0%}）" if "cached_tokens" in run else ""
+            lines.append(f"   第 {index} 次 {run['calls']:>3} 次调用 预填充 {run['prefill_tokens']:>6} tokens {run['prefill_s']:>7.3f}s"
+                         f"{cached}，总耗时 {run['wall_s']:.3f}s")
+    layouts = results["layouts"]
+    if all(layout in layouts for layout in LAYOUTS):
+        before = layouts["legacy"]["summary"]["warm_prefill_s"]
+        after = layouts["system_prefix"]["summary"]["warm_prefill_s"]
+        if before and after is not None:
+            lines.append(f"重复运行的预填充耗时: {before:.3f}s -> {after:.3f}s（{(after - before) / before:+.1%}）")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="提示词布局的预填充基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="依次运行的需求条数（第一条为冷缓存）")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=500.0, help="假模型的预填充速度")
+    parser.add_argument("--slots", type=int, default=4, help="假模型服务的 KV 缓存槽数（对应 OLLAMA_NUM_PARALLEL）")
+    parser.add_argument("--tool-rounds", type=int, default=0, help="每段探测内容返回工具调用的次数")
+    parser.add_argument("--doc-scale", type=int, default=8, help="假模型文档中每节的条目数（文档越长，共享前缀节省的预填充越多）")
+    parser.add_argument("--ollama", metavar="MODEL", help="对真实的 Ollama 服务测量当前布局")
+    parser.add_argument("--save", metavar="PATH", help="把结果保存为 JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="autospec-prefill-")
+    set_search_backend(StaticSearchBackend())
+    results = {"config": vars(args), "layouts": {}}
+    if args.ollama:
+        # 关闭响应缓存，保证每次都真正调用模型
+        set_llm_cache(None)
+        runs = run_ollama(args, workdir)
+        results["layouts"]["system_prefix"] = {"runs": runs, "summary": _summary(runs)}
+    else:
+        for layout in LAYOUTS:
+            runs = run_fake(layout, args, workdir)
+            results["layouts"][layout] = {"runs": runs, "summary": _summary(runs)}
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.save}")
+
+
+if __name__ == "__main__":
+    main()
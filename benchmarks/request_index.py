@@ -0,0 +1,91 @@
+"""
+近似请求索引的查找延迟与召回率
+
+用关键词表组合出大量不同的需求写入临时索引，然后报告：
+写入与重新载入耗时、查找延迟（p50 / p99），以及对已写入需求的改写（增删语气词、换说法）能否被找回。
+
+    python -m benchmarks.request_index
+    python -m benchmarks.request_index --entries 50000 --queries 2000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from utils.project_naming import KEYWORDS
+from utils.request_index import RequestIndex
+
+
+OPENERS = ("开发一个", "帮我做一个", "创建一个简单的", "实现一个", "我想要一个", "设计一个", "写一个")
+CLOSERS = ("", "，支持多用户", "，需要登录注册", "，带后台管理", "，数据存在 SQLite", "，用 Python 实现", "，界面简洁")
+# 对已有需求的改写：换开头、加语气词
+REWRITES = (
+    lambda body, closer: f"请帮我开发{body}{closer}吧",
+    lambda body, closer: f"做一个{body}{closer}",
+    lambda body, closer: f"我需要一个{body}{closer}。",
+)
+
+
+def make_requests(count, seed=7):
+    """组合出 count 条互不相同的需求，返回 [(需求, 主体, 结尾)]"""
+    rng = random.Random(seed)
+    words = sorted(set(KEYWORDS))
+    seen = set()
+    requests = []
+    while len(requests) < count:
+        body = "".join(rng.sample(words, rng.randint(2, 4)))
+        closer = rng.choice(CLOSERS)
+        if (body, closer) in seen:
+            continue
+        seen.add((body, closer))
+        requests.append((f"{rng.choice(OPENERS)}{body}{closer}", body, closer))
+    return requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="近似请求索引的查找延迟与召回率")
+    parser.add_argument("--entries", type=int, default=20000, help="索引中的需求条数")
+    parser.add_argument("--queries", type=int, default=1000, help="查找次数")
+    args = parser.parse_args(argv)
+
+    requests = make_requests(args.entries)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "request_index.sqlite")
+        index = RequestIndex(path)
+        started = time.perf_counter()
+        for text, _, _ in requests:
+            index.add(text, workdir)
+        add_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = RequestIndex(path)
+        size = len(index)
+        load_s = time.perf_counter() - started
+
+        rng = random.Random(11)
+        samples = rng.sample(requests, min(args.queries, len(requests)))
+        timings = []
+        found = 0
+        for text, body, closer in samples:
+            query = rng.choice(REWRITES)(body, closer)
+            started = time.perf_counter()
+            matches = index.search(query)
+            timings.append((time.perf_counter() - started) * 1e6)
+            found += bool(matches) and matches[0].text == text
+
+        # 不在索引中的需求：应当找不到
+        misses = make_requests(args.queries, seed=99)
+        false_hits = sum(bool(index.search(text)) for text, _, _ in misses if text not in {r[0] for r in requests})
+
+    timings.sort()
+    print(f"索引 {size} 条，写入 {add_s:.2f}s（每条 {add_s / len(requests) * 1e6:.0f}µs），重新载入 {load_s:.2f}s")
+    print(f"查找延迟: p50 {statistics.median(timings):.0f}µs，p99 {timings[int(len(timings) * 0.99) - 1]:.0f}µs，"
+          f"平均 {statistics.fmean(timings):.0f}µs")
+    print(f"改写后找回 {found}/{len(samples)}（{found / len(samples):.1%}），未写入需求的误命中 {false_hits}/{len(misses)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""
+流水线离线基准测试
+
+用确定性的假模型（benchmarks/fake_llm.py）替换 Ollama，驱动 graph.py 与 demo.py 的 build_graph，
+测量流水线自身的开销：各节点耗时、LLM 调用次数、提示词 / 输出大小、文件读写耗时与峰值内存。
+
+    python -m benchmarks.run_pipeline --repeat 3 --save benchmarks/baseline.json
+    python -m benchmarks.run_pipeline --compare benchmarks/baseline.json --tolerance 0.2
+    python -m benchmarks.run_pipeline --tool-mode speculative --latency 0.2 --tool-rounds 0
+
+场景：
+    graph        graph.py 的图，graph.invoke
+    graph_async  graph.py 的图，graph.ainvoke
+    demo         demo.py 的图
+"""
+
+import argparse
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.globals import set_llm_cache
+
+from benchmarks.fake_llm import FakeLLMStats, fake_llm_factory
+from nodes.work_report_node import wait_for_work_reports
+from tools.search_backend import SearchBackend, set_search_backend
+from tools.search_cache import SearchCache, set_search_cache
+from utils.budget import run_budget
+from utils.registry import get_llm, get_llm_with_tools, set_llm_factory
+from utils.request_index import RequestIndex, set_request_index
+from utils.streaming import reset_token_sink, set_token_sink
+from utils.tool_decision import CALL_MODES, reset_speculation_stats, speculation_stats
+
+
+SCENARIOS = ("graph", "graph_async", "demo")
+MODEL_NAME = "llama3.1:8b"
+QUESTION = "创建一个简单的待办事项应用，支持添加、完成和删除任务"
+
+
+class StaticSearchBackend(SearchBackend):
+    """返回固定结果的搜索后端"""
+
+    name = "static"
+
+    def search(self, query):
+        return f"{query} 的参考资料：\n" + "\n".join(f"- 结果 {i}：相关框架的用法与最佳实践。" for i in range(1, 6))
+
+
+class NodeTimer(BaseCallbackHandler):
+    """通过回调记录每个图节点的执行耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._starts = {}
+        self.durations = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if not node or node.startswith("__"):
+            return
+        with self._lock:
+            self._runs[run_id] = node
+            # 只记录节点最外层的运行，节点内部的子运行不重复计时
+            if self._runs.get(parent_run_id) != node:
+                self._starts[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            self._runs.pop(run_id, None)
+            started = self._starts.pop(run_id, None)
+            if started:
+                node, at = started
+                self.durations.setdefault(node, []).append(time.perf_counter() - at)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+class _TimedFile:
+    """记录读写耗时的文件对象代理"""
+
+    def __init__(self, file, meter):
+        self._file = file
+        self._meter = meter
+
+    def write(self, data):
+        started = time.perf_counter()
+        result = self._file.write(data)
+        self._meter.add(time.perf_counter() - started, written=len(data))
+        return result
+
+    def read(self, *args):
+        started = time.perf_counter()
+        data = self._file.read(*args)
+        self._meter.add(time.perf_counter() - started, read=len(data))
+        return data
+
+    def close(self):
+        started = time.perf_counter()
+        self._file.close()
+        self._meter.add(time.perf_counter() - started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class FileIOMeter:
+    """统计 root 目录下的文件打开、读写耗时"""
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self._lock = threading.Lock()
+        self.seconds = 0.0
+        self.opens = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self._original_open = None
+
+    def add(self, seconds, written=0, read=0):
+        with self._lock:
+            self.seconds += seconds
+            self.bytes_written += written
+            self.bytes_read += read
+
+    @contextlib.contextmanager
+    def install(self):
+        original = self._original_open = builtins.open
+
+        def timed_open(file, mode="r", *args, **kwargs):
+            if not isinstance(file, (str, bytes, os.PathLike)) or not os.path.realpath(file).startswith(self.root):
+                return original(file, mode, *args, **kwargs)
+            started = time.perf_counter()
+            handle = original(file, mode, *args, **kwargs)
+            with self._lock:
+                self.opens += 1
+            self.add(time.perf_counter() - started)
+            return _TimedFile(handle, self)
+
+        builtins.open = timed_open
+        try:
+            yield self
+        finally:
+            builtins.open = original
+
+    def summary(self):
+        return {
+            "opens": self.opens,
+            "seconds": round(self.seconds, 4),
+            "bytes_written": self.bytes_written,
+            "bytes_read": self.bytes_read,
+        }
+
+
+def _quiet_sink(node, event, data):
+    pass
+
+
+def _main_state():
+    return {
+        "messages": [{"role": "user", "content": QUESTION}],
+        "next": "",
+        "base_dir": ".",
+        "new_dir": ".",
+        "requirements_content": "",
+        "design_content": "",
+        "tasks_content": "",
+        "code_content": "",
+        "source_node": "",
+    }
+
+
+def _build(scenario):
+    """构建场景对应的图与初始状态"""
+    if scenario == "demo":
+        import demo
+
+        graph = demo.build_graph(MODEL_NAME)
+        # demo.build_graph 会启用持久化缓存，基准测试中关闭，保证每次都真正调用模型
+        set_llm_cache(None)
+        return graph, {"messages": [{"role": "user", "content": QUESTION}], "source_node": "intent_recognition"}
+
+    from graph import build_graph
+    from tools.tools import search_tool
+
+    llm = get_llm(MODEL_NAME)
+    llm_with_tool = get_llm_with_tools(MODEL_NAME, [search_tool])
+    return build_graph(llm_with_tool, llm), _main_state()
+
+
+def run_once(scenario, stats, workdir, trace_memory=False, verbose=False):
+    """在临时目录中运行一次场景，返回测量结果"""
+    stats.reset()
+    run_dir = tempfile.mkdtemp(prefix=f"{scenario}-", dir=workdir)
+    previous_dir = os.getcwd()
+    os.chdir(run_dir)
+    set_search_cache(SearchCache(os.path.join(run_dir, "search_cache.sqlite"), ttl=0))
+    set_request_index(RequestIndex(os.path.join(run_dir, "request_index.sqlite")))
+    timer = NodeTimer()
+    meter = FileIOMeter(run_dir)
+    sink_token = set_token_sink(_quiet_sink)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        graph, state = _build(scenario)
+        config = {"callbacks": [timer], "recursion_limit": 100}
+        if trace_memory:
+            tracemalloc.start()
+        with output, meter.install(), run_budget():
+            started = time.perf_counter()
+            if scenario == "graph_async":
+                asyncio.run(graph.ainvoke(state, config=config))
+            else:
+                graph.invoke(state, config=config)
+            wait_for_work_reports()
+            wall = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        reset_token_sink(sink_token)
+        os.chdir(previous_dir)
+
+    files = sum(len(names) for _, _, names in os.walk(run_dir))
+    return {
+        "wall_s": wall,
+        "nodes": {node: sum(values) for node, values in timer.durations.items()},
+        "node_calls": {node: len(values) for node, values in timer.durations.items()},
+        "llm": stats.summary(),
+        "file_io": meter.summary(),
+        "files": files,
+        "peak_memory_kb": round(peak / 1024, 1) if peak is not None else None,
+    }
+
+
+def run_scenario(scenario, args, workdir):
+    """重复运行场景，耗时取中位数；另外运行一次 tracemalloc 测量峰值内存"""
+    stats = FakeLLMStats()
+    set_llm_factory(fake_llm_factory(
+        stats,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        tool_rounds=args.tool_rounds,
+        doc_scale=args.doc_scale,
+        tasks=args.tasks,
+        code_lines=args.code_lines,
+    ))
+    reset_speculation_stats()
+    runs = [run_once(scenario, stats, workdir, verbose=args.verbose) for _ in range(args.repeat)]
+    speculation = speculation_stats()
+    memory = run_once(scenario, stats, workdir, trace_memory=True, verbose=args.verbose)
+
+    last = runs[-1]
+    nodes = sorted({node for run in runs for node in run["nodes"]})
+    return {
+        "wall_s": round(statistics.median(run["wall_s"] for run in runs), 4),
+        "nodes": {
+            node: {
+                "calls": last["node_calls"].get(node, 0),
+                "total_s": round(statistics.median(run["nodes"].get(node, 0.0) for run in runs), 4),
+            }
+            for node in nodes
+        },
+        "llm": last["llm"],
+        "file_io": dict(last["file_io"], seconds=round(statistics.median(run["file_io"]["seconds"] for run in runs), 4)),
+        "files": last["files"],
+        "peak_memory_kb": memory["peak_memory_kb"],
+        "speculation": speculation,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args):
+    workdir = tempfile.mkdtemp(prefix="autospec-bench-")
+    set_search_backend(StaticSearchBackend())
+    os.environ["AUTOSPEC_TOOL_MODE"] = args.tool_mode
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "repeat": args.repeat,
+                "latency": args.latency,
+                "tokens_per_second": args.tokens_per_second,
+                "tool_rounds": args.tool_rounds,
+                "doc_scale": args.doc_scale,
+                "tasks": args.tasks,
+                "code_lines": args.code_lines,
+                "tool_mode": args.tool_mode,
+            },
+        },
+        "scenarios": {},
+    }
+    for scenario in args.scenarios:
+        results["scenarios"][scenario] = run_scenario(scenario, args, workdir)
+    return results
+
+
+def _metrics(result):
+    """参与对比的指标：(名称, 数值, 是否为耗时类指标)"""
+    yield "wall_s", result["wall_s"], True
+    for node, item in result["nodes"].items():
+        yield f"node.{node}.total_s", item["total_s"], True
+    yield "file_io.seconds", result["file_io"]["seconds"], True
+    if result.get("peak_memory_kb") is not None:
+        yield "peak_memory_kb", result["peak_memory_kb"], True
+    yield "llm.calls", result["llm"]["calls"], False
+    yield "llm.prompt_chars", result["llm"]["prompt_chars"], False
+    yield "llm.completion_chars", result["llm"]["completion_chars"], False
+
+
+def compare(current, baseline, tolerance=0.2, min_delta=0.005):
+    """与基线对比，返回 (对比行, 退化的指标)
+
+    耗时类指标超过基线 (1 + tolerance) 倍且绝对差值大于 min_delta 视为退化；
+    调用次数与提示词大小是确定性的，任何增加都视为退化。
+    """
+    rows = []
+    regressions = []
+    for scenario, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        base_metrics = {name: value for name, value, _ in _metrics(base)}
+        for name, value, timing in _metrics(result):
+            before = base_metrics.get(name)
+            if before is None:
+                continue
+            change = (value - before) / before if before else 0.0
+            if timing:
+                regressed = change > tolerance and value - before > (min_delta if name != "peak_memory_kb" else 0)
+            else:
+                regressed = value > before
+            rows.append((scenario, name, before, value, change, regressed))
+            if regressed:
+                regressions.append(f"{scenario}.{name}")
+    return rows, regressions
+
+
+def format_results(results):
+    lines = []
+    for scenario, result in results["scenarios"].items():
+        llm = result["llm"]
+        lines.append(f"== {scenario}: {result['wall_s']:.3f}s，LLM 调用 {llm['calls']} 次（工具调用 {llm['tool_calls']} 次），"
+                     f"提示词 {llm['prompt_chars']} 字符，输出 {llm['completion_chars']} 字符，峰值内存 {result['peak_memory_kb']} KB")
+        for node, item in result["nodes"].items():
+            lines.append(f"   {node:<24} {item['calls']:>3} 次 {item['total_s']:>9.4f}s")
+        io_stats = result["file_io"]
+        lines.append(f"   文件读写: 打开 {io_stats['opens']} 次，{io_stats['seconds']:.4f}s，写入 {io_stats['bytes_written']} 字节，"
+                     f"读取 {io_stats['bytes_read']} 字节，生成文件 {result['files']} 个")
+        for kind, item in llm["by_kind"].items():
+            lines.append(f"   llm.{kind:<20} {item['calls']:>3} 次 提示词 {item['prompt_chars']:>7} 字符 输出 {item['completion_chars']:>7} 字符")
+        for node, item in (result.get("speculation") or {}).items():
+            lines.append(f"   推测 {node:<19} 命中 {item['hits']}/{item['hits'] + item['misses']}（{item['hit_rate']:.0%}），"
+                         f"节省 {item['saved_s']:.3f}s，浪费 {item['wasted_s']:.3f}s")
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    lines = [f"{'场景':<12} {'指标':<40} {'基线':>12} {'当前':>12} {'变化':>8}"]
+    for scenario, name, before, value, change, regressed in rows:
+        mark = "  <- 退化" if regressed else ""
+        lines.append(f"{scenario:<12} {name:<40} {before:>12} {value:>12} {change:>+8.1%}{mark}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoSpec 流水线离线基准测试")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔，可选 {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景的计时运行次数（取中位数）")
+    parser.add_argument("--latency", type=float, default=0.0, help="假模型首个 token 前的延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="假模型输出速度，0 表示立即输出")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="每段探测内容返回工具调用的次数")
+    parser.add_argument("--doc-scale", type=int, default=8, help="固定文档中每节的条目数")
+    parser.add_argument("--tasks", type=int, default=4, help="任务文档中的任务数")
+    parser.add_argument("--code-lines", type=int, default=40, help="每个代码块的行数")
+    parser.add_argument("--tool-mode", default="probe", choices=CALL_MODES, help="节点的工具判断模式（见 utils/tool_decision.py）")
+    parser.add_argument("--save", metavar="PATH", help="把结果保存为 JSON 基线")
+    parser.add_argument("--compare", metavar="PATH", help="与 JSON 基线对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="耗时类指标允许的相对增长")
+    parser.add_argument("--verbose", action="store_true", help="显示流水线自身的输出")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    results = run_benchmarks(args)
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print(f"\n与基线 {args.compare}（提交 {baseline.get('meta', {}).get('commit')}）对比：")
+        print(format_comparison(rows))
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项退化: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,23 +12,25 @@ def remove_think(text):
 实现Langgraph 链
 """
 
-from langchain_ollama import ChatOllama
-from langchain_core.messages import SystemMessage
-from langchain.globals import set_llm_cache
-from langchain_community.cache import InMemoryCache
-
-from langgraph.graph import StateGraph, END, START, MessagesState
+from langgraph.graph import StateGraph, END, START
 from langgraph.graph import END, add_messages
-from langgraph.prebuilt import ToolNode
 from typing import Annotated, Sequence
-from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.messages import BaseMessage
 from typing_extensions import TypedDict
 
 # 导入工具装饰器
 from langchain_core.tools import tool
 
-# 导入百度搜索模块
-from baidu_api import ai_search
+from utils.llm_cache import init_llm_cache
+from utils.registry import get_llm, get_llm_with_tools, get_graph
+from utils.context_budget import fit_prompt
+from utils.memory import history_messages
+from utils.budget import merge_tool_iterations, tool_iteration_update, tools_allowed, run_budget
+from utils.model_routing import routed_llm
+from nodes.work_report_node import report_work, wait_for_work_reports
+
+# 搜索工具（后端可插拔，见 tools/search_backend.py）与并发工具调用
+from tools.tools import search_tool, run_tool_calls
 
 class CustomState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
@@ -37,6 +39,7 @@ class CustomState(TypedDict):
     design_content: str
     tasks_content: str
     source_node: str
+    tool_iterations: Annotated[dict, merge_tool_iterations]
 
 def read_file(file_path):
     """读取文件内容"""
@@ -62,19 +65,6 @@ def write_file(file_path, content):
     except Exception as e:
         return f"写入文件时出错: {str(e)}"
 
-# 定义工具函数的描述
-
-@tool
-def search_tool(query: str) -> str:
-    """使用百度搜索获取信息"""
-    # 添加监控逻辑，记录输入
-    print(f"[SEARCH_TOOL] 输入: {query}")
-    result = ai_search(query)
-    # 添加监控逻辑，记录输出
-    # print(f"[SEARCH_TOOL] 输出: {result}")
-    return result
-
-
 
 def generate_work_report(state: CustomState, document_content: str, document_type: str, llm):
     """生成工作汇报形式的摘要"""
@@ -87,25 +77,33 @@ def generate_work_report(state: CustomState, document_content: str, document_typ
     
     return response_content
 
+# 模型采样参数
+DEMO_LLM_PARAMS = dict(
+    temperature=0.2,
+    verbose=True,
+    cache=True,  # 启用缓存机制
+    streaming=True,  # 启用流式输出
+    top_k=50,  # 限制模型只考虑概率最高的50个token
+    top_p=0.9,  # 限制模型只考虑累积概率达到0.9的token
+)
+
+# 代码生成模型及参数
+CODE_LLM_MODEL = "qwen3-coder:30b"
+CODE_LLM_PARAMS = dict(DEMO_LLM_PARAMS, keep_alive=15)  # 设置keep_alive为15秒
+
 def build_graph(llm_model_name):
     """构建 langgraph 链"""
     
-    # 设置缓存
-    set_llm_cache(InMemoryCache())
+    # 设置持久化缓存
+    init_llm_cache()
     
-    llm = ChatOllama(
-        model=llm_model_name, 
-        temperature=0.2, 
-        verbose=True,
-        cache=True,  # 启用缓存机制
-        streaming=True,  # 启用流式输出
-        top_k=50,  # 限制模型只考虑概率最高的50个token
-        top_p=0.9  # 限制模型只考虑累积概率达到0.9的token
-    )
+    # 模型客户端从进程级注册表获取，相同配置只创建一次
+    llm = get_llm(llm_model_name, **DEMO_LLM_PARAMS)
     
     # 绑定工具到LLM
     tools = [search_tool]
-    llm_with_tool = llm.bind_tools(tools)
+    tools_by_name = {tool.name: tool for tool in tools}
+    llm_with_tool = get_llm_with_tools(llm_model_name, tools, **DEMO_LLM_PARAMS)
 
     # 意图识别节点：判断用户是否需要开发
     def intent_recognition(state: CustomState):
@@ -115,7 +113,7 @@ def build_graph(llm_model_name):
         user_message = state["messages"][-1].content if state["messages"] else ""
         
         # 1. 先检查是否需要工具调用
-        tool_response = llm_with_tool.invoke([{"role": "user", "content": user_message}])
+        tool_response = llm_with_tool.invoke([{"role": "user", "content": user_message}]) if tools_allowed("intent_recognition", state) else None
         if hasattr(tool_response, 'tool_calls') and tool_response.tool_calls:
             # 需要工具调用，返回工具调用请求
             return {"messages": [tool_response], "next": "tools", "source_node": "intent_recognition"}
@@ -187,7 +185,7 @@ def build_graph(llm_model_name):
         user_message = state["messages"][-1].content if state["messages"] else ""
         
         # 1. 先检查是否需要工具调用
-        tool_response = llm_with_tool.invoke([{"role": "user", "content": user_message}])
+        tool_response = llm_with_tool.invoke([{"role": "user", "content": user_message}]) if tools_allowed("generate_requirements", state) else None
         if hasattr(tool_response, 'tool_calls') and tool_response.tool_calls:
             # 需要工具调用，返回工具调用请求
             return {"messages": [tool_response], "next": "tools", "source_node": "generate_requirements"}
@@ -249,8 +247,8 @@ def build_graph(llm_model_name):
         requirements_path = os.path.join(kiro_dir, "requirements.md")
         write_file(requirements_path, requirements_content)
         
-        # 使用LLM生成工作汇报形式的摘要
-        response_content = generate_work_report(state, requirements_content, "需求文档", llm)
+        # 工作汇报在后台生成，不阻塞下一阶段
+        response_content = report_work(state, requirements_content, "需求文档", llm, report_fn=generate_work_report)
         
         from langchain_core.messages import AIMessage
         response = AIMessage(content=response_content)
@@ -262,15 +260,16 @@ def build_graph(llm_model_name):
     def generate_design(state: CustomState):
         """生成设计文档"""
         
+        # 获取需求文档内容
+        requirements_content = state.get("requirements_content", "")
+        
         # 生成工具调用
-        tool_calls = llm_with_tool.invoke([{"role": "user", "content": requirements_content}])
+        tool_calls = llm_with_tool.invoke([{"role": "user", "content": requirements_content}]) if tools_allowed("generate_design", state) else None
         
-        # 输出工具调用结果
+        # 需要工具调用时返回工具调用请求
         if hasattr(tool_calls, 'tool_calls') and tool_calls.tool_calls:
-            return {"next": "tools", "messages": [ToolMessage(content=tool_calls.tool_calls[0].content)], "source_node": "generate_design"}
+            return {"next": "tools", "messages": [tool_calls], "source_node": "generate_design"}
         
-        # 获取需求文档内容
-        requirements_content = state.get("requirements_content", "")
         # 获取新目录路径
         new_dir = state.get("new_dir", ".")
         
@@ -325,8 +324,8 @@ def build_graph(llm_model_name):
         design_path = os.path.join(kiro_dir, "design.md")
         write_file(design_path, design_content)
         
-        # 使用LLM生成工作汇报形式的摘要
-        response_content = generate_work_report(state, design_content, "设计文档", llm)
+        # 工作汇报在后台生成，不阻塞下一阶段
+        response_content = report_work(state, design_content, "设计文档", llm, report_fn=generate_work_report)
         
         from langchain_core.messages import AIMessage
         response = AIMessage(content=response_content)
@@ -338,15 +337,15 @@ def build_graph(llm_model_name):
     def generate_tasks(state: CustomState):
         """生成任务文档"""
         
+        # 获取设计文档内容
+        design_content = state.get("design_content", "")
+        
         # 生成工具调用
-        tool_calls = llm_with_tool.invoke([{"role": "user", "content": design_content}])
+        tool_calls = llm_with_tool.invoke([{"role": "user", "content": design_content}]) if tools_allowed("generate_tasks", state) else None
         
-        # 输出工具调用结果
+        # 需要工具调用时返回工具调用请求
         if hasattr(tool_calls, 'tool_calls') and tool_calls.tool_calls:
-            return {"next": "tools", "messages": [ToolMessage(content=tool_calls.tool_calls[0].content)], "source_node": "generate_tasks"}
-        
-        # 获取设计文档内容
-        design_content = state.get("design_content", "")
+            return {"next": "tools", "messages": [tool_calls], "source_node": "generate_tasks"}
         
         # 获取需求文档内容
         requirements_content = state.get("requirements_content", "")
@@ -410,8 +409,8 @@ def build_graph(llm_model_name):
         tasks_path = os.path.join(kiro_dir, "tasks.md")
         write_file(tasks_path, tasks_content)
         
-        # 使用LLM生成工作汇报形式的摘要
-        response_content = generate_work_report(state, tasks_content, "任务文档", llm)
+        # 工作汇报在后台生成，不阻塞下一阶段
+        response_content = report_work(state, tasks_content, "任务文档", llm, report_fn=generate_work_report)
         
         from langchain_core.messages import AIMessage
         response = AIMessage(content=response_content)
@@ -423,14 +422,17 @@ def build_graph(llm_model_name):
     def generate_response(state: CustomState):
         """生成普通响应"""
         
+        # 只发送有界的对话历史：摘要加最近的消息，避免提示词随会话增长
+        history = history_messages(state)
+        
         # 生成工具调用
-        tool_calls = llm_with_tool.invoke(state["messages"])
+        tool_calls = llm_with_tool.invoke(history) if tools_allowed("generate_response", state) else None
         
-        # 输出工具调用结果
+        # 需要工具调用时返回工具调用请求
         if hasattr(tool_calls, 'tool_calls') and tool_calls.tool_calls:
-            return {"next": "tools", "messages": [ToolMessage(content=remove_think(tool_calls.tool_calls[0].content))], "source_node": "generate_response"}
+            return {"next": "tools", "messages": [tool_calls], "source_node": "generate_response"}
         
-        response = llm.invoke(state["messages"])
+        response = llm.invoke(history)
         return {"next": "end", "messages": [response]}
 
     # 生成可执行代码节点
@@ -445,20 +447,12 @@ def build_graph(llm_model_name):
         # 获取新目录路径
         new_dir = state.get("new_dir", ".")
         
-        # 为代码生成创建专门的LLM实例
-        code_llm = ChatOllama(
-            model="qwen3-coder:30b", 
-            temperature=0.2, 
-            verbose=True,
-            cache=True,  # 启用缓存机制
-            streaming=True,  # 启用流式输出
-            top_k=50,  # 限制模型只考虑概率最高的50个token
-            top_p=0.9,  # 限制模型只考虑累积概率达到0.9的token
-            keep_alive=15  # 设置keep_alive为15秒
-        )
+        # 代码生成专用的LLM实例（进程内复用）
+        code_llm = routed_llm("generate_code", get_llm(CODE_LLM_MODEL, **CODE_LLM_PARAMS))
         
-        # 生成可执行代码
-        code_prompt = f"""基于以下需求文档、设计文档和任务文档，生成一份可执行的Python代码：
+        # 生成可执行代码（三个文档按上下文预算压缩后再嵌入，任务文档优先）
+        def build_code_prompt(requirements_content, design_content, tasks_content):
+            return f"""基于以下需求文档、设计文档和任务文档，生成一份可执行的Python代码：
 
 需求文档：{requirements_content}
 设计文档：{design_content}
@@ -467,6 +461,11 @@ def build_graph(llm_model_name):
 请生成一个完整的、可运行的Python程序，确保覆盖需求文档中的具体需求点，严格按照设计文档的标准，确保完成任务文档中的每一项任务。
 """
         
+        code_prompt, _ = fit_prompt(
+            "generate_code", code_llm, build_code_prompt, weights={"tasks_content": 2},
+            requirements_content=requirements_content, design_content=design_content, tasks_content=tasks_content,
+        )
+        
         code_response = code_llm.invoke([{"role": "user", "content": code_prompt}])
         code_content = remove_think(code_response.content)
         
@@ -474,8 +473,8 @@ def build_graph(llm_model_name):
         code_path = os.path.join(new_dir, "main.py")
         write_file(code_path, code_content)
         
-        # 使用LLM生成工作汇报形式的摘要
-        response_content = generate_work_report(state, code_content, "可执行代码", llm)
+        # 工作汇报在后台生成，不阻塞下一阶段
+        response_content = report_work(state, code_content, "可执行代码", llm, report_fn=generate_work_report)
         
         from langchain_core.messages import AIMessage
         response = AIMessage(content=response_content)
@@ -488,29 +487,11 @@ def build_graph(llm_model_name):
     
     # 创建工具节点
     def tool_node(state: CustomState):
-        """处理 llm_with_tools 返回的 ToolMessage"""
+        """处理 llm_with_tools 返回的工具调用"""
         tool_calls = state["messages"][-1].tool_calls
-        results = []
         print(f"take_action called with tool_calls: {tool_calls}")
-        for t in tool_calls:
-            print(f"Calling: {t}")
-            tool_found = False
-            for tool in tools:
-                if tool.name == t["name"]:
-                    tool_found = True
-                    break
-            if not tool_found:  # check for bad tool name from LLM
-                print("\n ....bad tool name....")
-                result = "bad tool name, retry"  # instruct LLM to retry if bad
-            else:
-                # 找到对应的工具并调用
-                for tool in tools:
-                    if tool.name == t["name"]:
-                        result = tool.invoke(t["args"])
-                        break
-            results.append(
-                ToolMessage(tool_call_id=t["id"], content=str(result))
-            )
+        # 多个工具调用在线程池中并发执行，结果按原顺序返回
+        results = run_tool_calls(tool_calls, tools_by_name)
         print("Back to the model!")
         # 获取调用源节点，如果存在的话
         source_node = state.get("source_node")  # 不设置默认值，直接获取state中的source_node
@@ -520,7 +501,8 @@ def build_graph(llm_model_name):
         next_node = source_node if source_node else "intent_recognition"
         
         # 保持当前状态的其他键值，并添加工具调用结果、源节点信息和下一步节点
-        return {**state, "messages": results, "source_node": source_node, "next": next_node}
+        # 记录源节点的工具调用轮数，达到上限后该节点不再调用工具
+        return {**state, "messages": results, "source_node": source_node, "next": next_node, **tool_iteration_update(state, source_node)}
     
     # 添加所有节点（确保每个节点只添加一次）
     workflow.add_node("intent_recognition", intent_recognition)
@@ -547,6 +529,7 @@ def build_graph(llm_model_name):
         "generate_requirements",
         lambda result: result["next"],
         {
+            "generate_design": "generate_design",
             "tools": "tools"
         }
     )
@@ -554,6 +537,7 @@ def build_graph(llm_model_name):
         "generate_design",
         lambda result: result["next"],
         {
+            "generate_tasks": "generate_tasks",
             "tools": "tools"
         }
     )
@@ -561,6 +545,7 @@ def build_graph(llm_model_name):
         "generate_tasks",
         lambda result: result["next"],
         {
+            "generate_code": "generate_code",
             "tools": "tools"
         }
     )
@@ -580,10 +565,6 @@ def build_graph(llm_model_name):
             "end": END
         }
     )
-    workflow.add_edge("generate_requirements", "generate_design")
-    workflow.add_edge("generate_design", "generate_tasks")
-    workflow.add_edge("generate_tasks", "generate_code")
-    
     # 工具节点由各生成节点在需要工具调用时触发
     
     # 添加从tools节点返回的条件边，根据next返回到对应的节点
@@ -608,34 +589,40 @@ def build_graph(llm_model_name):
 def ask(llm_model_name,question):
     """提问"""
 
-    graph = build_graph(llm_model_name)
-    for step in graph.stream(
-        {"messages": [{"role": "user", "content": question}], "source_node": "intent_recognition"},
-            stream_mode="updates",
-        ):
-            # 首先尝试直接访问 'messages' 键
-            if "messages" in step:
-                step["messages"][-1].pretty_print()
-            else:
-                # 如果没有直接找到 'messages' 键，尝试从嵌套字典中提取
-                messages_found = False
-                for key, value in step.items():
-                    if isinstance(value, dict) and "messages" in value:
-                        value["messages"][-1].pretty_print()
-                        messages_found = True
-                        break
-                    # 检查更深层次的嵌套
-                    elif isinstance(value, dict):
-                        for sub_key, sub_value in value.items():
-                            if isinstance(sub_value, dict) and "messages" in sub_value:
-                                sub_value["messages"][-1].pretty_print()
-                                messages_found = True
-                                break
-                        if messages_found:
+    # 已编译的图按模型名复用，不再每次提问都重新构建
+    graph = get_graph(("demo", llm_model_name), lambda: build_graph(llm_model_name))
+    # 工具调用轮数与时间 / token 预算按本次提问计算
+    with run_budget():
+        for step in graph.stream(
+            {"messages": [{"role": "user", "content": question}], "source_node": "intent_recognition"},
+                stream_mode="updates",
+            ):
+                # 首先尝试直接访问 'messages' 键
+                if "messages" in step:
+                    step["messages"][-1].pretty_print()
+                else:
+                    # 如果没有直接找到 'messages' 键，尝试从嵌套字典中提取
+                    messages_found = False
+                    for key, value in step.items():
+                        if isinstance(value, dict) and "messages" in value:
+                            value["messages"][-1].pretty_print()
+                            messages_found = True
                             break
-                # 如果仍未找到 'messages' 键，则打印错误信息
-                if not messages_found:
-                    print(f"Missing 'messages' key in step: {step}")
+                        # 检查更深层次的嵌套
+                        elif isinstance(value, dict):
+                            for sub_key, sub_value in value.items():
+                                if isinstance(sub_value, dict) and "messages" in sub_value:
+                                    sub_value["messages"][-1].pretty_print()
+                                    messages_found = True
+                                    break
+                            if messages_found:
+                                break
+                    # 如果仍未找到 'messages' 键，则打印错误信息
+                    if not messages_found:
+                        print(f"Missing 'messages' key in step: {step}")
+
+    # 等待后台工作汇报输出完毕
+    wait_for_work_reports()
 
 def show_graph(graph):
     from PIL import Image as PILImage
@@ -647,7 +634,7 @@ def show_graph(graph):
 
 if __name__ == '__main__':
     # 构建图
-    graph = build_graph("qwen3:32b")
+    graph = get_graph(("demo", "qwen3:32b"), lambda: build_graph("qwen3:32b"))
     show_graph(graph)
     
 
@@ -1,64 +1,159 @@
-from langgraph.graph import Graph
-from langgraph.state import MessagesState
-from typing import TypedDict, List, Optional
+import asyncio
+from langgraph.graph import StateGraph, START, END, add_messages
+from langchain_core.runnables import RunnableLambda
+from typing import Annotated, Sequence
+from typing_extensions import TypedDict
 from langchain_core.messages import BaseMessage
 
-from nodes.intent_recognition_node import intent_recognition
-from nodes.generate_requirements_node import generate_requirements
-from nodes.generate_design_node import generate_design
-from nodes.generate_tasks_node import generate_tasks
-from nodes.generate_code_node import generate_code
-from nodes.work_report_node import generate_work_report
-from tools.tools import tool_node
-from nodes.generate_response_node import generate_response
+from nodes.intent_recognition_node import intent_recognition, aintent_recognition
+from nodes.generate_requirements_node import generate_requirements, agenerate_requirements
+from nodes.generate_design_node import generate_design, agenerate_design
+from nodes.generate_tasks_node import generate_tasks, agenerate_tasks
+from nodes.generate_code_node import generate_code, agenerate_code
+from tools.tools import tool_node, atool_node, tools as search_tools
+from nodes.generate_response_node import generate_response, agenerate_response
+from utils.checkpoint import record_stage
+from utils.request_index import remember_request
+from utils.memory import compact_history
+from utils.budget import budget_report, merge_tool_iterations, tool_iteration_update
+from utils.metrics import record_tool_iteration
+from utils.model_routing import routed_llm
 
 
 class CustomState(TypedDict):
-    messages: List[BaseMessage]
+    messages: Annotated[Sequence[BaseMessage], add_messages]
     next: str
+    base_dir: str
     new_dir: str
     requirements_content: str
     design_content: str
     tasks_content: str
     code_content: str
     source_node: str
+    resume_from: str
+    reuse_policy: str
+    reused_from: str
+    history_summary: str
+    tool_iterations: Annotated[dict, merge_tool_iterations]
+    budget_report: dict
+
+
+def _with_compacted_history(name, state, update):
+    """在节点更新中加入消息历史的压缩：折叠窗口外的消息，非工具节点完成后替换已使用的工具结果"""
+    if not isinstance(update, dict):
+        return update
+    compaction = compact_history(state, consumed=name != "tools")
+    if not compaction:
+        return update
+    update = dict(update)
+    update["messages"] = compaction.get("messages", []) + list(update.get("messages") or [])
+    if "history_summary" in compaction:
+        update["history_summary"] = compaction["history_summary"]
+    return update
+
+
+def _with_budget(name, state, update):
+    """记录节点请求的工具调用轮数，并把当前的预算使用情况写入状态"""
+    if not isinstance(update, dict):
+        return update
+    update = dict(update)
+    iterations = dict(state.get("tool_iterations") or {})
+    if update.get("next") == "tools":
+        update.update(tool_iteration_update(state, name))
+        iterations.update(update["tool_iterations"])
+        record_tool_iteration(name)
+    update["budget_report"] = budget_report(iterations)
+    return update
+
+
+def _record(name, state, update):
+    """节点完成后记录检查点，需求文档生成后把需求记入近似请求索引"""
+    record_stage(name, state, update)
+    remember_request(name, state, update)
+
+
+def _node(name, func, afunc, *args):
+    """把同步与异步节点函数包装为同一个节点，图同时支持 invoke 与 ainvoke，节点完成后记录检查点、压缩消息历史并更新预算"""
+    def run(state):
+        update = func(state, *args)
+        _record(name, state, update)
+        return _with_budget(name, state, _with_compacted_history(name, state, update))
+
+    async def arun(state):
+        update = await afunc(state, *args)
+        await asyncio.to_thread(_record, name, state, update)
+        return _with_budget(name, state, _with_compacted_history(name, state, update))
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+def _models(name, llm_with_tool, llm):
+    """节点使用的 (带工具的模型, 模型)：启用模型路由时按节点名选择，否则使用传入的模型"""
+    return routed_llm(name, llm_with_tool, search_tools), routed_llm(name, llm)
 
 
 def build_graph(llm_with_tool, llm):
     """构建工作流图"""
-    
+
     # 创建状态图
-    graph = Graph(state_schema=CustomState)
-    
+    graph = StateGraph(CustomState)
+
     # 添加节点
-    graph.add_node("intent_recognition", lambda state: intent_recognition(state, llm_with_tool, llm))
-    graph.add_node("generate_requirements", lambda state: generate_requirements(state, llm_with_tool, llm))
-    graph.add_node("generate_design", lambda state: generate_design(state, llm_with_tool, llm))
-    graph.add_node("generate_tasks", lambda state: generate_tasks(state, llm_with_tool, llm))
-    graph.add_node("generate_code", lambda state: generate_code(state, llm_with_tool, llm))
-    graph.add_node("generate_response", lambda state: generate_response(state, llm))
-    graph.add_node("tools", lambda state: tool_node(state, llm))
-    
-    # 添加边
-    graph.add_edge("intent_recognition", "generate_requirements")
-    graph.add_edge("intent_recognition", "generate_response")
-    graph.add_edge("intent_recognition", "tools")
-    graph.add_edge("generate_requirements", "generate_design")
-    graph.add_edge("generate_requirements", "tools")
-    graph.add_edge("generate_design", "generate_tasks")
-    graph.add_edge("generate_design", "tools")
-    graph.add_edge("generate_tasks", "generate_code")
-    graph.add_edge("generate_tasks", "tools")
-    graph.add_edge("generate_code", "generate_response")
-    graph.add_edge("generate_code", "tools")
-    graph.add_edge("tools", "intent_recognition")
-    graph.add_edge("tools", "generate_requirements")
-    graph.add_edge("tools", "generate_design")
-    graph.add_edge("tools", "generate_tasks")
-    graph.add_edge("tools", "generate_code")
-    
-    # 设置入口点
-    graph.set_entry_point("intent_recognition")
-    
+    graph.add_node("intent_recognition", _node("intent_recognition", intent_recognition, aintent_recognition, *_models("intent_recognition", llm_with_tool, llm)))
+    graph.add_node("generate_requirements", _node("generate_requirements", generate_requirements, agenerate_requirements, *_models("generate_requirements", llm_with_tool, llm)))
+    graph.add_node("generate_design", _node("generate_design", generate_design, agenerate_design, *_models("generate_design", llm_with_tool, llm)))
+    graph.add_node("generate_tasks", _node("generate_tasks", generate_tasks, agenerate_tasks, *_models("generate_tasks", llm_with_tool, llm)))
+    graph.add_node("generate_code", _node("generate_code", generate_code, agenerate_code, *_models("generate_code", llm_with_tool, llm)))
+    graph.add_node("generate_response", _node("generate_response", generate_response, agenerate_response, routed_llm("generate_response", llm)))
+    graph.add_node("tools", _node("tools", tool_node, atool_node, llm))
+
+    # 添加边：各节点通过状态中的 next 决定下一步
+    route = lambda state: state["next"]
+    # 从检查点恢复时直接进入第一个未完成的节点
+    graph.add_conditional_edges(START, lambda state: state.get("resume_from") or "intent_recognition", {
+        "intent_recognition": "intent_recognition",
+        "generate_requirements": "generate_requirements",
+        "generate_design": "generate_design",
+        "generate_tasks": "generate_tasks",
+        "generate_code": "generate_code",
+    })
+    # 复用相似项目时从第一个未完成的阶段继续，全部完成时直接结束
+    graph.add_conditional_edges("intent_recognition", route, {
+        "generate_requirements": "generate_requirements",
+        "generate_design": "generate_design",
+        "generate_tasks": "generate_tasks",
+        "generate_code": "generate_code",
+        "generate_response": "generate_response",
+        "tools": "tools",
+        "end": END,
+    })
+    graph.add_conditional_edges("generate_requirements", route, {
+        "generate_design": "generate_design",
+        "tools": "tools",
+    })
+    graph.add_conditional_edges("generate_design", route, {
+        "generate_tasks": "generate_tasks",
+        "tools": "tools",
+    })
+    graph.add_conditional_edges("generate_tasks", route, {
+        "generate_code": "generate_code",
+        "tools": "tools",
+    })
+    graph.add_conditional_edges("generate_code", route, {
+        "generate_response": "generate_response",
+        "tools": "tools",
+    })
+    graph.add_conditional_edges("generate_response", route, {
+        "end": END,
+    })
+    # 工具节点返回调用它的节点
+    graph.add_conditional_edges("tools", route, {
+        "intent_recognition": "intent_recognition",
+        "generate_requirements": "generate_requirements",
+        "generate_design": "generate_design",
+        "generate_tasks": "generate_tasks",
+        "generate_code": "generate_code",
+    })
+
     # 编译图
-    return graph.compile()
\ No newline at end of file
+    return graph.compile()
@@ -1,53 +1,101 @@
-import os
-from langchain_ollama import ChatOllama
-from langchain_core.tools import tool
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from langgraph.globals import set_llm_cache
-from langchain_community.cache import InMemoryCache
+import argparse
 
 from graph import build_graph
 from tools.tools import search_tool
-from utils.utils import read_file
+from tools.search_cache import search_cache_report
+from utils.llm_cache import init_llm_cache
+from utils.checkpoint import plan_resume
+from utils.budget import run_budget, format_budget_report
+from utils.registry import get_llm, get_llm_with_tools, get_graph
+from utils.metrics import MetricsCallbackHandler, configure_logging, flush_metrics, format_metrics_summary
+from utils.model_routing import enable_model_routing
+from utils.request_index import SIMILAR_REQUESTS, find_similar_project
+from utils.run_state import initial_state, final_response
+from utils.tool_decision import speculation_report
+from nodes.work_report_node import wait_for_work_reports, work_reports
 
 
-# 初始化缓存
-set_llm_cache(InMemoryCache())
+# 配置日志与指标输出
+configure_logging()
 
-# 初始化LLM模型
-llm = ChatOllama(
-    model="llama3.1:8b",
-    temperature=0.7,
-    streaming=True,
-)
+# 初始化持久化缓存（跨进程重启保留已生成的结果）
+init_llm_cache()
+
+# 模型配置
+MODEL_NAME = "llama3.1:8b"
+LLM_PARAMS = dict(temperature=0.7, streaming=True)
+
+# 按节点选择模型（models.json），未找到配置文件时所有节点使用 MODEL_NAME
+enable_model_routing()
+
+# 初始化LLM模型（进程内复用）
+llm = get_llm(MODEL_NAME, **LLM_PARAMS)
 
 # 创建带有工具的LLM
-llm_with_tool = llm.bind_tools([search_tool])
+llm_with_tool = get_llm_with_tools(MODEL_NAME, [search_tool], **LLM_PARAMS)
+
+# 构建工作流图（进程内只编译一次）
+graph = get_graph(("main", MODEL_NAME), lambda: build_graph(llm_with_tool, llm))
+
 
-# 构建工作流图
-graph = build_graph(llm_with_tool, llm)
+def offer_reuse(user_input):
+    """交互模式下找到相似的历史项目时询问用户是复用、复制还是重新生成，返回对应的策略"""
+    found = find_similar_project(user_input)
+    if found is None:
+        return ""
+    match, _, resume_from = found
+    progress = f"从 {resume_from} 阶段继续" if resume_from else "所有阶段均已完成"
+    print(f"发现相似的历史需求（相似度 {match.score:.2f}）：{match.text}")
+    print(f"  项目目录: {match.project_dir}（{progress}）")
+    choice = input("复用该项目 (r)、复制为新项目 (f) 还是重新生成 (n)？[f] ").strip().lower()
+    return {"r": "reuse", "n": "off"}.get(choice, "fork")
 
 
-def ask(user_input):
+def ask(user_input, reuse_policy=""):
     """处理用户输入并返回响应"""
-    initial_state = {
-        "messages": [{"role": "user", "content": user_input}],
-        "next": "",
-        "new_dir": ".",
-        "requirements_content": "",
-        "design_content": "",
-        "tasks_content": "",
-        "code_content": "",
-        "source_node": ""
-    }
+    # 运行图（时间与 token 预算按本次运行计算）
+    metrics = MetricsCallbackHandler()
+    with run_budget(), work_reports():
+        result = graph.invoke(initial_state(user_input, reuse_policy), config={"callbacks": [metrics]})
+        # 等待本次运行的后台工作汇报输出完毕
+        wait_for_work_reports()
+    print(search_cache_report())
+    print(format_budget_report(result.get("budget_report")))
+    print(format_metrics_summary(metrics.summary()))
+    if speculation_report():
+        print(speculation_report())
+    flush_metrics()
     
-    # 运行图
-    result = graph.invoke(initial_state)
+    return final_response(result)
+
+
+async def aask(user_input):
+    """处理用户输入并返回响应（异步版本，可在同一进程中并发处理多个会话）"""
+    # 后台工作汇报完成后自行输出，这里不等待，避免会话之间互相阻塞
+    with run_budget(), work_reports():
+        result = await graph.ainvoke(initial_state(user_input), config={"callbacks": [MetricsCallbackHandler()]})
+    flush_metrics()
+    return final_response(result)
+
+
+def resume(project_dir):
+    """从项目目录的检查点恢复，跳过内容未变化的上游阶段"""
+    state, resume_from = plan_resume(project_dir)
+    if not state["messages"][0]["content"]:
+        return f"项目目录 {project_dir} 中没有可用的检查点。"
+    if resume_from is None:
+        return f"项目 {project_dir} 的所有阶段均已完成，且文档未发生变化。"
+    print(f"从 {resume_from} 阶段恢复项目 {project_dir}")
+    state["resume_from"] = resume_from
+    metrics = MetricsCallbackHandler()
+    with run_budget(), work_reports():
+        result = graph.invoke(state, config={"callbacks": [metrics]})
+        # 等待本次运行的后台工作汇报输出完毕
+        wait_for_work_reports()
+    print(format_metrics_summary(metrics.summary()))
+    flush_metrics()
     
-    # 获取最后一条消息作为响应
-    if result and "messages" in result and result["messages"]:
-        return result["messages"][-1].content
-    return "抱歉，无法生成响应。"
+    return final_response(result)
 
 
 def show_graph():
@@ -61,6 +109,13 @@ def show_graph():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AutoSpec Agent")
+    parser.add_argument("--resume", metavar="PROJECT_DIR", help="从项目目录的检查点恢复未完成的流水线")
+    args = parser.parse_args()
+    if args.resume:
+        print(f"Agent: {resume(args.resume)}")
+        raise SystemExit(0)
+    
     print("AutoSpec Agent 已启动！")
     print("输入 'exit' 退出程序，输入 'show graph' 查看工作流图。")
     
@@ -80,5 +135,7 @@ if __name__ == "__main__":
         elif user_input.lower() == 'show graph':
             show_graph()
         else:
-            response = ask(user_input)
+            # 相似的历史需求已有项目时询问是否复用
+            reuse_policy = offer_reuse(user_input) if SIMILAR_REQUESTS == "ask" else ""
+            response = ask(user_input, reuse_policy)
             print(f"Agent: {response}")
\ No newline at end of file
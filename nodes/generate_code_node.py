@@ -1,34 +1,34 @@
+import asyncio
 import os
-from langchain_core.messages import AIMessage, ToolMessage
-from utils.utils import remove_think, write_file
-from nodes.work_report_node import generate_work_report
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from langchain_core.messages import AIMessage
+from utils.utils import remove_think, write_file, awrite_file
+from utils.budget import tools_allowed
+from utils.code_blocks import CodeBlockExtractor, CodeFileWriter, extract_code_blocks
+from utils.streaming import generate, agenerate
+from utils.task_dag import parse_tasks, topological_order
+from utils.context_budget import fit_prompt
+from utils.prompt_layout import prompt_messages, tool_probe_messages
+from utils.tool_decision import (
+    FUSED, SPECULATIVE, get_call_mode, has_tool_calls, tool_round_messages,
+    invoke_with_tools, ainvoke_with_tools, probe_tools, aprobe_tools, speculate, aspeculate, tool_request_update,
+)
+from nodes.work_report_node import report_work, areport_work
 
 
-def generate_code(state, llm_with_tool, llm):
-    """生成代码"""
-    
-    # 获取任务文档内容
-    tasks_content = state.get("tasks_content", "")
-    # 获取新目录路径
-    new_dir = state.get("new_dir", ".")
-    
-    # 生成工具调用
-    tool_calls = llm_with_tool.invoke([{"role": "user", "content": tasks_content}])
-    
-    # 输出工具调用结果
-    if hasattr(tool_calls, 'tool_calls') and tool_calls.tool_calls:
-        return {"next": "tools", "messages": [ToolMessage(content=tool_calls.tool_calls[0].content)], "source_node": "generate_code"}
-    
-    # 创建 .kiro 目录
-    kiro_dir = os.path.join(new_dir, ".kiro")
-    if not os.path.exists(kiro_dir):
-        os.makedirs(kiro_dir)
-    
-    # 生成代码
-    code_prompt = f"""请基于以下任务文档，生成相应的代码实现：
+# 代码生成方式：auto（任务数不少于 2 时按任务依赖图并行生成）、dag、single（整份任务文档一次生成）
+CODEGEN_MODE = os.environ.get("AUTOSPEC_CODEGEN_MODE", "auto").strip().lower()
+# 按任务并行生成时的最大并发数
+CODEGEN_WORKERS = int(os.environ.get("AUTOSPEC_CODEGEN_WORKERS", "4"))
+
+# 代码摘要中保留的签名行（类、函数、接口定义）
+SIGNATURE = re.compile(r"^\s*(?:async\s+def|def|class|function|export|interface|type|public|func|fn|struct)\b")
 
-任务文档：
-{tasks_content}
+
+# 固定的指令与输出结构，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请基于用户消息中的任务文档，生成相应的代码实现。
 
 请按照任务文档中的要求，生成完整、可运行的代码。代码应包含：
 1. 必要的导入语句
@@ -44,61 +44,388 @@ def generate_code(state, llm_with_tool, llm):
 
 在生成代码时，可以使用`search_tool`来获取相关编程语言和框架的最新语法和最佳实践，以确保代码的准确性和先进性。不要仅凭已有知识生成内容，对于任何不确定的信息都应通过工具搜索确认。
 """
-    
-    code_response = llm.invoke([{"role": "user", "content": code_prompt}])
-    code_content = remove_think(code_response.content)
-    
-    # 提取代码块
-    code_blocks = []
-    in_code_block = False
-    current_code = ""
-    current_language = ""
-    current_filename = ""
-    
-    for line in code_content.split('\n'):
-        if line.startswith('```'):
-            if in_code_block:
-                # 结束代码块
-                in_code_block = False
-                if current_filename and current_code:
-                    code_blocks.append({"filename": current_filename, "code": current_code})
-                current_code = ""
-                current_language = ""
-                current_filename = ""
-            else:
-                # 开始代码块
-                in_code_block = True
-                parts = line[3:].strip().split()
-                if parts:
-                    current_language = parts[0]
-                    if len(parts) > 1 and parts[1].startswith('filename='):
-                        current_filename = parts[1][9:].strip('"\'')
-        elif in_code_block:
-            current_code += line + '\n'
-    
-    # 保存代码文件
+
+
+def build_code_prompt(tasks_content):
+    """构造代码生成提示词的可变部分"""
+    return f"任务文档：\n{tasks_content}"
+
+
+def save_code_blocks(new_dir, code_blocks, code_content, has_files=False):
+    """保存代码文件到 src 目录；has_files 表示生成过程中已经写入过代码文件"""
     code_dir = os.path.join(new_dir, "src")
     if not os.path.exists(code_dir):
         os.makedirs(code_dir)
     
+    writer = CodeFileWriter(new_dir)
     for block in code_blocks:
-        filename = block["filename"]
-        code = block["code"]
-        if filename:
-            code_path = os.path.join(code_dir, filename)
-            # 确保目录存在
-            os.makedirs(os.path.dirname(code_path), exist_ok=True)
-            write_file(code_path, code)
+        writer(block["filename"], block["code"])
     
     # 如果没有明确的文件名，保存为main.py
-    if not code_blocks and code_content:
+    if not code_blocks and not has_files and code_content:
         main_code_path = os.path.join(code_dir, "main.py")
         write_file(main_code_path, code_content)
+
+
+def use_task_dag(tasks):
+    """判断是否按任务依赖图生成代码"""
+    if CODEGEN_MODE == "single":
+        return False
+    if CODEGEN_MODE == "dag":
+        return bool(tasks)
+    return len(tasks) >= 2
+
+
+def summarize_code_files(files):
+    """提取代码文件的签名行，作为依赖任务的上下文"""
+    summaries = []
+    for filename, code in files.items():
+        signatures = [line.rstrip() for line in code.splitlines() if SIGNATURE.match(line)]
+        summaries.append(f"# {filename}\n" + ("\n".join(signatures) if signatures else "（无公开定义）"))
+    return "\n\n".join(summaries)
+
+
+# 按任务生成代码时的固定指令
+TASK_CODE_SYSTEM_PROMPT = """你正在按任务逐个实现一个项目，当前只需要实现用户消息中给出的那一个任务。
+用户消息依次包含项目任务大纲、依赖任务已生成的代码（只列出签名，可以直接导入使用）和需要实现的任务。
+
+请只生成实现该任务所需的代码文件，代码应包含必要的导入语句、清晰的注释和必要的错误处理。
+每个代码块必须以 ```语言 filename=相对路径 开头，例如 ```python filename=app/models.py ，
+不要重复生成依赖任务中已有的文件。
+"""
+
+
+def build_task_code_prompt(outline, task_text, dependencies):
+    """构造单个任务代码生成提示词的可变部分：任务大纲（同一项目内不变）在前，当前任务在最后"""
+    return f"""项目任务大纲：
+{outline}
+
+依赖任务已生成的代码：
+{dependencies}
+
+当前任务：
+{task_text}
+"""
+
+
+def _task_code_prompt(task, tasks, dep_files, llm):
+    """按上下文预算构造单个任务的提示词，当前任务与依赖签名优先分配预算"""
+    prompt, _ = fit_prompt(
+        f"generate_code[{task.id}]", llm, build_task_code_prompt, system=TASK_CODE_SYSTEM_PROMPT,
+        weights={"task_text": 2, "dependencies": 2},
+        outline="\n".join(f"- {t.id} {t.title}" for t in tasks),
+        task_text=task.text,
+        dependencies=summarize_code_files(dep_files) if dep_files else "无",
+    )
+    return prompt
+
+
+def _dependency_files(task, by_id, results):
+    """收集当前任务所有（直接与间接）依赖任务生成的文件"""
+    files = {}
+    seen = set()
+    stack = list(task.deps)
+    while stack:
+        dep = stack.pop()
+        if dep in seen:
+            continue
+        seen.add(dep)
+        stack.extend(by_id[dep].deps)
+        if dep in results:
+            files.update(results[dep]["files"])
+    return files
+
+
+def _task_result(response, extractor, gate=None):
+    """整理单个任务的结果：文件内容从完整输出中提取，推测生成时写入末尾未闭合代码块的操作同样经过闸门"""
+    if response is None:
+        # 推测生成被丢弃
+        return {"content": "", "files": {}}
+    if has_tool_calls(response):
+        # fused 模式下任务请求调用工具
+        return {"content": "", "files": {}, "tool_response": response}
+    if gate is None:
+        extractor.close()
+    else:
+        gate.run(extractor.close)
+    return {"content": remove_think(response.content), "files": {block["filename"]: block["code"] for block in extract_code_blocks(response.content)}}
+
+
+def _task_messages(task, tasks, dep_files, llm, extra_messages):
+    return prompt_messages(TASK_CODE_SYSTEM_PROMPT, _task_code_prompt(task, tasks, dep_files, llm)) + list(extra_messages)
+
+
+def _generate_task_code(task, tasks, dep_files, llm, new_dir, writer, gate=None, extra_messages=()):
+    """生成单个任务的代码，模型输出流式写入 .kiro/code/<任务编号>.md，代码块结束时立即写入 src/"""
+    messages = _task_messages(task, tasks, dep_files, llm, extra_messages)
+    path = os.path.join(new_dir, ".kiro", "code", f"{task.id}.md")
+    extractor = CodeBlockExtractor(writer, keep_code=False)
+    response = generate(f"generate_code[{task.id}]", llm, messages, path, on_text=extractor.feed, gate=gate)
+    return _task_result(response, extractor, gate)
+
+
+async def _agenerate_task_code(task, tasks, dep_files, llm, new_dir, writer, gate=None, extra_messages=()):
+    messages = _task_messages(task, tasks, dep_files, llm, extra_messages)
+    path = os.path.join(new_dir, ".kiro", "code", f"{task.id}.md")
+    extractor = CodeBlockExtractor(writer, keep_code=False)
+    response = await agenerate(f"generate_code[{task.id}]", llm, messages, path, on_text=extractor.feed, gate=gate)
+    return _task_result(response, extractor, gate)
+
+
+def _stopped(results, gate):
+    """推测生成被丢弃或已有任务请求工具调用时，不再启动新的任务"""
+    return (gate is not None and gate.discarded) or any("tool_response" in result for result in results.values())
+
+
+def run_task_dag(tasks, llm, new_dir, workers=None, gate=None, extra_messages=()):
+    """按依赖顺序并行生成各任务的代码：依赖全部完成的任务立即提交到线程池
+
+    gate 为推测生成的闸门，extra_messages 为附加在每个任务之后的工具调用结果（见 tool_round_messages）。
+    """
+    writer = CodeFileWriter(new_dir)
+    order = topological_order(tasks)
+    by_id = {task.id: task for task in order}
+    pending = {task.id: set(task.deps) for task in order}
+    results = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers or CODEGEN_WORKERS, thread_name_prefix="codegen") as executor:
+        def submit_ready():
+            if _stopped(results, gate):
+                return
+            for task in order:
+                if task.id in pending and not pending[task.id]:
+                    del pending[task.id]
+                    dep_files = _dependency_files(task, by_id, results)
+                    # 每个任务复制一份上下文，保留当前的流式输出消费者
+                    future = executor.submit(copy_context().run, _generate_task_code, task, order, dep_files, llm, new_dir, writer,
+                                             gate, extra_messages)
+                    running[future] = task
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                try:
+                    results[task.id] = future.result()
+                except Exception as e:
+                    # 单个任务失败不影响其他任务，依赖它的任务缺少其代码上下文继续生成；失败原因只出现在节点消息中
+                    results[task.id] = {"content": "", "files": {}, "error": str(e)}
+                for deps in pending.values():
+                    deps.discard(task.id)
+            submit_ready()
+
+    return order, results
+
+
+async def arun_task_dag(tasks, llm, new_dir, workers=None, gate=None, extra_messages=()):
+    """run_task_dag 的异步版本：每个任务等待其依赖完成后生成，并发数由信号量限制"""
+    writer = CodeFileWriter(new_dir)
+    order = topological_order(tasks)
+    by_id = {task.id: task for task in order}
+    semaphore = asyncio.Semaphore(workers or CODEGEN_WORKERS)
+    results = {}
+    futures = {}
+
+    async def run(task):
+        for dep in task.deps:
+            await futures[dep]
+        async with semaphore:
+            if _stopped(results, gate):
+                return
+            try:
+                results[task.id] = await _agenerate_task_code(task, order, _dependency_files(task, by_id, results), llm, new_dir, writer,
+                                                              gate, extra_messages)
+            except Exception as e:
+                results[task.id] = {"content": "", "files": {}, "error": str(e)}
+
+    # 按拓扑序创建，保证依赖的 future 已经存在
+    for task in order:
+        futures[task.id] = asyncio.ensure_future(run(task))
+    await asyncio.gather(*futures.values())
+    return order, results
+
+
+def _dag_probe_messages(tasks_content, llm_with_tool):
+    """按任务生成时工具探测的消息：与单次生成相同、按上下文预算构造的提示词"""
+    code_prompt, _ = fit_prompt("generate_code", llm_with_tool, build_code_prompt, system=SYSTEM_PROMPT, tasks_content=tasks_content)
+    return tool_probe_messages(prompt_messages(SYSTEM_PROMPT, code_prompt))
+
+
+def _task_tool_response(order, results):
+    """fused 模式下按拓扑序第一个请求工具调用的任务响应"""
+    for task in order:
+        if "tool_response" in results.get(task.id, {}):
+            return results[task.id]["tool_response"]
+    return None
+
+
+def generate_task_dag(state, llm_with_tool, llm, tasks, tasks_content, new_dir):
+    """按节点的调用模式进行工具判断并按任务依赖图生成代码，返回 (tool_response, order, results)
+
+    probe：先探测再生成；speculative：探测与各任务的生成同时进行，任务输出经过同一个闸门；
+    fused：各任务直接交给带工具的模型，任一任务请求工具时停止启动新任务并转到工具节点。
+    """
+    mode = get_call_mode("generate_code")
+    # 各模式的任务生成都带上刚完成的工具调用结果（探测消息在 probe_tools 中加入）
+    tool_round = tool_round_messages(state)
+    if mode == FUSED and tools_allowed("generate_code", state):
+        order, results = run_task_dag(tasks, llm_with_tool, new_dir, extra_messages=tool_round)
+        return _task_tool_response(order, results), order, results
+    probe_messages = _dag_probe_messages(tasks_content, llm_with_tool)
+    if mode == SPECULATIVE and tools_allowed("generate_code", state):
+        tool_response, dag = speculate("generate_code", state, llm_with_tool, probe_messages,
+                                       lambda gate: run_task_dag(tasks, llm, new_dir, gate=gate, extra_messages=tool_round))
+        return (tool_response, None, None) if tool_response is not None else (None, *dag)
+    tool_response = probe_tools("generate_code", state, llm_with_tool, probe_messages)
+    if tool_response is not None:
+        return tool_response, None, None
+    return (None, *run_task_dag(tasks, llm, new_dir, extra_messages=tool_round))
+
+
+async def agenerate_task_dag(state, llm_with_tool, llm, tasks, tasks_content, new_dir):
+    """generate_task_dag 的异步版本"""
+    mode = get_call_mode("generate_code")
+    # 各模式的任务生成都带上刚完成的工具调用结果（探测消息在 probe_tools 中加入）
+    tool_round = tool_round_messages(state)
+    if mode == FUSED and tools_allowed("generate_code", state):
+        order, results = await arun_task_dag(tasks, llm_with_tool, new_dir, extra_messages=tool_round)
+        return _task_tool_response(order, results), order, results
+    probe_messages = _dag_probe_messages(tasks_content, llm_with_tool)
+    if mode == SPECULATIVE and tools_allowed("generate_code", state):
+        tool_response, dag = await aspeculate("generate_code", state, llm_with_tool, probe_messages,
+                                              lambda gate: arun_task_dag(tasks, llm, new_dir, gate=gate, extra_messages=tool_round))
+        return (tool_response, None, None) if tool_response is not None else (None, *dag)
+    tool_response = await aprobe_tools("generate_code", state, llm_with_tool, probe_messages)
+    if tool_response is not None:
+        return tool_response, None, None
+    return (None, *await arun_task_dag(tasks, llm, new_dir, extra_messages=tool_round))
+
+
+def merge_task_results(order, results):
+    """按拓扑序合并各任务的输出，返回 (合并文本, 需要重新写入的文件, 是否有任务生成了文件)
+
+    各任务的文件在生成过程中已写入 src/；同名文件以拓扑序中靠后的任务为准，需要重新写入，
+    以 [{"filename", "code"}] 的形式返回。生成失败的任务不参与合并。
+    """
+    sections = []
+    files = {}
+    owners = {}
+    for task in order:
+        result = results.get(task.id, {"content": "", "files": {}})
+        if "error" in result:
+            continue
+        sections.append(f"## {task.id} {task.title}\n\n{result['content']}")
+        for filename, code in result["files"].items():
+            files[filename] = code
+            owners[filename] = owners.get(filename, 0) + 1
+    overrides = [{"filename": filename, "code": files[filename]} for filename, count in owners.items() if count > 1]
+    return "\n\n".join(sections), overrides, bool(files)
+
+
+def task_failure_report(order, results):
+    """生成失败的任务说明，附加在节点消息中，不写入代码产物"""
+    failed = [f"- {task.id} {task.title}: {results[task.id]['error']}" for task in order if "error" in results.get(task.id, {})]
+    return "以下任务的代码生成失败：\n" + "\n".join(failed) if failed else ""
+
+
+def generate_code(state, llm_with_tool, llm):
+    """生成代码"""
+    
+    # 获取任务文档内容
+    tasks_content = state.get("tasks_content", "")
+    # 获取新目录路径
+    new_dir = state.get("new_dir", ".")
+    # 模型原始输出实时写入 .kiro/code.md
+    stream_path = os.path.join(new_dir, ".kiro", "code.md")
+    
+    tasks = parse_tasks(tasks_content)
+    failures = ""
+    if use_task_dag(tasks):
+        # 按任务依赖图生成：按节点的调用模式检查是否需要工具调用，按依赖顺序并行生成各任务的代码
+        tool_response, order, results = generate_task_dag(state, llm_with_tool, llm, tasks, tasks_content, new_dir)
+        if tool_response is not None:
+            return tool_request_update("generate_code", tool_response)
+        code_content, code_blocks, has_files = merge_task_results(order, results)
+        failures = task_failure_report(order, results)
+    else:
+        # 生成代码
+        code_prompt, _ = fit_prompt("generate_code", llm, build_code_prompt, system=SYSTEM_PROMPT, tasks_content=tasks_content)
+        messages = prompt_messages(SYSTEM_PROMPT, code_prompt)
+        # 代码块的结束围栏一到达就写入 src/，不必等待完整响应
+        extractor = CodeBlockExtractor(CodeFileWriter(new_dir), keep_code=False)
+        
+        # 工具判断与生成（probe 模式先探测工具调用，fused 模式单次调用），生成内容流式写入 .kiro/code.md
+        tool_response, code_response = invoke_with_tools(
+            "generate_code", state, llm_with_tool, llm,
+            probe_messages=tool_probe_messages(messages),
+            messages=messages,
+            stream_path=stream_path,
+            on_text=extractor.feed,
+        )
+        if tool_response is not None:
+            # 需要工具调用，返回工具调用请求
+            return tool_request_update("generate_code", tool_response)
+        
+        code_content = remove_think(code_response.content)
+        # 文件已在生成过程中写入，这里只需处理末尾未闭合的代码块
+        code_blocks, has_files = [], bool(extractor.close())
     
-    # 使用LLM生成工作汇报形式的摘要
-    response_content = generate_work_report(state, code_content, "代码", llm)
+    # 保存去除思考过程后的完整输出，作为检查点产物
+    write_file(stream_path, code_content)
+    
+    # 保存代码文件
+    save_code_blocks(new_dir, code_blocks, code_content, has_files)
+    
+    # 工作汇报在后台生成，不阻塞下一阶段
+    response_content = report_work(state, code_content, "代码", llm)
+    if failures:
+        response_content = f"{response_content}\n\n{failures}"
     
     response = AIMessage(content=response_content)
     
     # MessagesState 将消息附加到 state 而不是覆盖
-    return {"code_content": code_content, "messages": [response], "new_dir": new_dir, "next": "generate_response"}
\ No newline at end of file
+    return {"code_content": code_content, "messages": [response], "new_dir": new_dir, "next": "generate_response"}
+
+
+async def agenerate_code(state, llm_with_tool, llm):
+    """生成代码（异步版本）"""
+    
+    tasks_content = state.get("tasks_content", "")
+    new_dir = state.get("new_dir", ".")
+    stream_path = os.path.join(new_dir, ".kiro", "code.md")
+    
+    tasks = parse_tasks(tasks_content)
+    failures = ""
+    if use_task_dag(tasks):
+        tool_response, order, results = await agenerate_task_dag(state, llm_with_tool, llm, tasks, tasks_content, new_dir)
+        if tool_response is not None:
+            return tool_request_update("generate_code", tool_response)
+        code_content, code_blocks, has_files = merge_task_results(order, results)
+        failures = task_failure_report(order, results)
+    else:
+        code_prompt, _ = fit_prompt("generate_code", llm, build_code_prompt, system=SYSTEM_PROMPT, tasks_content=tasks_content)
+        messages = prompt_messages(SYSTEM_PROMPT, code_prompt)
+        extractor = CodeBlockExtractor(CodeFileWriter(new_dir), keep_code=False)
+        tool_response, code_response = await ainvoke_with_tools(
+            "generate_code", state, llm_with_tool, llm,
+            probe_messages=tool_probe_messages(messages),
+            messages=messages,
+            stream_path=stream_path,
+            on_text=extractor.feed,
+        )
+        if tool_response is not None:
+            return tool_request_update("generate_code", tool_response)
+        code_content = remove_think(code_response.content)
+        code_blocks, has_files = [], bool(extractor.close())
+    
+    # 文件写入在线程中执行，避免阻塞事件循环
+    await awrite_file(stream_path, code_content)
+    await asyncio.to_thread(save_code_blocks, new_dir, code_blocks, code_content, has_files)
+    
+    response_content = await areport_work(state, code_content, "代码", llm)
+    if failures:
+        response_content = f"{response_content}\n\n{failures}"
+    
+    return {"code_content": code_content, "messages": [AIMessage(content=response_content)], "new_dir": new_dir, "next": "generate_response"}
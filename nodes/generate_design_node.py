@@ -1,34 +1,14 @@
 import os
-from langchain_core.messages import AIMessage, ToolMessage
-from utils.utils import remove_think, write_file
-from nodes.work_report_node import generate_work_report
+from langchain_core.messages import AIMessage
+from utils.utils import remove_think, write_file, awrite_file
+from utils.context_budget import fit_prompt
+from utils.prompt_layout import prompt_messages, tool_probe_messages
+from utils.tool_decision import invoke_with_tools, ainvoke_with_tools, tool_request_update
+from nodes.work_report_node import report_work, areport_work
 
 
-def generate_design(state, llm_with_tool, llm):
-    """生成设计文档"""
-    
-    # 获取需求文档内容
-    requirements_content = state.get("requirements_content", "")
-    # 获取新目录路径
-    new_dir = state.get("new_dir", ".")
-    
-    # 生成工具调用
-    tool_calls = llm_with_tool.invoke([{"role": "user", "content": requirements_content}])
-    
-    # 输出工具调用结果
-    if hasattr(tool_calls, 'tool_calls') and tool_calls.tool_calls:
-        return {"next": "tools", "messages": [ToolMessage(content=tool_calls.tool_calls[0].content)], "source_node": "generate_design"}
-    
-    # 创建 .kiro 目录
-    kiro_dir = os.path.join(new_dir, ".kiro")
-    if not os.path.exists(kiro_dir):
-        os.makedirs(kiro_dir)
-    
-    # 生成设计文档
-    design_prompt = f"""请基于以下需求文档，将宏观设计分解为微观、可执行编码任务的清单：
-
-需求文档：
-{requirements_content}
+# 固定的指令与输出结构，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请基于用户消息中的需求文档，将宏观设计分解为微观、可执行编码任务的清单。
 
 请按照以下结构生成设计文档：
 
@@ -61,18 +41,73 @@ def generate_design(state, llm_with_tool, llm):
 
 注意：任务应具有原子性和可执行性，每个任务都应是离散、可管理的编码步骤，并明确关联到需求文档中的具体需求点。
 """
+
+
+def build_design_prompt(requirements_content):
+    """构造设计文档生成提示词的可变部分"""
+    return f"需求文档：\n{requirements_content}"
+
+
+def generate_design(state, llm_with_tool, llm):
+    """生成设计文档"""
+    
+    # 获取需求文档内容
+    requirements_content = state.get("requirements_content", "")
+    # 获取新目录路径
+    new_dir = state.get("new_dir", ".")
+    design_path = os.path.join(new_dir, ".kiro", "design.md")
+    
+    # 生成设计文档
+    design_prompt, _ = fit_prompt("generate_design", llm, build_design_prompt, system=SYSTEM_PROMPT, requirements_content=requirements_content)
+    messages = prompt_messages(SYSTEM_PROMPT, design_prompt)
+    
+    # 工具判断与生成（probe 模式先探测工具调用，fused 模式单次调用），生成内容流式写入文档
+    tool_response, design_response = invoke_with_tools(
+        "generate_design", state, llm_with_tool, llm,
+        probe_messages=tool_probe_messages(messages),
+        messages=messages,
+        stream_path=design_path,
+    )
+    if tool_response is not None:
+        # 需要工具调用，返回工具调用请求
+        return tool_request_update("generate_design", tool_response)
     
-    design_response = llm.invoke([{"role": "user", "content": design_prompt}])
     design_content = remove_think(design_response.content)
     
-    # 保存设计文档
-    design_path = os.path.join(kiro_dir, "design.md")
+    # 保存去除思考过程后的最终设计文档
     write_file(design_path, design_content)
     
-    # 使用LLM生成工作汇报形式的摘要
-    response_content = generate_work_report(state, design_content, "设计文档", llm)
+    # 工作汇报在后台生成，不阻塞下一阶段
+    response_content = report_work(state, design_content, "设计文档", llm)
     
     response = AIMessage(content=response_content)
     
     # MessagesState 将消息附加到 state 而不是覆盖
-    return {"design_content": design_content, "messages": [response], "new_dir": new_dir, "next": "generate_tasks"}
\ No newline at end of file
+    return {"design_content": design_content, "messages": [response], "new_dir": new_dir, "next": "generate_tasks"}
+
+
+async def agenerate_design(state, llm_with_tool, llm):
+    """生成设计文档（异步版本）"""
+    
+    requirements_content = state.get("requirements_content", "")
+    new_dir = state.get("new_dir", ".")
+    design_path = os.path.join(new_dir, ".kiro", "design.md")
+    design_prompt, _ = fit_prompt("generate_design", llm, build_design_prompt, system=SYSTEM_PROMPT, requirements_content=requirements_content)
+    messages = prompt_messages(SYSTEM_PROMPT, design_prompt)
+    
+    tool_response, design_response = await ainvoke_with_tools(
+        "generate_design", state, llm_with_tool, llm,
+        probe_messages=tool_probe_messages(messages),
+        messages=messages,
+        stream_path=design_path,
+    )
+    if tool_response is not None:
+        return tool_request_update("generate_design", tool_response)
+    
+    design_content = remove_think(design_response.content)
+    
+    await awrite_file(design_path, design_content)
+    
+    response_content = await areport_work(state, design_content, "设计文档", llm)
+    
+    return {"design_content": design_content, "messages": [AIMessage(content=response_content)], "new_dir": new_dir, "next": "generate_tasks"}
@@ -1,33 +1,14 @@
 import os
 from langchain_core.messages import AIMessage
-from utils.utils import remove_think, write_file
-from nodes.work_report_node import generate_work_report
+from utils.utils import remove_think, write_file, awrite_file
+from utils.prompt_layout import prompt_messages, tool_probe_messages
+from utils.tool_decision import invoke_with_tools, ainvoke_with_tools, tool_request_update
+from utils.memory import latest_user_message
+from nodes.work_report_node import report_work, areport_work
 
 
-def generate_requirements(state, llm_with_tool, llm):
-    """生成需求文档"""
-    
-    # 获取用户输入
-    user_message = state["messages"][-1].content if state["messages"] else ""
-    
-    # 1. 先检查是否需要工具调用
-    tool_response = llm_with_tool.invoke([{"role": "user", "content": user_message}])
-    if hasattr(tool_response, 'tool_calls') and tool_response.tool_calls:
-        # 需要工具调用，返回工具调用请求
-        return {"messages": [tool_response], "next": "tools", "source_node": "generate_requirements"}
-    
-    # 2. 原有需求生成逻辑
-    # 获取新目录路径
-    new_dir = state.get("new_dir", ".")
-    # 创建 .kiro 目录
-    kiro_dir = os.path.join(new_dir, ".kiro")
-    if not os.path.exists(kiro_dir):
-        os.makedirs(kiro_dir)
-    
-    # 生成需求文档
-    requirements_prompt = f"""请基于以下需求，生成一份详细的需求文档：
-
-{user_message}
+# 固定的指令与输出结构，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请基于用户消息中的需求，生成一份详细的需求文档。
 
 请按照以下结构生成需求文档，每个需求严格遵照EARS格式（包含零个或多个先决条件、零个或一个触发器、一个系统名称及一个或多个系统响应）：
 
@@ -65,18 +46,72 @@ def generate_requirements(state, llm_with_tool, llm):
 在生成需求时，可以使用`search_tool`来理解用户输入中提到的你不了解的概念，以确保需求的准确性和完整性，防止生成带有事实性错误的需求。
 不要仅凭已有知识生成内容，对于任何不确定的信息都应通过工具搜索确认。务必仔细检查，确保所有需求都符合EARS格式要求。
 """
+
+
+def build_requirements_prompt(user_message):
+    """构造需求文档生成提示词的可变部分"""
+    return f"需求：\n{user_message}"
+
+
+def generate_requirements(state, llm_with_tool, llm):
+    """生成需求文档"""
+    
+    # 获取用户输入
+    user_message = latest_user_message(state)
+    
+    # 获取新目录路径
+    new_dir = state.get("new_dir", ".")
+    requirements_path = os.path.join(new_dir, ".kiro", "requirements.md")
+    
+    # 生成需求文档
+    messages = prompt_messages(SYSTEM_PROMPT, build_requirements_prompt(user_message))
+    
+    # 工具判断与生成（probe 模式先探测工具调用，fused 模式单次调用），生成内容流式写入文档
+    tool_response, requirements_response = invoke_with_tools(
+        "generate_requirements", state, llm_with_tool, llm,
+        probe_messages=tool_probe_messages(messages),
+        messages=messages,
+        stream_path=requirements_path,
+    )
+    if tool_response is not None:
+        # 需要工具调用，返回工具调用请求
+        return tool_request_update("generate_requirements", tool_response)
     
-    requirements_response = llm.invoke([{"role": "user", "content": requirements_prompt}])
     requirements_content = remove_think(requirements_response.content)
     
-    # 保存需求文档
-    requirements_path = os.path.join(kiro_dir, "requirements.md")
+    # 保存去除思考过程后的最终需求文档
     write_file(requirements_path, requirements_content)
     
-    # 使用LLM生成工作汇报形式的摘要
-    response_content = generate_work_report(state, requirements_content, "需求文档", llm)
+    # 工作汇报在后台生成，不阻塞下一阶段
+    response_content = report_work(state, requirements_content, "需求文档", llm)
     
     response = AIMessage(content=response_content)
     
     # MessagesState 将消息附加到 state 而不是覆盖
-    return {"requirements_content": requirements_content, "messages": [response], "new_dir": new_dir, "next": "generate_design"}
\ No newline at end of file
+    return {"requirements_content": requirements_content, "messages": [response], "new_dir": new_dir, "next": "generate_design"}
+
+
+async def agenerate_requirements(state, llm_with_tool, llm):
+    """生成需求文档（异步版本）"""
+    
+    user_message = latest_user_message(state)
+    new_dir = state.get("new_dir", ".")
+    requirements_path = os.path.join(new_dir, ".kiro", "requirements.md")
+    messages = prompt_messages(SYSTEM_PROMPT, build_requirements_prompt(user_message))
+    
+    tool_response, requirements_response = await ainvoke_with_tools(
+        "generate_requirements", state, llm_with_tool, llm,
+        probe_messages=tool_probe_messages(messages),
+        messages=messages,
+        stream_path=requirements_path,
+    )
+    if tool_response is not None:
+        return tool_request_update("generate_requirements", tool_response)
+    
+    requirements_content = remove_think(requirements_response.content)
+    
+    await awrite_file(requirements_path, requirements_content)
+    
+    response_content = await areport_work(state, requirements_content, "需求文档", llm)
+    
+    return {"requirements_content": requirements_content, "messages": [AIMessage(content=response_content)], "new_dir": new_dir, "next": "generate_design"}
@@ -1,23 +1,40 @@
 from langchain_core.messages import AIMessage
 from utils.utils import remove_think
+from utils.memory import latest_user_message
+from utils.prompt_layout import prompt_messages
+
+
+# 固定的指令，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请基于用户消息中的输入，生成一个直接、简洁的回答。
+
+注意：这不是开发相关的请求，所以不需要生成需求文档、设计文档等开发相关内容。
+请直接回答用户的问题，保持回答简洁明了。
+"""
+
+
+def build_response_prompt(user_message):
+    """构造最终响应提示词的可变部分"""
+    return f"用户输入: {user_message}"
 
 
 def generate_response(state, llm):
     """生成最终响应"""
     
     # 获取用户输入
-    user_message = state["messages"][-1].content if state["messages"] else ""
+    user_message = latest_user_message(state)
     
     # 生成最终响应
-    response_prompt = f"""请基于以下用户输入，生成一个直接、简洁的回答：
+    response = llm.invoke(prompt_messages(SYSTEM_PROMPT, build_response_prompt(user_message)))
+    response_content = remove_think(response.content)
+    
+    return {"messages": [AIMessage(content=response_content)], "next": "end"}
 
-用户输入: {user_message}
 
-注意：这不是开发相关的请求，所以不需要生成需求文档、设计文档等开发相关内容。
-请直接回答用户的问题，保持回答简洁明了。
-"""
+async def agenerate_response(state, llm):
+    """生成最终响应（异步版本）"""
     
-    response = llm.invoke([{"role": "user", "content": response_prompt}])
+    user_message = latest_user_message(state)
+    response = await llm.ainvoke(prompt_messages(SYSTEM_PROMPT, build_response_prompt(user_message)))
     response_content = remove_think(response.content)
     
-    return {"messages": [AIMessage(content=response_content)], "next": "end"}
\ No newline at end of file
+    return {"messages": [AIMessage(content=response_content)], "next": "end"}
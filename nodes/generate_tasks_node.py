@@ -1,34 +1,14 @@
 import os
-from langchain_core.messages import AIMessage, ToolMessage
-from utils.utils import remove_think, write_file
-from nodes.work_report_node import generate_work_report
+from langchain_core.messages import AIMessage
+from utils.utils import remove_think, write_file, awrite_file
+from utils.context_budget import fit_prompt
+from utils.prompt_layout import prompt_messages, tool_probe_messages
+from utils.tool_decision import invoke_with_tools, ainvoke_with_tools, tool_request_update
+from nodes.work_report_node import report_work, areport_work
 
 
-def generate_tasks(state, llm_with_tool, llm):
-    """生成任务文档"""
-    
-    # 获取设计文档内容
-    design_content = state.get("design_content", "")
-    # 获取新目录路径
-    new_dir = state.get("new_dir", ".")
-    
-    # 生成工具调用
-    tool_calls = llm_with_tool.invoke([{"role": "user", "content": design_content}])
-    
-    # 输出工具调用结果
-    if hasattr(tool_calls, 'tool_calls') and tool_calls.tool_calls:
-        return {"next": "tools", "messages": [ToolMessage(content=tool_calls.tool_calls[0].content)], "source_node": "generate_tasks"}
-    
-    # 创建 .kiro 目录
-    kiro_dir = os.path.join(new_dir, ".kiro")
-    if not os.path.exists(kiro_dir):
-        os.makedirs(kiro_dir)
-    
-    # 生成任务文档
-    tasks_prompt = f"""请基于以下设计文档，生成详细的开发任务列表：
-
-设计文档：
-{design_content}
+# 固定的指令与输出结构，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请基于用户消息中的设计文档，生成详细的开发任务列表。
 
 请按照以下结构生成任务文档：
 
@@ -41,11 +21,12 @@ def generate_tasks(state, llm_with_tool, llm):
 
 ## 核心功能开发
 [根据设计文档中的架构和功能模块，分解为具体的开发任务]
-每个任务应包含：
+每个任务以 `### T编号 任务名称` 作为标题（如 `### T1 数据模型`），并包含：
 1. 任务描述
 2. 任务优先级（高/中/低）
 3. 预计工时
-4. 依赖任务（如果有）
+4. 依赖任务（填写依赖的任务编号，如 T1、T2；没有则填“无”）
+5. 涉及文件（该任务需要新增或修改的源文件）
 
 ## 测试
 - [ ] 单元测试
@@ -62,18 +43,73 @@ def generate_tasks(state, llm_with_tool, llm):
 
 注意：任务应具有原子性和可执行性，每个任务都应是离散、可管理的编码步骤，并明确关联到设计文档中的具体模块。
 """
+
+
+def build_tasks_prompt(design_content):
+    """构造任务文档生成提示词的可变部分"""
+    return f"设计文档：\n{design_content}"
+
+
+def generate_tasks(state, llm_with_tool, llm):
+    """生成任务文档"""
+    
+    # 获取设计文档内容
+    design_content = state.get("design_content", "")
+    # 获取新目录路径
+    new_dir = state.get("new_dir", ".")
+    tasks_path = os.path.join(new_dir, ".kiro", "tasks.md")
+    
+    # 生成任务文档
+    tasks_prompt, _ = fit_prompt("generate_tasks", llm, build_tasks_prompt, system=SYSTEM_PROMPT, design_content=design_content)
+    messages = prompt_messages(SYSTEM_PROMPT, tasks_prompt)
+    
+    # 工具判断与生成（probe 模式先探测工具调用，fused 模式单次调用），生成内容流式写入文档
+    tool_response, tasks_response = invoke_with_tools(
+        "generate_tasks", state, llm_with_tool, llm,
+        probe_messages=tool_probe_messages(messages),
+        messages=messages,
+        stream_path=tasks_path,
+    )
+    if tool_response is not None:
+        # 需要工具调用，返回工具调用请求
+        return tool_request_update("generate_tasks", tool_response)
     
-    tasks_response = llm.invoke([{"role": "user", "content": tasks_prompt}])
     tasks_content = remove_think(tasks_response.content)
     
-    # 保存任务文档
-    tasks_path = os.path.join(kiro_dir, "tasks.md")
+    # 保存去除思考过程后的最终任务文档
     write_file(tasks_path, tasks_content)
     
-    # 使用LLM生成工作汇报形式的摘要
-    response_content = generate_work_report(state, tasks_content, "任务文档", llm)
+    # 工作汇报在后台生成，不阻塞下一阶段
+    response_content = report_work(state, tasks_content, "任务文档", llm)
     
     response = AIMessage(content=response_content)
     
     # MessagesState 将消息附加到 state 而不是覆盖
-    return {"tasks_content": tasks_content, "messages": [response], "new_dir": new_dir, "next": "generate_code"}
\ No newline at end of file
+    return {"tasks_content": tasks_content, "messages": [response], "new_dir": new_dir, "next": "generate_code"}
+
+
+async def agenerate_tasks(state, llm_with_tool, llm):
+    """生成任务文档（异步版本）"""
+    
+    design_content = state.get("design_content", "")
+    new_dir = state.get("new_dir", ".")
+    tasks_path = os.path.join(new_dir, ".kiro", "tasks.md")
+    tasks_prompt, _ = fit_prompt("generate_tasks", llm, build_tasks_prompt, system=SYSTEM_PROMPT, design_content=design_content)
+    messages = prompt_messages(SYSTEM_PROMPT, tasks_prompt)
+    
+    tool_response, tasks_response = await ainvoke_with_tools(
+        "generate_tasks", state, llm_with_tool, llm,
+        probe_messages=tool_probe_messages(messages),
+        messages=messages,
+        stream_path=tasks_path,
+    )
+    if tool_response is not None:
+        return tool_request_update("generate_tasks", tool_response)
+    
+    tasks_content = remove_think(tasks_response.content)
+    
+    await awrite_file(tasks_path, tasks_content)
+    
+    response_content = await areport_work(state, tasks_content, "任务文档", llm)
+    
+    return {"tasks_content": tasks_content, "messages": [AIMessage(content=response_content)], "new_dir": new_dir, "next": "generate_code"}
@@ -1,78 +1,174 @@
+import asyncio
 from langchain_core.messages import AIMessage
-from langgraph.globals import set_llm_cache
-from langchain_community.cache import InMemoryCache
-from langchain_ollama import ChatOllama
-from AutoSpec.utils.utils import remove_think
-from AutoSpec.tools.tools import search_tool
+from utils.utils import remove_think
+from utils.prompt_layout import prompt_messages, tool_probe_messages
+from utils.tool_decision import invoke_with_tools, ainvoke_with_tools, tool_request_update
+from utils.memory import latest_user_message
+from utils.model_routing import routed_llm
+from utils.intent_classifier import DEV, OTHER, local_intent, parse_intent_answer
+from utils.metrics import record_intent
+from utils.project_naming import DEFAULT_PROJECT_NAME, allocate_project_dir, local_project_name, sanitize_project_name, slugify_request
+from utils.request_index import SIMILAR_REQUESTS, find_similar_project, fork_project
+
+
+# 固定的指令，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请判断用户消息中的输入是否与软件开发相关，包括但不限于需求分析、系统设计、任务规划等。
+
+请回答"是"或"否"，并简要说明理由。
+"""
+
+PROJECT_NAME_SYSTEM_PROMPT = "请基于用户消息中的需求生成一个简洁的英文驼峰命名的项目文件夹名称（只返回文件夹名称，不要包含任何其他内容）。"
+
+
+def build_intent_prompt(user_message):
+    """构造意图识别提示词的可变部分"""
+    return f"用户输入: {user_message}"
+
+
+def build_project_name_prompt(user_message):
+    """构造项目文件夹命名提示词的可变部分"""
+    return f"需求：\n{user_message}"
+
+
+def create_project_dir(project_name, base_dir="."):
+    """在 base_dir 下创建新目录，如果重名则添加数字后缀"""
+    return allocate_project_dir(project_name, base_dir)
+
+
+def _project_name(project_name_response):
+    """提取模型生成的文件夹名称"""
+    return sanitize_project_name(remove_think(project_name_response.content))
+
+
+def _development_update(new_dir):
+    """开发相关请求的状态更新"""
+    response = AIMessage(content=f"已创建项目目录 {new_dir} 并开始生成需求文档。")
+    # 直接返回扁平化结果，避免嵌套字典
+    return {"next": "generate_requirements", "new_dir": new_dir, "messages": [response]}
+
+
+def _similar_update(state, user_message):
+    """相似的历史需求已有文档时按策略复用或复制该项目，返回状态更新；不复用时返回 None"""
+    policy = state.get("reuse_policy") or SIMILAR_REQUESTS
+    if policy not in ("reuse", "fork"):
+        return None
+    # 只查找当前 base_dir（多会话服务中为当前用户的目录）下的项目
+    found = find_similar_project(user_message, base_dir=state.get("base_dir", "."))
+    if found is None:
+        return None
+    match, resumed, resume_from = found
+    new_dir = match.project_dir
+    if policy == "fork":
+        # 复制出的项目在本地命名，不调用模型
+        project_name = slugify_request(user_message) or DEFAULT_PROJECT_NAME
+        new_dir = fork_project(match.project_dir, create_project_dir(project_name, state.get("base_dir", ".")))
+    action = "复用" if policy == "reuse" else "复制"
+    print(f"[REUSE] 与历史需求「{match.text}」相似度 {match.score:.2f}，{action}项目 {match.project_dir}")
+    if resume_from:
+        content = f"已{action}相似需求的项目文档（{new_dir}），从 {resume_from} 阶段继续生成。"
+    else:
+        content = f"已{action}相似需求的项目（{new_dir}），所有阶段均已完成。"
+    update = {key: value for key, value in resumed.items() if key.endswith("_content")}
+    update.update({"next": resume_from or "end", "new_dir": new_dir, "reused_from": match.project_dir,
+                   "messages": [AIMessage(content=content)]})
+    return update
+
+
+def _response_update():
+    """非开发请求的状态更新"""
+    response = AIMessage(content="您的请求不是开发相关的，我将直接回答您的问题。")
+    # 直接返回扁平化结果，避免嵌套字典
+    return {"next": "generate_response", "messages": [response]}
+
+
+def _local_decision(user_message):
+    """本地意图分类足够确定时返回是否为开发需求，否则返回 None（交给模型判断）"""
+    result = local_intent(user_message)
+    if result is None:
+        return None
+    record_intent(result.source, result.label, result.confidence)
+    print(f"[INTENT] 本地判断为{'开发需求' if result.label == DEV else '非开发请求'}（{result.source}，置信度 {result.confidence:.2f}）")
+    return result.label == DEV
+
+
+def _llm_decision(intent_response):
+    """解析模型的意图判断"""
+    is_development = parse_intent_answer(remove_think(intent_response.content))
+    record_intent("llm", DEV if is_development else OTHER)
+    return is_development
 
 
 def intent_recognition(state, llm_with_tool, llm):
     """意图识别节点，判断用户是否需要开发"""
     
     # 获取用户输入
-    user_message = state["messages"][-1].content if state["messages"] else ""
+    user_message = latest_user_message(state)
     
-    # 1. 先检查是否需要工具调用
-    tool_response = llm_with_tool.invoke([{"role": "user", "content": user_message}])
-    if hasattr(tool_response, 'tool_calls') and tool_response.tool_calls:
-        # 需要工具调用，返回工具调用请求
-        return {"messages": [tool_response], "next": "tools", "source_node": "intent_recognition"}
-    
-    # 2. 原有意图识别逻辑
-    intent_prompt = f"""请判断以下用户输入是否与软件开发相关，包括但不限于需求分析、系统设计、任务规划等：
-
-用户输入: {user_message}
-
-请回答"是"或"否"，并简要说明理由。
-"""
-    intent_response = llm.invoke([{"role": "user", "content": intent_prompt}])
-    intent_result = remove_think(intent_response.content).lower()
+    # 明显的情况由本地分类直接判断，不调用模型
+    is_development = _local_decision(user_message)
+    if is_development is None:
+        # 意图识别提示词
+        messages = prompt_messages(SYSTEM_PROMPT, build_intent_prompt(user_message))
+        
+        # 工具判断与意图识别（probe 模式先探测工具调用，fused 模式单次调用）
+        tool_response, intent_response = invoke_with_tools(
+            "intent_recognition", state, llm_with_tool, llm,
+            probe_messages=tool_probe_messages(messages),
+            messages=messages,
+        )
+        if tool_response is not None:
+            # 需要工具调用，返回工具调用请求
+            return tool_request_update("intent_recognition", tool_response)
+        
+        is_development = _llm_decision(intent_response)
     
     # 根据意图识别结果决定下一步
-    if "是" in intent_result:
+    if is_development:
+        # 相似的历史需求已有文档时按 AUTOSPEC_SIMILAR_REQUESTS 复用或复制
+        reused = _similar_update(state, user_message)
+        if reused is not None:
+            return reused
         # 如果是开发相关，创建新目录并进入需求文档生成节点
-        # 使用LLM生成语义化的项目文件夹名，要求是精简的英文驼峰命名
-        project_name_prompt = f"请基于以下用户需求生成一个简洁的英文驼峰命名的项目文件夹名称（只返回文件夹名称，不要包含任何其他内容）：
-
-{user_message}"
-        project_name_response = llm.invoke([{"role": "user", "content": project_name_prompt}])
-        # 提取实际的文件夹名称
-        project_name = remove_think(project_name_response.content).strip()
-        # 确保文件夹名称不超过30个字符
-        if len(project_name) > 30:
-            project_name = project_name[:30].strip()
-        # 移除文件夹名称中的无效字符
-        invalid_chars = '<>:"/\|?* '
-        for char in invalid_chars:
-            project_name = project_name.replace(char, '')
-        # 移除首尾空格
-        project_name = project_name.strip()
-        # 如果文件夹名称为空，则使用默认名称
-        if not project_name:
-            project_name = "Project"
-        # 确保文件夹名称不以点开头
-        if project_name.startswith('.'):
-            project_name = project_name[1:] if len(project_name) > 1 else "Project"
-        # 确保第一个字符是字母
-        if project_name and not project_name[0].isalpha():
-            project_name = "Project" + project_name
-        # 如果文件夹名称仍为空，则使用默认名称
-        if not project_name:
-            project_name = "Project"
-        
-        # 创建新目录，检查是否重名，如果重名则添加数字后缀
-        new_dir = project_name
-        counter = 1
-        original_new_dir = new_dir
-        while os.path.exists(new_dir):
-            new_dir = f"{original_new_dir}_{counter}"
-            counter += 1
-        os.makedirs(new_dir, exist_ok=True)
-        response = AIMessage(content=f"已创建项目目录 {new_dir} 并开始生成需求文档。")
-        # 直接返回扁平化结果，避免嵌套字典
-        return {"next": "generate_requirements", "new_dir": new_dir, "messages": [response]}
+        # 项目文件夹名默认由用户需求在本地生成，AUTOSPEC_PROJECT_NAMING 为 llm / auto 时由模型生成精简的英文驼峰命名
+        project_name = local_project_name(user_message)
+        if project_name is None:
+            project_name_messages = prompt_messages(PROJECT_NAME_SYSTEM_PROMPT, build_project_name_prompt(user_message))
+            project_name_response = routed_llm("project_name", llm).invoke(project_name_messages)
+            project_name = _project_name(project_name_response)
+        new_dir = create_project_dir(project_name, state.get("base_dir", "."))
+        return _development_update(new_dir)
     else:
         # 如果不是开发相关，直接生成回答
-        response = AIMessage(content="您的请求不是开发相关的，我将直接回答您的问题。")
-        # 直接返回扁平化结果，避免嵌套字典
-        return {"next": "generate_response", "messages": [response]}
\ No newline at end of file
+        return _response_update()
+
+
+async def aintent_recognition(state, llm_with_tool, llm):
+    """意图识别节点（异步版本）"""
+    
+    user_message = latest_user_message(state)
+    
+    is_development = _local_decision(user_message)
+    if is_development is None:
+        messages = prompt_messages(SYSTEM_PROMPT, build_intent_prompt(user_message))
+        tool_response, intent_response = await ainvoke_with_tools(
+            "intent_recognition", state, llm_with_tool, llm,
+            probe_messages=tool_probe_messages(messages),
+            messages=messages,
+        )
+        if tool_response is not None:
+            return tool_request_update("intent_recognition", tool_response)
+        is_development = _llm_decision(intent_response)
+    
+    if is_development:
+        reused = await asyncio.to_thread(_similar_update, state, user_message)
+        if reused is not None:
+            return reused
+        project_name = local_project_name(user_message)
+        if project_name is None:
+            project_name_messages = prompt_messages(PROJECT_NAME_SYSTEM_PROMPT, build_project_name_prompt(user_message))
+            project_name_response = await routed_llm("project_name", llm).ainvoke(project_name_messages)
+            project_name = _project_name(project_name_response)
+        new_dir = await asyncio.to_thread(create_project_dir, project_name, state.get("base_dir", "."))
+        return _development_update(new_dir)
+    else:
+        return _response_update()
@@ -1,29 +1,151 @@
-from langchain_core.messages import AIMessage
+import asyncio
+import inspect
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from utils.utils import remove_think
+from utils.memory import latest_user_message
+from utils.prompt_layout import prompt_messages
+from utils.model_routing import routed_llm
 
 
-def generate_work_report(state, content, doc_type, llm):
-    """生成工作汇报"""
+# 固定的指令，每次运行逐字节相同（见 utils/prompt_layout.py）
+SYSTEM_PROMPT = """请基于用户消息中的用户需求与文档内容摘要，生成一份简洁的工作汇报。
+
+请按照以下结构生成工作汇报：
+1. 任务完成情况：简要说明该文档已生成
+2. 主要内容：简要概述该文档的核心内容
+3. 下一步计划：说明接下来的工作
+
+汇报应简洁明了，不要超过300字。
+"""
+
+
+def build_work_report_prompt(state, content, doc_type):
+    """构造工作汇报提示词的可变部分"""
     
     # 获取用户输入
-    user_message = state["messages"][-1].content if state["messages"] else ""
+    user_message = latest_user_message(state)
     
-    # 生成工作汇报
-    report_prompt = f"""请基于以下内容，生成一份简洁的工作汇报：
-
-用户需求：{user_message}
+    return f"""用户需求：{user_message}
 
 生成的{doc_type}内容摘要：{content[:500]}...
+"""
 
-请按照以下结构生成工作汇报：
-1. 任务完成情况：简要说明{doc_type}已生成
-2. 主要内容：简要概述{doc_type}的核心内容
-3. 下一步计划：说明接下来的工作
 
-汇报应简洁明了，不要超过300字。
-"""
+def generate_work_report(state, content, doc_type, llm):
+    """生成工作汇报"""
     
-    report_response = llm.invoke([{"role": "user", "content": report_prompt}])
+    # 生成工作汇报
+    report_prompt = build_work_report_prompt(state, content, doc_type)
+    report_response = llm.invoke(prompt_messages(SYSTEM_PROMPT, report_prompt))
     report_content = remove_think(report_response.content)
     
-    return report_content
\ No newline at end of file
+    return report_content
+
+
+async def agenerate_work_report(state, content, doc_type, llm):
+    """生成工作汇报（异步版本）"""
+    
+    report_prompt = build_work_report_prompt(state, content, doc_type)
+    report_response = await llm.ainvoke(prompt_messages(SYSTEM_PROMPT, report_prompt))
+    return remove_think(report_response.content)
+
+
+# 后台工作汇报：汇报只展示给用户，不应阻塞下一阶段
+BACKGROUND_REPORTS = os.environ.get("AUTOSPEC_BACKGROUND_REPORTS", "1") != "0"
+REPORT_WORKERS = int(os.environ.get("AUTOSPEC_REPORT_WORKERS", "2"))
+
+_report_executor = None
+_report_lock = threading.Lock()
+# 当前运行提交的后台汇报：由 work_reports() 为每次运行单独设置，未设置时记入进程级的列表
+_run_reports = ContextVar("autospec_work_reports", default=None)
+_unscoped_reports = []
+
+
+def _get_report_executor():
+    """延迟创建汇报线程池"""
+    global _report_executor
+    with _report_lock:
+        if _report_executor is None:
+            _report_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="work-report")
+        return _report_executor
+
+
+def _print_report(doc_type, future):
+    """汇报完成后输出到控制台"""
+    try:
+        report_content = future.result()
+    except Exception as e:
+        print(f"\n[工作汇报] {doc_type}汇报生成失败: {e}")
+        return
+    print(f"\n[工作汇报] {doc_type}\n{report_content}")
+
+
+@contextmanager
+def work_reports():
+    """在 with 块内单独记录本次运行的后台汇报，wait_for_work_reports 只等待这些汇报（多会话时互不影响）"""
+    futures = []
+    token = _run_reports.set(futures)
+    try:
+        yield futures
+    finally:
+        _run_reports.reset(token)
+
+
+def _current_reports():
+    futures = _run_reports.get()
+    return _unscoped_reports if futures is None else futures
+
+
+def _threaded_report_fn(report_fn):
+    """在后台线程中执行的汇报函数：默认的异步版本换成同步版本，其他协程函数在线程内单独运行事件循环"""
+    if report_fn is agenerate_work_report:
+        return generate_work_report
+    if inspect.iscoroutinefunction(report_fn):
+        return lambda *args: asyncio.run(report_fn(*args))
+    return report_fn
+
+
+def submit_work_report(state, content, doc_type, llm, report_fn=generate_work_report):
+    """在后台线程中生成工作汇报，返回 Future；report_fn 可以是同步函数或协程函数"""
+    report_fn = _threaded_report_fn(report_fn)
+    # 只保留汇报需要的消息快照，避免后续节点修改状态
+    snapshot = {"messages": list(state.get("messages") or [])}
+    # 在当前运行的上下文中生成，保留回调、指标标签与运行预算
+    future = _get_report_executor().submit(copy_context().run, report_fn, snapshot, content, doc_type, llm)
+    future.add_done_callback(lambda f: _print_report(doc_type, f))
+    futures = _current_reports()
+    with _report_lock:
+        futures[:] = [f for f in futures if not f.done()]
+        futures.append(future)
+    return future
+
+
+def report_work(state, content, doc_type, llm, report_fn=generate_work_report):
+    """生成节点返回给用户的消息：后台模式下立即返回，汇报完成后单独输出"""
+    # 汇报使用 work_report 路由的模型（未启用路由时使用节点的模型）
+    llm = routed_llm("work_report", llm)
+    if not BACKGROUND_REPORTS:
+        return report_fn(state, content, doc_type, llm)
+    submit_work_report(state, content, doc_type, llm, report_fn)
+    return f"{doc_type}已生成，工作汇报正在后台生成。"
+
+
+def wait_for_work_reports(timeout=None):
+    """等待当前运行（work_reports() 之外为未单独记录的）后台汇报完成"""
+    futures = _current_reports()
+    with _report_lock:
+        pending = list(futures)
+    wait(pending, timeout=timeout)
+
+
+async def areport_work(state, content, doc_type, llm, report_fn=agenerate_work_report):
+    """report_work 的异步版本：后台模式下汇报交给线程池，否则在事件循环中等待汇报"""
+    llm = routed_llm("work_report", llm)
+    if not BACKGROUND_REPORTS:
+        return await report_fn(state, content, doc_type, llm)
+    submit_work_report(state, content, doc_type, llm, report_fn)
+    return f"{doc_type}已生成，工作汇报正在后台生成。"
@@ -0,0 +1,564 @@
+"""
+多会话服务：通过 HTTP 与 WebSocket 让多个用户共享同一个模型服务运行流水线（只依赖标准库 asyncio）
+
+用法：
+    python server.py --port 8765 --workers 2 --max-in-flight 2
+    python server.py --fake-llm --latency 0.2          # 用确定性的假模型在本地试用，不需要 Ollama
+
+HTTP 接口（请求与响应均为 JSON）：
+    GET    /health              队列长度、运行中的流水线、模型调用名额与是否饱和
+    POST   /runs                提交需求 {"input", "user", "session"（可选）, "reuse_policy"（可选）}，返回 202 与 run_id
+    GET    /runs/<run_id>       运行状态、事件数与结果
+    DELETE /runs/<run_id>       取消排队中或运行中的流水线
+
+WebSocket /ws：
+    客户端发送 {"type": "run", ...与 POST /runs 相同} 提交需求，{"type": "subscribe", "run_id"} 订阅已有的运行，
+    {"type": "cancel", "run_id"} 取消运行；/ws?run=<run_id> 连接后直接订阅该运行。
+    订阅后先补发已有事件，再实时推送：accepted / rejected / queued / started / node（节点完成）/
+    generation（生成开始与结束）/ token / done / error / cancelled。
+
+会话与隔离：
+    每次运行有独立的图状态、运行预算、流式输出消费者与指标回调，项目目录位于 <workspace>/<user>/ 下；
+    同一会话（session）中的需求依次运行，不同会话之间并行。
+
+准入控制与背压：
+    - 同时运行的流水线不超过 --workers，其余在队列中等待；队列已满时返回 503；
+    - 每个用户同时运行的流水线不超过 --user-limit，排队的需求不超过 --user-queue，超出时返回 429；
+    - 所有模型调用共享 --max-in-flight 个名额（InFlightLimiter）；名额已满且有调用在排队（模型服务饱和）时
+      不再启动新的流水线，队列长度超过 --workers 后拒绝新的需求（503，带 Retry-After）。
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+
+from graph import build_graph
+from nodes.work_report_node import work_reports
+from tools.tools import search_tool
+from utils.budget import run_budget
+from utils.concurrency import InFlightLimiter, LimitedLLM
+from utils.llm_cache import init_llm_cache
+from utils.metrics import MetricsCallbackHandler, configure_logging, flush_metrics
+from utils.model_routing import enable_model_routing
+from utils.registry import get_llm, set_llm_factory
+from utils.run_state import initial_state, final_response
+from utils.streaming import reset_token_sink, set_token_sink
+
+
+logger = logging.getLogger("autospec.server")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+MAX_INPUT_CHARS = 20000
+# 每次运行保存的事件数上限（用于补发），超出后不再保存 token 事件
+EVENT_HISTORY = 10000
+# 订阅者积压的事件超过该数量时丢弃 token 事件，慢客户端不会拖慢流水线
+SUBSCRIBER_BACKLOG = 2000
+# 保留的已结束运行数
+FINISHED_RUNS = 500
+REUSE_POLICIES = ("", "reuse", "fork", "off")
+_USER = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class Run:
+    """一次流水线运行：状态、事件历史与订阅者"""
+
+    def __init__(self, user, session, user_input, reuse_policy, loop):
+        self.id = uuid.uuid4().hex[:12]
+        self.user = user
+        self.session = session
+        self.input = user_input
+        self.reuse_policy = reuse_policy
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.task = None
+        self.events = []
+        self.subscribers = set()
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+
+    def info(self):
+        return {
+            "run_id": self.id,
+            "user": self.user,
+            "session": self.session,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "events": len(self.events),
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def emit(self, event):
+        """推送事件（可从任意线程调用）"""
+        event = dict(event, run_id=self.id, ts=round(time.time(), 3))
+        if threading.get_ident() == self._loop_thread:
+            self._emit(event)
+        else:
+            self._loop.call_soon_threadsafe(self._emit, event)
+
+    def _emit(self, event):
+        token = event["type"] == "token"
+        if not token or len(self.events) < EVENT_HISTORY:
+            self.events.append(event)
+        for queue in self.subscribers:
+            if token and queue.qsize() > SUBSCRIBER_BACKLOG:
+                continue
+            queue.put_nowait(event)
+
+    def subscribe(self, queue):
+        """订阅事件：先补发历史事件"""
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.finished is None:
+            self.subscribers.add(queue)
+
+    def sink(self, node, event, data):
+        """流式输出消费者（每次运行独立），把生成过程转为事件"""
+        if event == "token":
+            self.emit({"type": "token", "node": node, "text": data})
+        elif event == "start":
+            self.emit({"type": "generation", "node": node, "event": "start", "path": data})
+        elif event == "end":
+            self.emit({"type": "generation", "node": node, "event": "end", **data})
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+        self.emit({"type": status, "result": result, "error": error})
+        self._loop.call_soon(self.subscribers.clear)
+
+
+def _node_event(node, update):
+    """节点完成事件：只包含可序列化的摘要"""
+    event = {"type": "node", "node": node}
+    if not isinstance(update, dict):
+        return event
+    event["next"] = update.get("next")
+    for key in ("new_dir", "reused_from"):
+        if update.get(key):
+            event[key] = update[key]
+    messages = update.get("messages") or []
+    last = messages[-1] if messages else None
+    tool_calls = getattr(last, "tool_calls", None)
+    if tool_calls:
+        event["tool_calls"] = [call["name"] for call in tool_calls]
+    elif last is not None and getattr(last, "content", None):
+        event["message"] = last.content
+    return event
+
+
+class Service:
+    """运行队列、准入控制与调度"""
+
+    def __init__(self, graph, limiter, workspace, workers=2, user_limit=1, user_queue=4, max_queue=32):
+        self.graph = graph
+        self.limiter = limiter
+        self.workspace = workspace
+        self.workers = workers
+        self.user_limit = user_limit
+        self.user_queue = user_queue
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.running = {}
+        self.runs = OrderedDict()
+        self.active_sessions = set()
+        self._wakeup = asyncio.Event()
+
+    # 准入控制
+    def submit(self, payload):
+        """提交需求，返回 (HTTP 状态码, 响应, Run 或 None)"""
+        if not isinstance(payload, dict):
+            return 400, {"error": "请求体应为 JSON 对象"}, None
+        user_input = payload.get("input")
+        if not isinstance(user_input, str) or not user_input.strip():
+            return 400, {"error": "缺少 input"}, None
+        if len(user_input) > MAX_INPUT_CHARS:
+            return 413, {"error": f"input 超过 {MAX_INPUT_CHARS} 字符"}, None
+        user = str(payload.get("user") or "anonymous")
+        if not _USER.match(user):
+            return 400, {"error": "user 只能包含字母、数字、下划线、点与连字符（最多 64 个字符）"}, None
+        reuse_policy = payload.get("reuse_policy") or ""
+        if reuse_policy not in REUSE_POLICIES:
+            return 400, {"error": f"reuse_policy 可选值: {', '.join(p for p in REUSE_POLICIES if p)}"}, None
+        session = str(payload.get("session") or uuid.uuid4().hex[:12])
+
+        queued_by_user = sum(1 for run in self.queue if run.user == user)
+        if queued_by_user >= self.user_queue:
+            return 429, {"error": f"用户 {user} 排队中的需求已达上限 {self.user_queue}", "retry_after": 5}, None
+        if len(self.queue) >= self.max_queue:
+            return 503, {"error": "队列已满", "retry_after": 10}, None
+        if self.limiter.saturated() and len(self.queue) >= self.workers:
+            return 503, {"error": "模型服务繁忙", "retry_after": 10}, None
+
+        run = Run(user, session, user_input.strip(), reuse_policy, asyncio.get_running_loop())
+        self.runs[run.id] = run
+        self.queue.append(run)
+        run.emit({"type": "queued", "position": len(self.queue), "session": session})
+        self._prune()
+        self._wakeup.set()
+        return 202, {"run_id": run.id, "session": session, "position": len(self.queue)}, run
+
+    def cancel(self, run_id):
+        run = self.runs.get(run_id)
+        if run is None:
+            return 404, {"error": "运行不存在"}
+        if run in self.queue:
+            self.queue.remove(run)
+            run.finish("cancelled")
+        elif run.task is not None and not run.task.done():
+            run.task.cancel()
+        return 200, run.info()
+
+    def health(self):
+        users = {}
+        for run in self.running.values():
+            users.setdefault(run.user, {"running": 0, "queued": 0})["running"] += 1
+        for run in self.queue:
+            users.setdefault(run.user, {"running": 0, "queued": 0})["queued"] += 1
+        return {
+            "queued": len(self.queue),
+            "running": len(self.running),
+            "workers": self.workers,
+            "in_flight": self.limiter.in_flight,
+            "waiting_llm_calls": self.limiter.waiting,
+            "max_in_flight": self.limiter.max_in_flight,
+            "saturated": self.limiter.saturated(),
+            "users": users,
+        }
+
+    def _prune(self):
+        """只保留最近的已结束运行"""
+        finished = [run_id for run_id, run in self.runs.items() if run.finished is not None]
+        for run_id in finished[:max(0, len(finished) - FINISHED_RUNS)]:
+            del self.runs[run_id]
+
+    # 调度
+    def _next_run(self):
+        """队列中第一个可以启动的运行：用户未达并发上限且所在会话没有运行中的需求"""
+        running_by_user = {}
+        for run in self.running.values():
+            running_by_user[run.user] = running_by_user.get(run.user, 0) + 1
+        for run in self.queue:
+            if running_by_user.get(run.user, 0) < self.user_limit and run.session not in self.active_sessions:
+                return run
+        return None
+
+    async def dispatch(self):
+        """调度循环：有空闲名额且模型服务未饱和时启动排队的运行"""
+        while True:
+            while len(self.running) < self.workers and not self.limiter.saturated():
+                run = self._next_run()
+                if run is None:
+                    break
+                self.queue.remove(run)
+                self.running[run.id] = run
+                self.active_sessions.add(run.session)
+                run.task = asyncio.ensure_future(self._execute(run))
+            self._wakeup.clear()
+            try:
+                # 饱和状态没有事件通知，定期重新检查
+                await asyncio.wait_for(self._wakeup.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, run):
+        run.status = "running"
+        run.started = time.time()
+        run.emit({"type": "started", "waited_s": round(run.started - run.created, 3)})
+        # 流式输出消费者只在本次运行的上下文中生效
+        sink_token = set_token_sink(run.sink)
+        metrics = MetricsCallbackHandler()
+        state = initial_state(run.input, run.reuse_policy)
+        state["base_dir"] = os.path.join(self.workspace, run.user)
+        final = None
+        try:
+            # 后台工作汇报按运行单独记录，不与其他会话的汇报混在一起
+            with run_budget(), work_reports():
+                async for mode, chunk in self.graph.astream(
+                    state, config={"callbacks": [metrics], "recursion_limit": 100}, stream_mode=["updates", "values"]
+                ):
+                    if mode == "updates":
+                        for node, update in chunk.items():
+                            run.emit(_node_event(node, update))
+                    else:
+                        final = chunk
+            run.finish("done", result={
+                "new_dir": final.get("new_dir", ""),
+                "reused_from": final.get("reused_from") or None,
+                "response": final_response(final),
+                "budget": final.get("budget_report"),
+                "metrics": metrics.summary(),
+            })
+        except asyncio.CancelledError:
+            run.finish("cancelled")
+        except Exception as e:
+            logger.exception(f"运行 {run.id} 失败")
+            run.finish("error", error=f"{type(e).__name__}: {e}")
+        finally:
+            reset_token_sink(sink_token)
+            self.running.pop(run.id, None)
+            self.active_sessions.discard(run.session)
+            flush_metrics()
+            self._wakeup.set()
+
+
+# HTTP
+STATUS_TEXT = {101: "Switching Protocols", 200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 429: "Too Many Requests", 503: "Service Unavailable"}
+
+
+async def _read_request(reader):
+    """读取请求行、请求头与请求体，返回 (方法, 路径, 查询参数, 请求头, 请求体)"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    if len(head) > MAX_HEADER_BYTES:
+        raise ValueError("请求头过大")
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return method.upper(), url.path, parse_qs(url.query), headers, body
+
+
+async def _send_json(writer, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", "Content-Type: application/json; charset=utf-8",
+               f"Content-Length: {len(body)}", "Connection: close"]
+    if isinstance(payload, dict) and payload.get("retry_after"):
+        headers.append(f"Retry-After: {payload['retry_after']}")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+# WebSocket（RFC 6455，只支持文本消息）
+def _ws_frame(payload, opcode=0x1):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def _ws_read(reader):
+    """读取一条消息（合并分片），返回 (opcode, 数据)"""
+    opcode, message = None, b""
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY_BYTES:
+            raise ValueError("消息过大")
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        data = await reader.readexactly(length)
+        if mask:
+            data = bytes(byte ^ mask[i % 4] for i, byte in enumerate(data))
+        frame_opcode = first & 0x0F
+        # 控制帧可以夹在分片之间，直接返回
+        if frame_opcode >= 0x8:
+            return frame_opcode, data
+        opcode = opcode if frame_opcode == 0x0 else frame_opcode
+        message += data
+        if first & 0x80:
+            return opcode, message
+
+
+async def _websocket(service, reader, writer, headers, query):
+    key = headers.get("sec-websocket-key")
+    if headers.get("upgrade", "").lower() != "websocket" or not key:
+        await _send_json(writer, 400, {"error": "需要 WebSocket 升级请求"})
+        return
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("latin-1")).digest()).decode("latin-1")
+    writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+    outbox = asyncio.Queue()
+    subscribed = []
+
+    def subscribe(run):
+        run.subscribe(outbox)
+        subscribed.append(run)
+
+    async def send_events():
+        while True:
+            event = await outbox.get()
+            writer.write(_ws_frame(json.dumps(event, ensure_ascii=False).encode("utf-8")))
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send_events())
+    try:
+        for run_id in query.get("run", []):
+            run = service.runs.get(run_id)
+            if run is None:
+                outbox.put_nowait({"type": "error", "run_id": run_id, "error": "运行不存在"})
+            else:
+                subscribe(run)
+        while True:
+            opcode, data = await _ws_read(reader)
+            if opcode == 0x8:
+                writer.write(_ws_frame(data[:2], 0x8))
+                break
+            if opcode == 0x9:
+                writer.write(_ws_frame(data, 0xA))
+                continue
+            if opcode != 0x1:
+                continue
+            try:
+                message = json.loads(data.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                outbox.put_nowait({"type": "error", "error": "消息应为 JSON"})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "run":
+                status, body, run = service.submit(message)
+                if run is None:
+                    outbox.put_nowait(dict(body, type="rejected", status=status))
+                else:
+                    outbox.put_nowait(dict(body, type="accepted"))
+                    subscribe(run)
+            elif kind in ("subscribe", "cancel"):
+                run = service.runs.get(message.get("run_id"))
+                if run is None:
+                    outbox.put_nowait({"type": "error", "run_id": message.get("run_id"), "error": "运行不存在"})
+                elif kind == "subscribe":
+                    subscribe(run)
+                else:
+                    service.cancel(run.id)
+            else:
+                outbox.put_nowait({"type": "error", "error": "未知的消息类型，可选 run / subscribe / cancel"})
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        for run in subscribed:
+            run.subscribers.discard(outbox)
+        sender.cancel()
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        method, path, query, headers, body = await _read_request(reader)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        writer.close()
+        return
+    try:
+        if path == "/ws":
+            await _websocket(service, reader, writer, headers, query)
+        elif path == "/health" and method == "GET":
+            await _send_json(writer, 200, service.health())
+        elif path == "/runs" and method == "POST":
+            try:
+                payload = json.loads(body.decode("utf-8") or "{}")
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                payload = None
+            status, response, _ = service.submit(payload)
+            await _send_json(writer, status, response)
+        elif path.startswith("/runs/"):
+            run_id = path[len("/runs/"):]
+            if method == "GET":
+                run = service.runs.get(run_id)
+                await _send_json(writer, 200 if run else 404, run.info() if run else {"error": "运行不存在"})
+            elif method == "DELETE":
+                await _send_json(writer, *service.cancel(run_id))
+            else:
+                await _send_json(writer, 405, {"error": "不支持的方法"})
+        else:
+            await _send_json(writer, 404, {"error": "未知路径"})
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def build_service(args):
+    """创建共享的模型客户端、图与调度服务"""
+    if args.fake_llm:
+        # 假模型与固定搜索结果，离线运行
+        from benchmarks.fake_llm import FakeLLMStats, fake_llm_factory
+        from benchmarks.run_pipeline import StaticSearchBackend
+        from tools.search_backend import set_search_backend
+
+        set_llm_factory(fake_llm_factory(FakeLLMStats(), latency=args.latency, tokens_per_second=args.tokens_per_second))
+        set_search_backend(StaticSearchBackend())
+    else:
+        init_llm_cache()
+    # 所有会话共享同一个模型客户端与进行中调用名额
+    limiter = InFlightLimiter(args.max_in_flight)
+    enable_model_routing(args.models, wrap=lambda routed: LimitedLLM(routed, limiter))
+    llm = LimitedLLM(get_llm(args.model, temperature=args.temperature, streaming=True), limiter)
+    graph = build_graph(llm.bind_tools([search_tool]), llm)
+    return Service(graph, limiter, args.workspace, args.workers, args.user_limit, args.user_queue, args.max_queue)
+
+
+async def serve(args):
+    service = build_service(args)
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), args.host, args.port)
+    dispatcher = asyncio.ensure_future(service.dispatch())
+    logger.info(f"AutoSpec 服务已启动: http://{args.host}:{args.port}（WebSocket: ws://{args.host}:{args.port}/ws）")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        dispatcher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoSpec 多会话 HTTP / WebSocket 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workspace", default="workspace", help="项目目录的根目录（每个用户一个子目录）")
+    parser.add_argument("--workers", type=int, default=2, help="同时运行的流水线数量")
+    parser.add_argument("--max-in-flight", type=int, default=2, help="同时进行中的 LLM 调用上限")
+    parser.add_argument("--user-limit", type=int, default=1, help="每个用户同时运行的流水线数量")
+    parser.add_argument("--user-queue", type=int, default=4, help="每个用户排队中的需求数量上限")
+    parser.add_argument("--max-queue", type=int, default=32, help="队列长度上限")
+    parser.add_argument("--model", default="llama3.1:8b")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--models", metavar="PATH", help="按节点选择模型的路由配置（默认 models.json，不存在时所有节点使用 --model）")
+    parser.add_argument("--fake-llm", action="store_true", help="使用假模型与固定搜索结果（本地试用与测试）")
+    parser.add_argument("--latency", type=float, default=0.1, help="假模型首个 token 前的延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="假模型输出速度")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        logger.info("服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""测试共用的离线环境：假模型、固定搜索结果与临时目录中的缓存和索引"""
+
+import pytest
+from langchain_core.globals import set_llm_cache
+
+from benchmarks.fake_llm import FakeLLMStats, fake_llm_factory
+from benchmarks.run_pipeline import StaticSearchBackend
+from tools.search_backend import set_search_backend
+from tools.search_cache import SearchCache, set_search_cache
+from utils.model_routing import set_model_routing
+from utils.registry import set_llm_factory
+from utils.request_index import RequestIndex, set_request_index
+from utils.streaming import reset_token_sink, set_token_sink
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """在临时目录中使用假模型运行流水线，返回假模型的调用记录"""
+    monkeypatch.chdir(tmp_path)
+    stats = FakeLLMStats()
+    set_llm_factory(fake_llm_factory(stats))
+    set_model_routing(None)
+    set_llm_cache(None)
+    set_search_backend(StaticSearchBackend())
+    set_search_cache(SearchCache(str(tmp_path / "search_cache.sqlite"), ttl=0))
+    set_request_index(RequestIndex(str(tmp_path / "request_index.sqlite")))
+    sink_token = set_token_sink(lambda node, event, data: None)
+    try:
+        yield stats
+    finally:
+        reset_token_sink(sink_token)
+        set_request_index(None)
+        set_search_cache(None)
+        set_search_backend(None)
+        set_llm_factory(None)
@@ -0,0 +1,62 @@
+"""utils/checkpoint.py：阶段检查点与恢复"""
+
+import os
+
+from benchmarks.run_pipeline import _main_state
+from graph import build_graph
+from tools.tools import search_tool
+from utils.checkpoint import load_checkpoint, plan_resume, save_checkpoint
+from utils.registry import get_llm, get_llm_with_tools
+
+
+def _graph():
+    return build_graph(get_llm_with_tools("fake", [search_tool]), get_llm("fake"))
+
+
+def _calls_by_kind(stats):
+    return {kind: item["calls"] for kind, item in stats.summary()["by_kind"].items()}
+
+
+def _finished_project():
+    result = _graph().invoke(_main_state(), config={"recursion_limit": 100})
+    return result["new_dir"]
+
+
+def test_completed_project_needs_no_resume(offline):
+    project = _finished_project()
+    state, resume_from = plan_resume(project)
+    assert resume_from is None
+    assert state["messages"][0]["content"] == _main_state()["messages"][0]["content"]
+    assert state["code_content"]
+
+
+def test_edited_document_reruns_downstream_stages_only(offline):
+    project = _finished_project()
+    with open(os.path.join(project, ".kiro", "design.md"), "a", encoding="utf-8") as f:
+        f.write("\n## 补充\n- 支持按截止日期排序\n")
+
+    state, resume_from = plan_resume(project)
+    assert resume_from == "generate_tasks"
+    assert "支持按截止日期排序" in state["design_content"]
+    assert "tasks_content" not in state
+
+    offline.reset()
+    state["resume_from"] = resume_from
+    _graph().invoke(state, config={"recursion_limit": 100})
+    calls = _calls_by_kind(offline)
+    assert "requirements" not in calls and "design" not in calls
+    assert calls["tasks"] == 1
+    assert plan_resume(project)[1] is None
+
+
+def test_missing_artifact_resumes_from_its_stage(offline):
+    project = _finished_project()
+    os.remove(os.path.join(project, ".kiro", "code.md"))
+    assert plan_resume(project)[1] == "generate_code"
+
+
+def test_corrupt_checkpoint_starts_over(tmp_path):
+    save_checkpoint(str(tmp_path), {"user_input": "需求", "stages": {}})
+    (tmp_path / ".kiro" / "checkpoint.json").write_text("{", encoding="utf-8")
+    assert load_checkpoint(str(tmp_path)) == {"user_input": "", "stages": {}}
+    assert plan_resume(str(tmp_path))[1] == "generate_requirements"
@@ -0,0 +1,68 @@
+"""utils/code_blocks.py：增量代码块提取"""
+
+from utils.code_blocks import CodeBlockExtractor, extract_code_blocks, safe_code_path
+
+
+RESPONSE = """<think>
+先写一个草稿：
+```python filename=draft.py
+print("draft")
+```
+</think>
+实现如下：
+
+```python filename=app/main.py
+def main():
+    return 1
+```
+
+### app/utils.py
+```python
+VALUE = 2
+```
+
+```javascript
+// file: static/app.js
+console.log("ok");
+```
+
+```text
+没有文件名的代码块
+```
+"""
+
+
+def test_streamed_tokens_match_whole_text():
+    extractor = CodeBlockExtractor()
+    for i in range(0, len(RESPONSE), 3):
+        extractor.feed(RESPONSE[i:i + 3])
+    assert extractor.close() == extract_code_blocks(RESPONSE)
+
+
+def test_filename_detection_and_think_sections():
+    blocks = extract_code_blocks(RESPONSE)
+    assert [block["filename"] for block in blocks] == ["app/main.py", "app/utils.py", "static/app.js"]
+    assert blocks[0]["code"] == "def main():\n    return 1\n"
+    assert blocks[2]["code"] == 'console.log("ok");\n'
+
+
+def test_on_block_called_when_fence_closes():
+    seen = []
+    extractor = CodeBlockExtractor(on_block=lambda filename, code: seen.append(filename), keep_code=False)
+    extractor.feed("```python filename=a.py\nx = 1\n")
+    assert seen == []
+    extractor.feed("```\n")
+    assert seen == ["a.py"]
+    assert extractor.blocks == [{"filename": "a.py", "code": None}]
+
+
+def test_unclosed_block_ends_on_close():
+    extractor = CodeBlockExtractor()
+    extractor.feed("```python filename=a.py\nx = 1\ny = 2")
+    assert extractor.close() == [{"filename": "a.py", "code": "x = 1\ny = 2\n"}]
+
+
+def test_safe_code_path_rejects_escapes(tmp_path):
+    assert safe_code_path(str(tmp_path), "../evil.py") is None
+    assert safe_code_path(str(tmp_path), "/etc/passwd") is None
+    assert safe_code_path(str(tmp_path), "pkg/mod.py") == str(tmp_path.resolve() / "pkg" / "mod.py")
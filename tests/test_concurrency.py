@@ -0,0 +1,54 @@
+"""utils/concurrency.py：InFlightLimiter 的计数与取消"""
+
+import asyncio
+
+from utils.concurrency import InFlightLimiter
+
+
+def test_sync_slot_counts():
+    limiter = InFlightLimiter(2)
+    with limiter.slot():
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        limiter = InFlightLimiter(1)
+        holder_entered = asyncio.Event()
+        release_holder = asyncio.Event()
+
+        async def holder():
+            async with limiter.aslot():
+                holder_entered.set()
+                await release_holder.wait()
+
+        async def waiter():
+            async with limiter.aslot():
+                pass
+
+        holding = asyncio.create_task(holder())
+        await holder_entered.wait()
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0.2)
+        assert limiter.waiting == 1
+
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        assert limiter.waiting == 0
+
+        release_holder.set()
+        await holding
+        # 等待线程最多 0.1s 后发现已被放弃；之后名额应可再次取得
+        await asyncio.sleep(0.3)
+        assert (limiter.in_flight, limiter.waiting) == (0, 0)
+        async with limiter.aslot():
+            assert limiter.in_flight == 1
+        with limiter.slot():
+            assert limiter.in_flight == 1
+        assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=10))
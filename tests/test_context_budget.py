@@ -0,0 +1,40 @@
+"""utils/context_budget.py：预算分配、文档压缩与 [CONTEXT] 报告"""
+
+import logging
+
+from langchain_ollama import ChatOllama
+
+from utils.context_budget import allocate_budget, count_tokens, fit_prompt
+
+
+def _build(doc):
+    return f"根据以下文档回答：\n{doc}"
+
+
+def test_allocate_budget_gives_unused_share_to_others():
+    allocation = allocate_budget({"short": 10, "long": 500}, 200)
+    assert allocation == {"short": 10, "long": 190}
+
+
+def test_allocate_budget_respects_weights():
+    allocation = allocate_budget({"a": 400, "b": 400}, 300, weights={"a": 2, "b": 1})
+    assert allocation == {"a": 200, "b": 100}
+
+
+def test_fit_prompt_compacts_and_prints_report(capsys):
+    llm = ChatOllama(model="qwen3:8b", num_ctx=512)
+    doc = "\n\n".join(f"## 第 {i} 节\n" + "这是一段很长的说明文字。" * 20 for i in range(20))
+    prompt, report = fit_prompt("design", llm, _build, doc=doc)
+    assert "doc" in report["compacted"]
+    assert count_tokens(prompt, "qwen3:8b") <= report["budget"]
+    assert "[CONTEXT] design" in capsys.readouterr().out
+
+
+def test_fit_prompt_is_quiet_when_nothing_trimmed(capsys, caplog):
+    llm = ChatOllama(model="qwen3:8b", num_ctx=4096)
+    with caplog.at_level(logging.DEBUG, logger="autospec.context"):
+        prompt, report = fit_prompt("task", llm, _build, doc="一个简短的文档")
+    assert report["compacted"] == {}
+    assert prompt == _build("一个简短的文档")
+    assert capsys.readouterr().out == ""
+    assert "[CONTEXT] task" in caplog.text
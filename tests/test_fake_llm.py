@@ -0,0 +1,46 @@
+"""benchmarks/fake_llm.py：假模型按提示词内容识别调用类型"""
+
+import os
+
+from langchain_core.messages import ToolMessage
+
+from benchmarks.fake_llm import FakeChatModel, FakeLLMStats
+from graph import build_graph
+from tools.tools import search_tool
+from utils.prompt_layout import prompt_messages, tool_probe_messages
+from utils.registry import get_llm
+from utils.run_state import initial_state
+
+
+REQUIREMENTS = prompt_messages("请生成一份详细的需求文档。", "用户需求：开发一个待办事项应用")
+
+
+def test_probe_calls_tool_once_then_declines():
+    llm = FakeChatModel(stats=FakeLLMStats()).bind_tools([search_tool])
+    first = llm.invoke(tool_probe_messages(REQUIREMENTS))
+    second = llm.invoke(tool_probe_messages(REQUIREMENTS))
+    assert first.tool_calls and not second.tool_calls
+    assert second.content == "不需要"
+
+
+def test_fused_generation_returns_document():
+    stats = FakeLLMStats()
+    llm = FakeChatModel(stats=stats).bind_tools([search_tool])
+    tool_call = llm.invoke(REQUIREMENTS)
+    assert tool_call.tool_calls
+    # 带上工具调用结果后生成文档，而不是探测的简短回复
+    result = ToolMessage(content="参考资料", tool_call_id=tool_call.tool_calls[0]["id"])
+    document = llm.invoke(list(REQUIREMENTS) + [tool_call, result])
+    assert not document.tool_calls
+    assert document.content.startswith("# 需求文档")
+    assert [call["kind"] for call in stats.calls] == ["requirements", "requirements"]
+
+
+def test_fused_pipeline_produces_tasks_and_code(offline, monkeypatch):
+    monkeypatch.setenv("AUTOSPEC_TOOL_MODE", "fused")
+    llm = get_llm("fake")
+    graph = build_graph(llm.bind_tools([search_tool]), llm)
+    result = graph.invoke(initial_state("开发一个待办事项应用"), config={"recursion_limit": 100})
+    assert "### T1" in result["tasks_content"]
+    assert os.path.isfile(os.path.join(result["new_dir"], "src", "t1.py"))
+    assert offline.summary()["by_kind"]["task_code"]["completion_chars"] > 0
@@ -0,0 +1,28 @@
+"""nodes/generate_code_node.py：按任务合并代码"""
+
+from nodes.generate_code_node import merge_task_results, task_failure_report
+from utils.task_dag import Task
+
+
+def _order(*ids):
+    return [Task(task_id, f"模块{task_id}") for task_id in ids]
+
+
+def test_merge_keeps_later_task_for_shared_files():
+    order = _order("T1", "T2")
+    results = {
+        "T1": {"content": "一", "files": {"app.py": "v1\n", "a.py": "a\n"}},
+        "T2": {"content": "二", "files": {"app.py": "v2\n"}},
+    }
+    text, overrides, has_files = merge_task_results(order, results)
+    assert text == "## T1 模块T1\n\n一\n\n## T2 模块T2\n\n二"
+    assert overrides == [{"filename": "app.py", "code": "v2\n"}]
+    assert has_files
+
+
+def test_failed_tasks_reported_not_merged():
+    order = _order("T1", "T2")
+    results = {"T1": {"content": "", "files": {}, "error": "超时"}, "T2": {"content": "二", "files": {}}}
+    text, overrides, has_files = merge_task_results(order, results)
+    assert "T1" not in text and overrides == [] and not has_files
+    assert task_failure_report(order, results) == "以下任务的代码生成失败：\n- T1 模块T1: 超时"
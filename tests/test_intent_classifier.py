@@ -0,0 +1,36 @@
+"""utils/intent_classifier.py：规则命中与置信度"""
+
+import pytest
+
+from utils.intent_classifier import DEV, DEV_RULE, INTENT_CONFIDENCE, classify_intent
+
+
+@pytest.mark.parametrize("text", [
+    "帮我开发一个待办事项应用",
+    "用 Flask 写一个接口",
+    "做个贪吃蛇游戏",
+    "Build a todo app",
+    "create a REST API for a blog",
+    "Create a landing page",
+])
+def test_dev_rule_matches_development_requests(text):
+    result = classify_intent(text)
+    assert (result.label, result.source) == (DEV, "rules")
+
+
+@pytest.mark.parametrize("text", [
+    "make an apple pie recipe",
+    "write a poem about servers",
+    "写一篇关于程序员成长的文章",
+    "设计一个系统的学习计划",
+    "帮我做一份旅游攻略，推荐一些工具",
+    "Make a game plan for the weekend",
+    "写一段介绍网站设计趋势的文案",
+    "the application is great",
+    "recreate the mood of the 90s",
+])
+def test_dev_rule_ignores_non_development_requests(text):
+    assert not DEV_RULE.search(text.lower())
+    result = classify_intent(text)
+    # 不能以足以跳过模型判断的置信度被判为开发需求
+    assert result.label != DEV or result.confidence < INTENT_CONFIDENCE
@@ -0,0 +1,58 @@
+"""utils/llm_cache.py：缓存键与命中统计"""
+
+from langchain_core.outputs import Generation
+
+from utils.llm_cache import KeyedChatOllama, SQLiteLLMCache, make_cache_key
+
+
+def _llm_string(**kwargs):
+    return KeyedChatOllama(model=kwargs.pop("model", "qwen3:8b"), **kwargs)._get_llm_string()
+
+
+def test_key_depends_on_model_and_sampling_params():
+    base = make_cache_key("hello", _llm_string())[0]
+    assert make_cache_key("hello", _llm_string(model="llama3:8b"))[0] != base
+    assert make_cache_key("hello", _llm_string(temperature=0.9))[0] != base
+    assert make_cache_key("hello", _llm_string(num_ctx=8192))[0] != base
+    assert make_cache_key("hello", _llm_string())[0] == base
+
+
+def test_key_reports_model_name():
+    assert make_cache_key("hello", _llm_string(model="llama3:8b"))[1] == "llama3:8b"
+
+
+def test_key_differs_for_tool_bound_model():
+    llm = KeyedChatOllama(model="qwen3:8b")
+
+    def search(query: str) -> str:
+        """搜索"""
+        return query
+
+    bound = llm.bind_tools([search])
+    plain_string = llm._get_llm_string()
+    bound_string = llm._get_llm_string(**bound.kwargs)
+    assert make_cache_key("hello", plain_string)[0] != make_cache_key("hello", bound_string)[0]
+
+
+def test_whitespace_in_prompt_is_significant():
+    llm_string = _llm_string()
+    assert make_cache_key("def f():\n    return 1", llm_string)[0] != make_cache_key("def f():\n  return 1", llm_string)[0]
+    assert make_cache_key("a\r\nb", llm_string)[0] == make_cache_key("a\nb", llm_string)[0]
+
+
+def test_hit_counted_only_after_successful_loads(tmp_path):
+    cache = SQLiteLLMCache(str(tmp_path / "cache.sqlite"))
+    llm_string = _llm_string()
+    assert cache.lookup("prompt", llm_string) is None
+
+    cache.update("prompt", llm_string, [Generation(text="answer")])
+    assert cache.lookup("prompt", llm_string)[0].text == "answer"
+
+    # 损坏的条目不计为命中
+    key, _ = make_cache_key("prompt", llm_string)
+    cache._conn.execute("UPDATE llm_cache SET value = 'not json' WHERE key = ?", (key,))
+    cache._conn.commit()
+    assert cache.lookup("prompt", llm_string) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
@@ -0,0 +1,70 @@
+"""utils/memory.py：消息窗口、历史摘要与工具结果占位"""
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.graph import add_messages
+
+from utils import memory
+from utils.memory import compact_history, history_messages, latest_user_message, summarize_messages
+
+
+def _conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"第 {i} 个问题", id=f"u{i}"))
+        messages.append(AIMessage(content=f"第 {i} 个回答", id=f"a{i}"))
+    return messages
+
+
+def test_old_turns_are_removed_and_summarized(monkeypatch):
+    monkeypatch.setattr(memory, "HISTORY_TURNS", 3)
+    messages = _conversation(5)
+    update = compact_history({"messages": messages})
+    removed = [m.id for m in update["messages"] if isinstance(m, RemoveMessage)]
+    assert removed == ["u0", "a0", "u1", "a1"]
+    assert "第 0 个问题" in update["history_summary"] and "第 1 个回答" in update["history_summary"]
+
+    compacted = add_messages(messages, update["messages"])
+    assert [m.id for m in compacted] == ["u2", "a2", "u3", "a3", "u4", "a4"]
+
+
+def test_history_size_stays_bounded_across_turns():
+    state = {"messages": [], "history_summary": ""}
+    sizes = []
+    for i in range(20):
+        state["messages"] = add_messages(state["messages"], [HumanMessage(content=f"问题 {i}", id=f"u{i}"),
+                                                             AIMessage(content=f"回答 {i}", id=f"a{i}")])
+        update = compact_history(state)
+        state["messages"] = add_messages(state["messages"], update.get("messages", []))
+        state["history_summary"] = update.get("history_summary", state["history_summary"])
+        sizes.append(len(state["messages"]))
+    assert max(sizes) == 2 * memory.HISTORY_TURNS
+    assert "问题 16" in state["history_summary"]
+
+
+def test_consumed_tool_results_become_stubs():
+    call = AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": "x"}, "id": "c1"}], id="a0")
+    result = ToolMessage(content="很长的搜索结果" * 100, tool_call_id="c1", name="search_tool", id="t0")
+    messages = [HumanMessage(content="问题", id="u0"), call, result]
+
+    assert "messages" not in compact_history({"messages": messages}, consumed=False)
+    stub = compact_history({"messages": messages})["messages"][0]
+    assert stub.id == "t0" and stub.content.startswith(memory.STUB_PREFIX)
+    # 已经替换过的占位不再重复替换
+    assert "messages" not in compact_history({"messages": messages[:2] + [stub]})
+
+
+def test_current_user_message_kept_when_turn_is_long(monkeypatch):
+    monkeypatch.setattr(memory, "HISTORY_MESSAGES", 4)
+    messages = [HumanMessage(content="当前问题", id="u0")] + [AIMessage(content=f"步骤 {i}", id=f"a{i}") for i in range(10)]
+    window = history_messages({"messages": messages})
+    assert isinstance(window[0], SystemMessage) and "步骤 0" in window[0].content
+    assert window[1].id == "u0"
+    assert [m.id for m in window[2:]] == ["a6", "a7", "a8", "a9"]
+    assert latest_user_message({"messages": messages}) == "当前问题"
+
+
+def test_summary_is_capped(monkeypatch):
+    monkeypatch.setattr(memory, "SUMMARY_CHARS", 200)
+    summary = summarize_messages(_conversation(50))
+    assert len(summary) <= 200
+    assert summary.startswith("- ") and "第 49 个回答" in summary
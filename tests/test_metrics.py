@@ -0,0 +1,71 @@
+"""utils/metrics.py：运行指标汇总与 Prometheus 文本文件"""
+
+import json
+import logging
+
+import pytest
+
+from benchmarks.run_pipeline import _main_state
+from graph import build_graph
+from tools.tools import search_tool
+from utils.metrics import (
+    JSONFormatter, MetricsCallbackHandler, MetricsRegistry, flush_metrics, get_metrics, metrics_logger,
+)
+from utils.registry import get_llm, get_llm_with_tools
+
+
+@pytest.fixture
+def metrics_log():
+    """把指标日志收集到列表中"""
+    records = []
+
+    class Collect(logging.Handler):
+        def emit(self, record):
+            records.append(json.loads(JSONFormatter().format(record)))
+
+    handler = Collect()
+    level = metrics_logger.level
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.INFO)
+    get_metrics().reset()
+    try:
+        yield records
+    finally:
+        metrics_logger.removeHandler(handler)
+        metrics_logger.setLevel(level)
+        get_metrics().reset()
+
+
+def test_pipeline_run_records_nodes_llm_calls_and_tools(offline, metrics_log, tmp_path):
+    metrics = MetricsCallbackHandler()
+    graph = build_graph(get_llm_with_tools("fake", [search_tool]), get_llm("fake"))
+    graph.invoke(_main_state(), config={"callbacks": [metrics], "recursion_limit": 100})
+
+    summary = metrics.summary()
+    assert {"generate_requirements", "generate_design", "generate_tasks", "generate_code"} <= set(summary["nodes"])
+    assert summary["llm"]["calls"] == offline.summary()["calls"]
+    assert summary["llm"]["prompt_tokens"] > 0 and summary["llm"]["completion_tokens"] > 0
+
+    events = {record["event"] for record in metrics_log}
+    assert {"node", "llm", "tool", "cache"} <= events
+    llm_nodes = {record["node"] for record in metrics_log if record["event"] == "llm"}
+    assert "generate_design" in llm_nodes
+
+    path = flush_metrics(str(tmp_path / "metrics" / "autospec.prom"))
+    text = open(path, encoding="utf-8").read()
+    assert '# TYPE autospec_node_seconds histogram' in text
+    assert 'autospec_tool_calls_total{status="ok",tool="search_tool"}' in text
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.inc("autospec_llm_calls_total", node="generate_design", model="qwen3:8b")
+    registry.inc("autospec_llm_calls_total", node="generate_design", model="qwen3:8b")
+    registry.observe("autospec_tool_seconds", 0.3, tool='say "hi"')
+    text = registry.render()
+    assert 'autospec_llm_calls_total{model="qwen3:8b",node="generate_design"} 2' in text
+    assert 'autospec_tool_seconds_bucket{tool="say \\"hi\\"",le="0.25"} 0' in text
+    assert 'autospec_tool_seconds_bucket{tool="say \\"hi\\"",le="0.5"} 1' in text
+    assert 'autospec_tool_seconds_count{tool="say \\"hi\\""} 1' in text
+    # 没有数据的指标不输出
+    assert "autospec_node_seconds" not in text
@@ -0,0 +1,50 @@
+"""utils/model_routing.py 与备用链的流式缓存"""
+
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps
+from langchain_core.messages import convert_to_messages
+
+from benchmarks.fake_llm import FakeChatModel, FakeLLMStats
+from utils.llm_cache import SQLiteLLMCache
+from utils.model_routing import ModelRouter
+from utils.streaming import stream_generate
+
+
+MESSAGES = [{"role": "user", "content": "请生成一份详细的需求文档"}]
+
+
+class BrokenChatModel(FakeChatModel):
+    """流式调用总是失败的假模型（例如模型未下载）"""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("model not found")
+        yield
+
+
+def test_routes_inherit_default_and_fallback_params():
+    router = ModelRouter({
+        "default": {"model": "base", "temperature": 0.7},
+        "routes": {"generate_code": {"model": "coder", "temperature": 0.2, "fallbacks": ["base", {"model": "small", "num_ctx": 4096}]}},
+    })
+    assert router.specs("generate_code") == [
+        {"model": "coder", "temperature": 0.2},
+        {"model": "base", "temperature": 0.2},
+        {"model": "small", "temperature": 0.2, "num_ctx": 4096},
+    ]
+    assert router.specs("generate_design") == [{"model": "base", "temperature": 0.7}]
+
+
+def test_fallback_response_cached_under_fallback_key(tmp_path, offline):
+    cache = SQLiteLLMCache(str(tmp_path / "llm_cache.sqlite"))
+    set_llm_cache(cache)
+    try:
+        primary = BrokenChatModel(model="coder-30b", stats=offline)
+        fallback = FakeChatModel(model="llama-8b", stats=offline)
+        response = stream_generate("generate_requirements", primary.with_fallbacks([fallback]), MESSAGES,
+                                   path=str(tmp_path / "requirements.md"))
+        assert response.content.startswith("# 需求文档")
+        prompt = dumps(convert_to_messages(MESSAGES))
+        assert cache.lookup(prompt, primary._get_llm_string()) is None
+        assert cache.lookup(prompt, fallback._get_llm_string())[0].message.content == response.content
+    finally:
+        set_llm_cache(None)
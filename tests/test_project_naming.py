@@ -0,0 +1,38 @@
+"""utils/project_naming.py：本地命名与目录分配"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.project_naming import DEFAULT_PROJECT_NAME, allocate_project_dir, local_project_name, sanitize_project_name, slugify_request
+
+
+def test_slugify_translates_and_orders_words():
+    assert slugify_request("开发一个待办事项应用") == "TodoApp"
+    assert slugify_request("写个博客系统") == "BlogSystem"
+    assert slugify_request("Build a todo app for my team") == "TodoTeamApp"
+    assert slugify_request("帮我做一个简单的东西") == ""
+
+
+def test_local_name_falls_back_to_default():
+    assert local_project_name("帮我做一个简单的东西") == DEFAULT_PROJECT_NAME
+
+
+def test_sanitize_model_names():
+    assert sanitize_project_name("  My Cool/App!!  ") == "MyCoolApp"
+    assert sanitize_project_name("2048Game") == "Project2048Game"
+    assert sanitize_project_name("") == DEFAULT_PROJECT_NAME
+
+
+def test_allocation_adds_suffixes(tmp_path):
+    base = str(tmp_path)
+    first = allocate_project_dir("TodoApp", base)
+    second = allocate_project_dir("TodoApp", base)
+    third = allocate_project_dir("TodoApp", base)
+    assert [os.path.basename(path) for path in (first, second, third)] == ["TodoApp", "TodoApp_1", "TodoApp_2"]
+
+
+def test_concurrent_allocation_is_unique(tmp_path):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(lambda _: allocate_project_dir("TodoApp", str(tmp_path)), range(32)))
+    assert len(set(paths)) == 32
+    assert all(os.path.isdir(path) for path in paths)
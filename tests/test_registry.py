@@ -0,0 +1,79 @@
+"""utils/registry.py：模型客户端与已编译图的复用"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import registry
+from utils.registry import get_graph, get_llm, get_llm_with_tools, pin_model_options, set_llm_factory
+
+
+class Client:
+    def __init__(self, model, **params):
+        self.model = model
+        self.params = params
+
+    def bind_tools(self, tools):
+        return ("bound", self, tuple(tools))
+
+
+class NamedTool:
+    def __init__(self, name):
+        self.name = name
+
+
+@pytest.fixture
+def created():
+    clients = []
+
+    def factory(model, **params):
+        clients.append(Client(model, **params))
+        return clients[-1]
+
+    set_llm_factory(factory)
+    try:
+        yield clients
+    finally:
+        pin_model_options("qwen3:8b")
+        set_llm_factory(None)
+
+
+def test_same_config_reuses_client(created):
+    assert get_llm("qwen3:8b", temperature=0) is get_llm("qwen3:8b", temperature=0)
+    assert get_llm("qwen3:8b", temperature=0.5) is not get_llm("qwen3:8b", temperature=0)
+    assert len(created) == 2
+
+
+def test_tool_binding_reuses_underlying_client(created):
+    search = NamedTool("search_tool")
+    bound = get_llm_with_tools("qwen3:8b", [search])
+    assert get_llm_with_tools("qwen3:8b", [search]) is bound
+    assert bound[1] is get_llm("qwen3:8b")
+    assert len(created) == 1
+
+
+def test_pinned_options_override_call_params(created):
+    pin_model_options("qwen3:8b", num_ctx=8192, keep_alive="30m")
+    llm = get_llm("qwen3:8b", num_ctx=2048)
+    assert llm.params == {"num_ctx": 8192, "keep_alive": "30m"}
+    assert get_llm("qwen3:8b") is llm
+
+
+def test_graph_compiled_once_across_threads(created):
+    builds = []
+
+    def builder():
+        builds.append(1)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        graphs = list(executor.map(lambda _: get_graph("main", builder), range(32)))
+    assert len(builds) == 1
+    assert all(graph is graphs[0] for graph in graphs)
+
+
+def test_factory_change_clears_registry(created):
+    get_graph("main", object)
+    get_llm("qwen3:8b")
+    set_llm_factory(Client)
+    assert not registry._graphs and not registry._llms
@@ -0,0 +1,69 @@
+"""utils/request_index.py：近似需求查找、按 base_dir 隔离与整条流水线的复用"""
+
+import os
+import sqlite3
+
+from benchmarks.run_pipeline import _main_state
+from graph import build_graph
+from tools.tools import search_tool
+from utils.registry import get_llm, get_llm_with_tools
+from utils.request_index import RequestIndex, minhash, grams, normalize_request
+
+
+def test_filler_words_do_not_change_normalized_request():
+    assert normalize_request("做一个待办事项应用") == normalize_request("帮我创建一个简单的待办事项应用吧！")
+
+
+def test_search_finds_near_duplicates_only(tmp_path):
+    index = RequestIndex(str(tmp_path / "index.sqlite"))
+    index.add("创建一个待办事项应用，支持添加和删除任务", str(tmp_path / "Todo"))
+    index.add("开发一个博客系统，支持文章发布与评论", str(tmp_path / "Blog"))
+
+    matches = index.search("创建待办事项应用，支持添加、删除任务", threshold=0.8)
+    assert [os.path.basename(match.project_dir) for match in matches] == ["Todo"]
+    assert not index.search("写一个天气查询命令行工具", threshold=0.8)
+
+
+def test_entries_are_scoped_by_base_dir(tmp_path):
+    index = RequestIndex(str(tmp_path / "index.sqlite"))
+    alice, bob = str(tmp_path / "alice"), str(tmp_path / "bob")
+    index.add("待办事项应用", os.path.join(alice, "Todo"), base_dir=alice)
+    index.add("待办事项应用", os.path.join(bob, "Todo"), base_dir=bob)
+
+    assert len(index) == 2
+    assert [match.project_dir for match in index.search("待办事项应用", base_dir=alice)] == [os.path.join(alice, "Todo")]
+    assert not index.search("待办事项应用", base_dir=str(tmp_path / "carol"))
+    # 重新打开时从数据库载入
+    reopened = RequestIndex(str(tmp_path / "index.sqlite"))
+    assert [match.project_dir for match in reopened.search("待办事项应用", base_dir=bob)] == [os.path.join(bob, "Todo")]
+
+
+def test_old_index_is_migrated_to_base_dir_scopes(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    project = str(tmp_path / "work" / "Todo")
+    normalized = normalize_request("待办事项应用")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE requests (id INTEGER PRIMARY KEY, normalized TEXT UNIQUE, text TEXT, "
+                     "project_dir TEXT, signature BLOB, created REAL)")
+        conn.execute("INSERT INTO requests(normalized, text, project_dir, signature, created) VALUES (?, ?, ?, ?, 0)",
+                     (normalized, "待办事项应用", project, minhash(grams(normalized)).tobytes()))
+
+    index = RequestIndex(path)
+    assert [match.project_dir for match in index.search("待办事项应用", base_dir=str(tmp_path / "work"))] == [project]
+
+
+def test_near_duplicate_request_reuses_finished_project(offline):
+    graph = build_graph(get_llm_with_tools("fake", [search_tool]), get_llm("fake"))
+    first = graph.invoke(_main_state(), config={"recursion_limit": 100})
+
+    offline.reset()
+    state = _main_state()
+    state["messages"] = [{"role": "user", "content": "帮我做一个待办事项应用，支持添加、完成和删除任务"}]
+    state["reuse_policy"] = "reuse"
+    second = graph.invoke(state, config={"recursion_limit": 100})
+
+    assert second["new_dir"] == second["reused_from"] == os.path.abspath(first["new_dir"])
+    assert second["code_content"] == first["code_content"]
+    # 所有阶段都已完成，不再调用生成文档或代码的模型
+    kinds = set(offline.summary()["by_kind"])
+    assert not kinds & {"requirements", "design", "tasks", "task_code", "code"}
@@ -0,0 +1,75 @@
+"""tools/search_backend.py：HTTP 后端的重试、Retry-After 与连接复用（使用本地替身服务）"""
+
+import time
+from email.utils import formatdate
+
+import pytest
+
+from tools.search_backend import HTTPSearchBackend, SearchBackendError, TokenBucket
+from tools.stand_in_search_server import serve_in_thread
+
+
+@pytest.fixture
+def stand_in():
+    server = serve_in_thread()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_search_formats_results_and_reuses_connections(stand_in):
+    backend = HTTPSearchBackend(stand_in.url, pool_size=2, rate=1000, burst=100)
+    try:
+        for _ in range(5):
+            assert "fastapi - 结果 1" in backend.search("fastapi")
+        assert stand_in.requests == 5
+        # 顺序请求只需要一个长连接
+        assert backend._pool.qsize() == 1
+    finally:
+        backend.close()
+
+
+def test_retries_then_raises_on_persistent_errors(stand_in):
+    stand_in.error_rate = 1.0
+    backend = HTTPSearchBackend(stand_in.url, rate=1000, burst=100, max_retries=2, backoff_max=0.01)
+    with pytest.raises(SearchBackendError):
+        backend.search("django")
+    assert stand_in.requests == 3
+
+
+def test_unknown_path_is_not_retried(stand_in):
+    backend = HTTPSearchBackend(stand_in.url, path="/missing", rate=1000, burst=100, max_retries=3)
+    with pytest.raises(SearchBackendError, match="404"):
+        backend.search("flask")
+    assert stand_in.requests == 0
+
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    parse = HTTPSearchBackend._parse_retry_after
+    assert parse("2") == 2.0
+    assert parse("-1") == 0.0
+    assert parse("soon") is None
+    assert parse(None) is None
+    assert 25 <= parse(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse(formatdate(time.time() - 30, usegmt=True)) == 0.0
+
+
+def test_backoff_caps_server_retry_after(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, "sleep", slept.append)
+    backend = HTTPSearchBackend("http://127.0.0.1:1", backoff_base=0.2, backoff_max=1.0)
+    backend._backoff(0, retry_after=3600)
+    backend._backoff(10)
+    assert slept[0] == 1.0
+    assert 0 <= slept[1] <= 1.0
+
+
+def test_token_bucket_limits_rate_after_burst():
+    bucket = TokenBucket(rate=50, burst=2)
+    started = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # 前 2 个令牌立即可用，其余 5 个按每秒 50 个补充
+    assert time.monotonic() - started >= 0.09
@@ -0,0 +1,63 @@
+"""tools/search_cache.py：缓存键、过期清理与并发合并"""
+
+import sqlite3
+import threading
+import time
+
+from tools.search_cache import SearchCache
+
+
+def test_same_query_is_cached_after_normalization(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+    fetch = lambda q: calls.append(q) or f"result for {q}"
+    assert cache.search("FastAPI  教程", fetch, backend="baidu") == "result for FastAPI  教程"
+    assert cache.search(" fastapi 教程 ", fetch, backend="baidu") == "result for FastAPI  教程"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_backends_are_cached_separately(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    assert cache.search("flask", lambda q: "from baidu", backend="baidu") == "from baidu"
+    assert cache.search("flask", lambda q: "from http", backend="http") == "from http"
+    assert cache.search("flask", lambda q: "unused", backend="baidu") == "from baidu"
+
+
+def test_expired_entries_are_purged_on_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SearchCache(path, ttl=60)
+    cache.search("old", lambda q: "stale", backend="baidu")
+    cache.search("new", lambda q: "fresh", backend="baidu")
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE search_cache SET created = ? WHERE query = 'baidu:old'", (time.time() - 120,))
+
+    SearchCache(path, ttl=60)
+    with sqlite3.connect(path) as conn:
+        rows = [row[0] for row in conn.execute("SELECT query FROM search_cache")]
+    assert rows == ["baidu:new"]
+
+
+def test_concurrent_identical_queries_are_coalesced(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch(query):
+        calls.append(query)
+        release.wait(5)
+        return "shared"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.search("django", slow_fetch, backend="baidu")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["misses"] + cache.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["shared"] * 4
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 3
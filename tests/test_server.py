@@ -0,0 +1,71 @@
+"""server.py：准入控制与会话隔离"""
+
+import asyncio
+import os
+
+from graph import build_graph
+from server import Service
+from tools.tools import search_tool
+from utils.concurrency import InFlightLimiter, LimitedLLM
+from utils.registry import get_llm
+
+
+REQUEST = "开发一个待办事项应用"
+
+
+def _service(workspace, **kwargs):
+    limiter = InFlightLimiter(4)
+    llm = LimitedLLM(get_llm("fake"), limiter)
+    return Service(build_graph(llm.bind_tools([search_tool]), llm), limiter, str(workspace), **kwargs)
+
+
+async def _run(service, payload):
+    status, body, run = service.submit(payload)
+    assert status == 202, body
+    dispatcher = asyncio.ensure_future(service.dispatch())
+    try:
+        for _ in range(600):
+            if run.finished is not None:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        dispatcher.cancel()
+    assert run.status == "done", run.error
+    return run.result
+
+
+def test_reuse_does_not_cross_users(offline, tmp_path):
+    workspace = tmp_path / "workspace"
+
+    async def scenario():
+        service = _service(workspace)
+        alice = await _run(service, {"input": REQUEST, "user": "alice"})
+        bob_reuse = await _run(service, {"input": REQUEST, "user": "bob", "reuse_policy": "reuse"})
+        bob_fork = await _run(service, {"input": REQUEST, "user": "bob", "reuse_policy": "fork"})
+        alice_again = await _run(service, {"input": REQUEST, "user": "alice", "reuse_policy": "reuse"})
+        return alice, bob_reuse, bob_fork, alice_again
+
+    alice, bob_reuse, bob_fork, alice_again = asyncio.run(scenario())
+    alice_dir = os.path.abspath(alice["new_dir"])
+    assert alice_dir.startswith(str(workspace / "alice"))
+    # bob 的需求与 alice 相同，但不能复用或复制 alice 的项目
+    assert bob_reuse["reused_from"] is None
+    assert os.path.abspath(bob_reuse["new_dir"]).startswith(str(workspace / "bob"))
+    assert bob_fork["reused_from"] is None or os.path.dirname(bob_fork["reused_from"]) == str(workspace / "bob")
+    # 同一用户的相同需求仍然复用自己的项目
+    assert alice_again["reused_from"] == alice_dir
+
+
+def test_admission_rejects_bad_requests(offline, tmp_path):
+    async def scenario():
+        service = _service(tmp_path / "workspace", user_queue=1)
+        results = [
+            service.submit({"input": ""})[0],
+            service.submit({"input": REQUEST, "user": "../etc"})[0],
+            service.submit({"input": REQUEST, "reuse_policy": "steal"})[0],
+            service.submit({"input": REQUEST, "user": "carol"})[0],
+            service.submit({"input": REQUEST, "user": "carol"})[0],
+        ]
+        return results
+
+    assert asyncio.run(scenario()) == [400, 400, 400, 202, 429]
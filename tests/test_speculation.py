@@ -0,0 +1,94 @@
+"""utils/tool_decision.py：speculative 模式下探测与生成同时进行"""
+
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from benchmarks.run_pipeline import _main_state
+from graph import build_graph
+from tools.tools import search_tool
+from utils.registry import get_llm, get_llm_with_tools
+from utils.tool_decision import aspeculate, reset_speculation_stats, speculate, speculation_stats
+
+TOOL_CALL = AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": "待办"}, "id": "call_1"}])
+
+
+class SlowProbe:
+    """等待 delay 秒后返回给定的探测结果"""
+
+    def __init__(self, response, delay=0.1):
+        self.response = response
+        self.delay = delay
+
+    def invoke(self, messages):
+        time.sleep(self.delay)
+        return self.response
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.delay)
+        return self.response
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    reset_speculation_stats()
+    yield
+    reset_speculation_stats()
+
+
+def test_output_held_until_probe_declines_tools():
+    output = []
+
+    def work(gate):
+        gate.run(output.append, "第一段")
+        # 探测尚未结束，输出暂存在闸门中
+        assert output == []
+        return "设计文档"
+
+    tool_response, result = speculate("generate_design", {}, SlowProbe(AIMessage(content="不需要")), [], work)
+    assert tool_response is None and result == "设计文档"
+    assert output == ["第一段"]
+    assert speculation_stats()["generate_design"]["hits"] == 1
+
+
+def test_output_discarded_when_probe_requests_tool():
+    output = []
+
+    def work(gate):
+        gate.run(output.append, "第一段")
+        time.sleep(0.2)
+        gate.run(output.append, "第二段")
+        return "设计文档"
+
+    tool_response, result = speculate("generate_design", {}, SlowProbe(TOOL_CALL), [], work)
+    assert tool_response is TOOL_CALL and result is None
+    assert output == []
+    assert speculation_stats()["generate_design"]["misses"] == 1
+
+
+def test_async_generation_cancelled_when_probe_requests_tool():
+    cancelled = []
+
+    async def work(gate):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    started = time.perf_counter()
+    tool_response, result = asyncio.run(aspeculate("generate_design", {}, SlowProbe(TOOL_CALL), [], work))
+    assert tool_response is TOOL_CALL and result is None
+    assert cancelled and time.perf_counter() - started < 5
+
+
+def test_speculative_pipeline_records_hits_and_misses(offline, monkeypatch):
+    monkeypatch.setenv("AUTOSPEC_TOOL_MODE", "speculative")
+    graph = build_graph(get_llm_with_tools("fake", [search_tool]), get_llm("fake"))
+    result = graph.invoke(_main_state(), config={"recursion_limit": 100})
+    assert result["code_content"]
+    design = speculation_stats()["generate_design"]
+    # 第一次探测请求搜索（丢弃推测生成），拿到结果后的探测不再需要工具
+    assert design["misses"] == 1 and design["hits"] == 1
@@ -0,0 +1,60 @@
+"""utils/streaming.py：流式写入、事件消费者与推测生成的闸门"""
+
+import asyncio
+
+from benchmarks.fake_llm import FakeChatModel, FakeLLMStats
+from tools.tools import search_tool
+from utils.streaming import SpeculationGate, astream_generate, reset_token_sink, set_token_sink, stream_generate
+
+
+MESSAGES = [{"role": "user", "content": "请生成一份详细的需求文档"}]
+
+
+def _collect():
+    events = []
+    return events, set_token_sink(lambda node, event, data: events.append((event, data)))
+
+
+def test_tokens_streamed_to_sink_and_file(tmp_path):
+    path = tmp_path / ".kiro" / "requirements.md"
+    events, token = _collect()
+    try:
+        response = stream_generate("generate_requirements", FakeChatModel(stats=FakeLLMStats()), MESSAGES, str(path))
+    finally:
+        reset_token_sink(token)
+    assert path.read_text(encoding="utf-8") == response.content
+    assert "".join(data for event, data in events if event == "token") == response.content
+    assert [event for event, _ in events if event != "token"] == ["start", "first_token", "end"]
+    assert events[-1][1]["chars"] == len(response.content)
+
+
+def test_tool_call_response_leaves_document_intact(tmp_path):
+    path = tmp_path / "design.md"
+    path.write_text("# 已有的设计文档\n", encoding="utf-8")
+    llm = FakeChatModel(stats=FakeLLMStats()).bind_tools([search_tool])
+    events, token = _collect()
+    try:
+        response = stream_generate("generate_design", llm, MESSAGES, str(path))
+        aresponse = asyncio.run(astream_generate("generate_design", llm, MESSAGES + [{"role": "user", "content": "异步"}], str(path)))
+    finally:
+        reset_token_sink(token)
+    assert response.tool_calls and aresponse.tool_calls
+    assert path.read_text(encoding="utf-8") == "# 已有的设计文档\n"
+
+
+def test_gate_buffers_until_open_and_drops_on_discard():
+    output = []
+    kept = SpeculationGate()
+    kept.run(output.append, "a")
+    kept.run(output.append, "b")
+    assert output == []
+    kept.open()
+    kept.run(output.append, "c")
+    assert output == ["a", "b", "c"]
+
+    dropped = SpeculationGate()
+    dropped.run(output.append, "x")
+    dropped.discard()
+    dropped.run(output.append, "y")
+    dropped.open()
+    assert dropped.discarded and output == ["a", "b", "c"]
@@ -0,0 +1,45 @@
+"""utils/task_dag.py：任务解析与拓扑序"""
+
+from utils.task_dag import Task, parse_tasks, topological_order
+
+
+def _tasks(deps):
+    tasks = []
+    for task_id, task_deps in deps:
+        task = Task(task_id, task_id)
+        task.deps = list(task_deps)
+        tasks.append(task)
+    return tasks
+
+
+def _ids(tasks):
+    return [task.id for task in tasks]
+
+
+def test_parse_tasks_reads_dependencies():
+    content = "## 任务\n### T1 数据模型\n依赖任务：无\n### T2 接口\n依赖任务：T1\n### T3 页面\n依赖任务：T1、T2、T9\n"
+    tasks = parse_tasks(content)
+    assert _ids(tasks) == ["T1", "T2", "T3"]
+    assert [task.deps for task in tasks] == [[], ["T1"], ["T1", "T2"]]
+
+
+def test_order_follows_dependencies():
+    tasks = _tasks([("T1", ["T3"]), ("T2", []), ("T3", ["T2"])])
+    assert _ids(topological_order(tasks)) == ["T2", "T3", "T1"]
+
+
+def test_cycle_broken_on_cycle_not_downstream():
+    # T1 只是环 T2 <-> T3 的下游，不能丢掉它的依赖
+    tasks = _tasks([("T1", ["T2"]), ("T2", ["T3"]), ("T3", ["T2"])])
+    order = topological_order(tasks)
+    assert _ids(order)[0] == "T2"
+    assert tasks[0].deps == ["T2"]
+    assert tasks[1].deps == []
+    position = {task.id: i for i, task in enumerate(order)}
+    for task in order:
+        assert all(position[dep] < position[task.id] for dep in task.deps)
+
+
+def test_self_contained_cycle():
+    tasks = _tasks([("T1", ["T2"]), ("T2", ["T1"]), ("T3", ["T1"])])
+    assert _ids(topological_order(tasks)) == ["T1", "T2", "T3"]
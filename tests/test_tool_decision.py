@@ -0,0 +1,79 @@
+"""utils/tool_decision.py 与 utils/budget.py：调用模式、工具调用结果与调用上限"""
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from utils import budget
+from utils.budget import run_budget, tool_iteration_update, tools_allowed
+from utils.prompt_layout import PROBE_INSTRUCTION, prompt_messages, tool_probe_messages
+from utils.tool_decision import invoke_with_tools, set_call_mode
+
+
+MESSAGES = prompt_messages("请生成一份详细的设计文档。", "需求：待办事项应用")
+TOOL_CALL = AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": "待办"}, "id": "call_1"}])
+TOOL_RESULT = ToolMessage(content="搜索结果", tool_call_id="call_1")
+
+
+class RecordingLLM:
+    """记录收到的消息，按给定的顺序返回响应"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(list(messages))
+        return self.responses.pop(0) if self.responses else AIMessage(content="设计文档")
+
+
+def _after_tool_round():
+    return {"messages": [{"role": "user", "content": "需求"}, TOOL_CALL, TOOL_RESULT]}
+
+
+def test_probe_and_generation_include_tool_results():
+    llm_with_tool, llm = RecordingLLM(AIMessage(content="不需要")), RecordingLLM()
+    tool_response, response = invoke_with_tools("generate_design", _after_tool_round(), llm_with_tool, llm,
+                                                tool_probe_messages(MESSAGES), MESSAGES)
+    assert tool_response is None and response.content == "设计文档"
+    probe = llm_with_tool.calls[0]
+    assert probe[-3:-1] == [TOOL_CALL, TOOL_RESULT]
+    assert probe[-1]["content"] == PROBE_INSTRUCTION
+    assert llm.calls[0][-2:] == [TOOL_CALL, TOOL_RESULT]
+
+
+def test_fused_mode_uses_one_call():
+    set_call_mode("generate_design", "fused")
+    try:
+        llm_with_tool, llm = RecordingLLM(), RecordingLLM()
+        tool_response, response = invoke_with_tools("generate_design", _after_tool_round(), llm_with_tool, llm,
+                                                    tool_probe_messages(MESSAGES), MESSAGES)
+    finally:
+        set_call_mode("generate_design", None)
+    assert tool_response is None and response.content == "设计文档"
+    assert len(llm_with_tool.calls) == 1 and not llm.calls
+    assert llm_with_tool.calls[0][-2:] == [TOOL_CALL, TOOL_RESULT]
+
+
+def test_probe_tool_call_returned_without_generation():
+    llm_with_tool, llm = RecordingLLM(TOOL_CALL), RecordingLLM()
+    tool_response, response = invoke_with_tools("generate_design", {"messages": []}, llm_with_tool, llm,
+                                                tool_probe_messages(MESSAGES), MESSAGES)
+    assert tool_response is TOOL_CALL and response is None and not llm.calls
+
+
+def test_tool_iterations_capped(monkeypatch):
+    monkeypatch.setattr(budget, "MAX_TOOL_ITERATIONS", 2)
+    state = {"tool_iterations": {}}
+    allowed = []
+    for _ in range(3):
+        allowed.append(tools_allowed("generate_design", state))
+        state["tool_iterations"].update(tool_iteration_update(state, "generate_design")["tool_iterations"])
+    assert allowed == [True, True, False]
+
+
+def test_exhausted_run_budget_skips_tools():
+    with run_budget(seconds=0, tokens=100) as current:
+        assert tools_allowed("generate_design", {})
+        current.charge(100)
+        assert not tools_allowed("generate_design", {})
+        report = current.report({"generate_design": 1})
+    assert report["exhausted"] and "generate_design" in report["forced_no_tool"]
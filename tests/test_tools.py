@@ -0,0 +1,62 @@
+"""tools/tools.py：并发工具调用与单个工具的超时"""
+
+import asyncio
+import time
+
+from langchain_core.tools import tool
+
+from tools.tools import arun_tool_calls, run_tool_calls, stuck_tool_workers
+
+
+@tool
+def echo(text: str) -> str:
+    """原样返回"""
+    return text
+
+
+@tool
+def nap(seconds: float) -> str:
+    """等待若干秒"""
+    time.sleep(seconds)
+    return "醒了"
+
+
+@tool
+def broken(text: str) -> str:
+    """总是失败"""
+    raise RuntimeError("坏了")
+
+
+REGISTRY = {t.name: t for t in (echo, nap, broken)}
+
+
+def _call(name, i, **args):
+    return {"name": name, "args": args, "id": f"call_{i}"}
+
+
+def test_results_in_order_with_errors_and_bad_names():
+    calls = [_call("echo", 0, text="a"), _call("missing", 1), _call("broken", 2, text="x"), _call("echo", 3, text="b")]
+    messages = run_tool_calls(calls, REGISTRY)
+    assert [message.tool_call_id for message in messages] == ["call_0", "call_1", "call_2", "call_3"]
+    assert messages[0].content == "a" and messages[3].content == "b"
+    assert messages[1].content == "bad tool name, retry"
+    assert "调用失败" in messages[2].content
+
+
+def test_timeout_applies_per_tool_and_counts_stuck_workers():
+    # 5 个调用需要两批；截止时间按单个工具计算，不因批次放宽
+    calls = [_call("nap", 0, seconds=0.6)] + [_call("echo", i, text=str(i)) for i in range(1, 5)]
+    started = time.perf_counter()
+    messages = run_tool_calls(calls, REGISTRY, timeout=0.2)
+    assert time.perf_counter() - started < 0.5
+    assert "超时" in messages[0].content
+    assert [message.content for message in messages[1:]] == ["1", "2", "3", "4"]
+    assert stuck_tool_workers() == 1
+    time.sleep(0.6)
+    assert stuck_tool_workers() == 0
+
+
+def test_async_calls_time_out_individually():
+    calls = [_call("nap", 0, seconds=0.5), _call("echo", 1, text="ok")]
+    messages = asyncio.run(arun_tool_calls(calls, REGISTRY, timeout=0.1))
+    assert "超时" in messages[0].content and messages[1].content == "ok"
@@ -0,0 +1,75 @@
+"""nodes/work_report_node.py：后台汇报与按运行等待"""
+
+import asyncio
+import threading
+import time
+
+from nodes import work_report_node
+from nodes.work_report_node import areport_work, report_work, wait_for_work_reports, work_reports
+
+
+STATE = {"messages": [{"role": "user", "content": "开发一个待办应用"}]}
+
+
+def test_injected_report_fn_runs_in_background(monkeypatch):
+    monkeypatch.setattr(work_report_node, "BACKGROUND_REPORTS", True)
+    calls = []
+
+    def report_fn(state, content, doc_type, llm):
+        calls.append((content, doc_type, threading.current_thread().name))
+        return "汇报"
+
+    with work_reports() as futures:
+        message = report_work(STATE, "内容", "需求文档", llm=None, report_fn=report_fn)
+        wait_for_work_reports()
+    assert "后台" in message
+    assert futures[0].result() == "汇报"
+    assert calls[0][:2] == ("内容", "需求文档")
+    assert calls[0][2].startswith("work-report")
+
+
+def test_async_report_fn_passed_through_in_background(monkeypatch):
+    monkeypatch.setattr(work_report_node, "BACKGROUND_REPORTS", True)
+
+    async def report_fn(state, content, doc_type, llm):
+        await asyncio.sleep(0)
+        return f"{doc_type}汇报"
+
+    async def run():
+        with work_reports() as futures:
+            await areport_work(STATE, "内容", "设计文档", llm=None, report_fn=report_fn)
+            wait_for_work_reports()
+        return futures
+
+    futures = asyncio.run(run())
+    assert futures[0].result() == "设计文档汇报"
+
+
+def test_report_returned_inline_without_background(monkeypatch):
+    monkeypatch.setattr(work_report_node, "BACKGROUND_REPORTS", False)
+
+    async def areport_fn(state, content, doc_type, llm):
+        return "异步汇报"
+
+    assert report_work(STATE, "内容", "任务文档", None, lambda *args: "同步汇报") == "同步汇报"
+    assert asyncio.run(areport_work(STATE, "内容", "任务文档", None, areport_fn)) == "异步汇报"
+
+
+def test_wait_only_covers_current_run(monkeypatch):
+    monkeypatch.setattr(work_report_node, "BACKGROUND_REPORTS", True)
+
+    def slow(*args):
+        time.sleep(1.0)
+        return "慢"
+
+    with work_reports() as slow_futures:
+        report_work(STATE, "内容", "需求文档", None, slow)
+        with work_reports() as fast_futures:
+            report_work(STATE, "内容", "需求文档", None, lambda *args: "快")
+            started = time.perf_counter()
+            wait_for_work_reports()
+            assert time.perf_counter() - started < 0.5
+        assert fast_futures[0].done()
+        assert not slow_futures[0].done()
+        wait_for_work_reports()
+    assert slow_futures[0].result() == "慢"
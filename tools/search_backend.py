@@ -0,0 +1,233 @@
+"""
+可插拔的搜索后端
+
+search_tool 通过 get_search_backend() 获取后端，由环境变量选择：
+    AUTOSPEC_SEARCH_BACKEND=baidu   使用 baidu_api.ai_search（默认，需要自行提供该模块）
+    AUTOSPEC_SEARCH_BACKEND=http    使用 HTTP 搜索服务，地址由 AUTOSPEC_SEARCH_URL 指定（默认 http://127.0.0.1:8790，
+                                    与替身服务的默认端口一致，避开 server.py 的 8765）
+
+HTTPSearchBackend 复用长连接（连接池），用令牌桶限制请求速率，
+对 429 / 5xx / 连接错误按带抖动的指数退避重试（Retry-After 可以是秒数或 HTTP 日期，等待时间不超过 backoff_max）。
+本地可以用 tools/stand_in_search_server.py 启动替身服务进行离线测试。
+"""
+
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode, urlsplit
+
+
+DEFAULT_SEARCH_URL = "http://127.0.0.1:8790"
+
+
+class SearchBackendError(Exception):
+    """搜索后端请求失败"""
+
+
+class SearchBackend:
+    """搜索后端接口"""
+
+    name = "base"
+
+    def search(self, query):
+        """返回搜索结果文本"""
+        raise NotImplementedError
+
+    def close(self):
+        """释放后端持有的资源"""
+
+
+class BaiduSearchBackend(SearchBackend):
+    """调用 baidu_api.ai_search 的后端"""
+
+    name = "baidu"
+
+    def __init__(self):
+        # 延迟导入，未安装 baidu_api 时其他后端仍可使用
+        from baidu_api import ai_search
+
+        self._ai_search = ai_search
+
+    def search(self, query):
+        return self._ai_search(query)
+
+
+class TokenBucket:
+    """令牌桶限速：每秒补充 rate 个令牌，最多累积 burst 个"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，不足时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HTTPSearchBackend(SearchBackend):
+    """基于 HTTP 的搜索后端，带连接池、令牌桶限速与抖动退避重试
+
+    服务约定：GET <path>?q=<query>，返回 JSON，
+    包含 "answer"（文本）或 "results"（[{"title", "snippet", "url"}]）。
+    """
+
+    name = "http"
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, path="/search", pool_size=8, rate=5.0, burst=10,
+                 max_retries=3, backoff_base=0.2, backoff_max=5.0, timeout=10.0):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port
+        self.path = (parts.path.rstrip("/") or "") + path
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _checkin(self, conn, reusable):
+        if reusable:
+            self._pool.put_nowait(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    @staticmethod
+    def _parse_retry_after(value):
+        """解析 Retry-After（秒数或 HTTP 日期，RFC 9110），无法解析时返回 None（按普通退避等待）"""
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    def _backoff(self, attempt, retry_after=None):
+        """指数退避加全抖动；服务给出的 Retry-After 同样不超过 backoff_max"""
+        if retry_after is not None:
+            delay = min(retry_after, self.backoff_max)
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        time.sleep(delay)
+
+    def _request(self, query):
+        """发出一次请求，返回 (status, body, retry_after)"""
+        conn = self._checkout()
+        reusable = False
+        try:
+            conn.request("GET", f"{self.path}?{urlencode({'q': query})}", headers={"Connection": "keep-alive"})
+            response = conn.getresponse()
+            body = response.read()
+            reusable = not response.will_close
+            retry_after = response.getheader("Retry-After")
+            return response.status, body, self._parse_retry_after(retry_after)
+        finally:
+            self._checkin(conn, reusable)
+
+    @staticmethod
+    def _format(body):
+        data = json.loads(body.decode("utf-8"))
+        if data.get("answer"):
+            return data["answer"]
+        lines = []
+        for item in data.get("results", []):
+            lines.append(f"{item.get('title', '')}\n{item.get('snippet', '')}\n{item.get('url', '')}".strip())
+        return "\n\n".join(lines)
+
+    def search(self, query):
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                status, body, retry_after = self._request(query)
+            except (OSError, http.client.HTTPException) as e:
+                last_error = e
+                retry_after = None
+            else:
+                if status == 200:
+                    return self._format(body)
+                last_error = SearchBackendError(f"HTTP {status}: {body[:200]!r}")
+                if status not in self.RETRY_STATUSES:
+                    break
+            if attempt < self.max_retries:
+                self._backoff(attempt, retry_after)
+        raise SearchBackendError(f"搜索请求失败: {last_error}")
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_search_backend(name=None):
+    """按名称创建搜索后端"""
+    name = (name or os.environ.get("AUTOSPEC_SEARCH_BACKEND", "baidu")).lower()
+    if name == "http":
+        return HTTPSearchBackend(
+            os.environ.get("AUTOSPEC_SEARCH_URL", DEFAULT_SEARCH_URL),
+            pool_size=int(os.environ.get("AUTOSPEC_SEARCH_POOL_SIZE", "8")),
+            rate=float(os.environ.get("AUTOSPEC_SEARCH_RATE", "5")),
+            burst=int(os.environ.get("AUTOSPEC_SEARCH_BURST", "10")),
+        )
+    if name == "baidu":
+        return BaiduSearchBackend()
+    raise ValueError(f"未知的搜索后端: {name}")
+
+
+def get_search_backend():
+    """获取进程内共享的搜索后端"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_search_backend()
+        return _backend
+
+
+def set_search_backend(backend):
+    """替换进程内共享的搜索后端"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
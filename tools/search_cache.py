@@ -0,0 +1,149 @@
+"""
+搜索结果缓存：按搜索后端和规范化查询持久化保存，带 TTL，并合并并发的相同查询
+
+多个节点在同一次运行及多次运行之间经常搜索相同的框架或库名称，
+缓存命中时直接返回；多个线程同时发起相同查询时只向上游发出一次请求，其余线程等待结果。
+不同后端的结果分开缓存，切换 AUTOSPEC_SEARCH_BACKEND 后不会读到其他后端的结果；打开缓存时清理过期条目。
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.metrics import record_cache
+
+DEFAULT_SEARCH_CACHE_PATH = os.environ.get("AUTOSPEC_SEARCH_CACHE", os.path.join(".autospec_cache", "search_cache.sqlite"))
+DEFAULT_SEARCH_TTL = float(os.environ.get("AUTOSPEC_SEARCH_TTL", str(7 * 24 * 3600)))
+
+
+def normalize_query(query):
+    """规范化查询：去除首尾空白、折叠空白并统一为小写"""
+    return re.sub(r"\s+", " ", str(query)).strip().lower()
+
+
+class SearchCache:
+    """带 TTL 的持久化搜索缓存，并合并进行中的相同查询"""
+
+    def __init__(self, path=DEFAULT_SEARCH_CACHE_PATH, ttl=DEFAULT_SEARCH_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache (query TEXT PRIMARY KEY, result TEXT, created REAL)"
+        )
+        self._conn.commit()
+        self.purge_expired()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT result, created FROM search_cache WHERE query = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def _put(self, key, result):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache(query, result, created) VALUES (?, ?, ?)",
+                (key, result, time.time()),
+            )
+            self._conn.commit()
+
+    def search(self, query, search_fn, backend=""):
+        """查询缓存，未命中时调用 search_fn(query)；相同查询进行中时等待其结果
+
+        backend 为搜索后端名称，作为缓存键的一部分。
+        """
+        key = f"{backend}:{normalize_query(query)}" if backend else normalize_query(query)
+        cached = self._get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            record_cache("search", "hit")
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        record_cache("search", "miss" if owner else "coalesced")
+        if not owner:
+            return future.result()
+
+        try:
+            result = search_fn(query)
+            result = result if isinstance(result, str) else str(result)
+            self._put(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def purge_expired(self):
+        """删除过期条目，返回删除数量"""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM search_cache WHERE created < ?", (time.time() - self.ttl,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self):
+        """返回命中统计，合并的请求也计为命中"""
+        with self._lock:
+            hits, misses, coalesced = self.hits, self.misses, self.coalesced
+        lookups = hits + misses + coalesced
+        return {
+            "hits": hits,
+            "misses": misses,
+            "coalesced": coalesced,
+            "hit_rate": round((hits + coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """获取进程内共享的搜索缓存"""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache()
+        return _search_cache
+
+
+def search_cache_report():
+    """格式化的命中率报告"""
+    stats = get_search_cache().stats()
+    return (f"[SEARCH_CACHE] 命中 {stats['hits']} 次，合并 {stats['coalesced']} 次，"
+            f"未命中 {stats['misses']} 次，命中率 {stats['hit_rate']:.1%}")
+
+
+def set_search_cache(cache):
+    """替换进程内共享的搜索缓存（基准测试时使用临时缓存）"""
+    global _search_cache
+    with _search_cache_lock:
+        _search_cache = cache
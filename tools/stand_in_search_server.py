@@ -0,0 +1,157 @@
+"""
+本地替身搜索服务，用于离线测试 HTTPSearchBackend 的吞吐与延迟
+
+启动服务：
+    python -m tools.stand_in_search_server serve --port 8790 --latency 0.05 --error-rate 0.05
+
+压测（在进程内启动服务并用 HTTPSearchBackend 并发请求）：
+    python -m tools.stand_in_search_server bench --requests 200 --concurrency 8 --rate 100
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from tools.search_backend import HTTPSearchBackend
+
+
+class StandInSearchHandler(BaseHTTPRequestHandler):
+    """返回固定格式搜索结果的请求处理器"""
+
+    protocol_version = "HTTP/1.1"  # 支持长连接
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path != "/search":
+            self._send(404, {"error": "not found"})
+            return
+        query = parse_qs(parts.query).get("q", [""])[0]
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, {"error": "overloaded"}, headers={"Retry-After": "0.05"})
+            return
+        self._send(200, {
+            "results": [
+                {"title": f"{query} - 结果 {i}", "snippet": f"关于 {query} 的替身搜索结果 {i}。", "url": f"https://example.com/{i}"}
+                for i in range(1, 4)
+            ]
+        })
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 压测时不输出访问日志
+        pass
+
+
+class StandInSearchServer(ThreadingHTTPServer):
+    """带可配置延迟与错误率的替身搜索服务"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0):
+        super().__init__(address, StandInSearchHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve_in_thread(port=0, latency=0.0, error_rate=0.0):
+    """在后台线程中启动替身服务，返回服务对象（用完调用 shutdown()）"""
+    server = StandInSearchServer(("127.0.0.1", port), latency=latency, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True, name="stand-in-search").start()
+    return server
+
+
+def run_bench(requests=200, concurrency=8, latency=0.02, error_rate=0.0, rate=100.0, pool_size=8):
+    """并发请求替身服务，返回吞吐与延迟统计"""
+    server = serve_in_thread(latency=latency, error_rate=error_rate)
+    backend = HTTPSearchBackend(server.url, pool_size=pool_size, rate=rate, burst=pool_size)
+    latencies = []
+    errors = 0
+
+    def one(i):
+        started = time.perf_counter()
+        backend.search(f"query {i % 20}")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(one, i) for i in range(requests)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - started
+    backend.close()
+    server.shutdown()
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "upstream_requests": server.requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2) if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地替身搜索服务")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="启动替身服务")
+    serve_parser.add_argument("--port", type=int, default=8790)
+    serve_parser.add_argument("--latency", type=float, default=0.05, help="平均响应延迟（秒）")
+    serve_parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例")
+    bench_parser = sub.add_parser("bench", help="压测 HTTPSearchBackend")
+    bench_parser.add_argument("--requests", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=8)
+    bench_parser.add_argument("--latency", type=float, default=0.02)
+    bench_parser.add_argument("--error-rate", type=float, default=0.0)
+    bench_parser.add_argument("--rate", type=float, default=100.0, help="令牌桶速率（请求/秒）")
+    bench_parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = StandInSearchServer(("127.0.0.1", args.port), latency=args.latency, error_rate=args.error_rate)
+        print(f"替身搜索服务已启动: {server.url}/search?q=...")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        result = run_bench(args.requests, args.concurrency, args.latency, args.error_rate, args.rate, args.pool_size)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
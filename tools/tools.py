@@ -1,13 +1,196 @@
+import asyncio
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import copy_context
 from langchain_core.tools import tool
-from baidu_api import ai_search
+from langchain_core.messages import ToolMessage
+from tools.search_cache import get_search_cache
+from tools.search_backend import get_search_backend
+from utils.metrics import record_tool
+
+logger = logging.getLogger("autospec.tools")
 
 @tool
 def search_tool(query: str) -> str:
-    """使用百度搜索获取信息"""
+    """使用网络搜索获取信息"""
     # 添加监控逻辑，记录输入
-    print(f"[SEARCH_TOOL] 输入: {query}")
-    result = ai_search(query)
+    logger.info(f"[SEARCH_TOOL] 输入: {query}")
+    # 相同查询优先使用缓存，并发的相同查询只向上游请求一次；后端由 AUTOSPEC_SEARCH_BACKEND 选择
+    backend = get_search_backend()
+    result = get_search_cache().search(query, backend.search, backend=backend.name)
     # 添加监控逻辑，记录输出
-    # print(f"[SEARCH_TOOL] 输出: {result}")
-    return result
\ No newline at end of file
+    logger.debug(f"[SEARCH_TOOL] 输出: {result}")
+    return result
+
+
+tools = [search_tool]
+tools_by_name = {tool.name: tool for tool in tools}
+
+# 工具调用并发度与单个工具的超时（秒，从工具开始执行时计算，排队时间不计入）
+TOOL_WORKERS = int(os.environ.get("AUTOSPEC_TOOL_WORKERS", "4"))
+TOOL_TIMEOUT = float(os.environ.get("AUTOSPEC_TOOL_TIMEOUT", "30"))
+
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool-call")
+# 线程无法被中断：超时的工具调用会继续占用工作线程直到返回，这里记录这类线程的数量
+_stuck_lock = threading.Lock()
+_stuck_workers = 0
+
+
+def stuck_tool_workers():
+    """超时后仍在运行、占用着工具线程池的调用数"""
+    with _stuck_lock:
+        return _stuck_workers
+
+
+def _mark_stuck(name, future):
+    """记录一个超时后仍在运行的调用，调用返回时释放计数"""
+    global _stuck_workers
+    with _stuck_lock:
+        _stuck_workers += 1
+        stuck = _stuck_workers
+    future.add_done_callback(_release_stuck)
+    level = logging.ERROR if stuck >= TOOL_WORKERS else logging.WARNING
+    logger.log(level, f"工具 {name} 超时后仍在运行，{stuck}/{TOOL_WORKERS} 个工具线程被超时的调用占用")
+
+
+def _release_stuck(future):
+    global _stuck_workers
+    with _stuck_lock:
+        _stuck_workers -= 1
+
+
+def _invoke_tool(t, registry):
+    """调用单个工具，工具名无效时提示模型重试"""
+    logger.debug(f"Calling: {t}")
+    tool = registry.get(t["name"])
+    if tool is None:  # check for bad tool name from LLM
+        logger.warning(f"bad tool name: {t['name']}")
+        record_tool(t["name"], 0.0, "bad_name")
+        return "bad tool name, retry"  # instruct LLM to retry if bad
+    started = time.perf_counter()
+    try:
+        result = tool.invoke(t["args"])
+    except Exception:
+        record_tool(t["name"], time.perf_counter() - started, "error")
+        raise
+    record_tool(t["name"], time.perf_counter() - started, "ok")
+    return result
+
+
+class _ToolCall:
+    """线程池中的一次工具调用，记录开始执行的时间"""
+
+    def __init__(self, t):
+        self.t = t
+        self.started = None
+
+    def run(self, registry):
+        self.started = time.monotonic()
+        return _invoke_tool(self.t, registry)
+
+
+def _timeout_message(t, timeout):
+    return f"工具 {t['name']} 调用超时（{timeout}s），请调整查询后重试"
+
+
+def _wait_tool(call, future, timeout, queue_deadline):
+    """等待一次工具调用：开始执行后最多等待 timeout 秒，排队到 queue_deadline 仍未开始时取消"""
+    while True:
+        started = call.started
+        deadline = started + timeout if started is not None else queue_deadline
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            pass
+        if call.started is None:
+            if time.monotonic() < queue_deadline or not future.cancel():
+                # 刚开始执行（取消失败），按开始时间重新计算截止时间
+                continue
+            record_tool(call.t["name"], 0.0, "timeout")
+            return _timeout_message(call.t, timeout)
+        if time.monotonic() >= call.started + timeout:
+            _mark_stuck(call.t["name"], future)
+            record_tool(call.t["name"], timeout, "timeout")
+            return _timeout_message(call.t, timeout)
+
+
+def run_tool_calls(tool_calls, registry=None, timeout=TOOL_TIMEOUT):
+    """在线程池中并发执行工具调用，按原顺序返回 ToolMessage 列表
+
+    每个工具从开始执行时起最多等待 timeout 秒；超时的调用无法中断，会继续占用工作线程直到返回（见 stuck_tool_workers）。
+    排队中的调用最多等待到所有批次都用满超时的时间，仍未开始时取消。
+    """
+    registry = tools_by_name if registry is None else registry
+    calls = [_ToolCall(t) for t in tool_calls]
+    # 在调用方的上下文中执行，指标与预算可以关联到发起调用的节点
+    futures = [_tool_executor.submit(copy_context().run, call.run, registry) for call in calls]
+    # 调用数超过可用线程数时需要排队，超时后仍在运行的调用占用的线程不可用
+    workers = max(TOOL_WORKERS - stuck_tool_workers(), 1)
+    queue_deadline = time.monotonic() + timeout * max(-(-len(futures) // workers), 1)
+    results = []
+    for call, future in zip(calls, futures):
+        try:
+            result = _wait_tool(call, future, timeout, queue_deadline)
+        except Exception as e:
+            result = f"工具 {call.t['name']} 调用失败: {e}"
+        results.append(ToolMessage(tool_call_id=call.t["id"], content=str(result)))
+    return results
+
+
+async def arun_tool_calls(tool_calls, registry=None, timeout=TOOL_TIMEOUT):
+    """run_tool_calls 的异步版本：超时从取得并发名额后开始计算
+
+    同步实现的工具在事件循环的默认线程池中执行，超时后同样无法中断，只是不再等待其结果。
+    """
+    registry = tools_by_name if registry is None else registry
+    slots = asyncio.Semaphore(TOOL_WORKERS)
+
+    async def call(t):
+        tool = registry.get(t["name"])
+        if tool is None:
+            logger.warning(f"bad tool name: {t['name']}")
+            record_tool(t["name"], 0.0, "bad_name")
+            return "bad tool name, retry"
+        async with slots:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(tool.ainvoke(t["args"]), timeout)
+            except asyncio.TimeoutError:
+                record_tool(t["name"], time.perf_counter() - started, "timeout")
+                return f"工具 {t['name']} 调用超时（{timeout}s），请调整查询后重试"
+            except Exception as e:
+                record_tool(t["name"], time.perf_counter() - started, "error")
+                return f"工具 {t['name']} 调用失败: {e}"
+            record_tool(t["name"], time.perf_counter() - started, "ok")
+            return result
+
+    results = await asyncio.gather(*(call(t) for t in tool_calls))
+    return [ToolMessage(tool_call_id=t["id"], content=str(result)) for t, result in zip(tool_calls, results)]
+
+
+def _next_node(state):
+    """根据source_node决定工具调用后返回哪个节点"""
+    # 获取调用源节点
+    source_node = state.get("source_node")
+    logger.debug(f"Tool called from source node: {source_node}")
+    next_node = source_node if source_node else "intent_recognition"
+    return {"source_node": source_node, "next": next_node}
+
+
+def tool_node(state, llm):
+    """并发执行上一条消息中的工具调用，并返回调用来源节点"""
+    tool_calls = state["messages"][-1].tool_calls
+    logger.debug(f"take_action called with tool_calls: {tool_calls}")
+    results = run_tool_calls(tool_calls)
+    logger.debug("Back to the model!")
+    return {"messages": results, **_next_node(state)}
+
+
+async def atool_node(state, llm):
+    """并发执行上一条消息中的工具调用（异步版本）"""
+    tool_calls = state["messages"][-1].tool_calls
+    results = await arun_tool_calls(tool_calls)
+    return {"messages": results, **_next_node(state)}
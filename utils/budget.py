@@ -0,0 +1,184 @@
+"""
+工具调用次数上限与单次运行的时间 / token 预算
+
+节点与工具节点之间的循环没有次数限制，模型持续发出工具调用时会在两者之间无限往返。
+这里为每个节点设置最多的工具调用轮数，并为每次运行设置时间与 token 预算：
+剩余预算低于 AUTOSPEC_BUDGET_LOW 或节点达到调用上限后，调度器让节点跳过工具判断直接生成。
+预算使用情况写入最终状态的 budget_report。
+
+环境变量：
+    AUTOSPEC_MAX_TOOL_ITERATIONS          每个节点最多的工具调用轮数（默认 3）
+    AUTOSPEC_MAX_TOOL_ITERATIONS_<NODE>   单个节点的上限，例如 AUTOSPEC_MAX_TOOL_ITERATIONS_GENERATE_DESIGN=1
+    AUTOSPEC_RUN_SECONDS                  单次运行的时间预算（秒，0 表示不限制）
+    AUTOSPEC_RUN_TOKENS                   单次运行的 token 预算（0 表示不限制）
+    AUTOSPEC_BUDGET_LOW                   剩余预算比例低于该值时不再调用工具（默认 0.2）
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from utils.context_budget import count_tokens, model_context
+
+
+MAX_TOOL_ITERATIONS = int(os.environ.get("AUTOSPEC_MAX_TOOL_ITERATIONS", "3"))
+RUN_SECONDS = float(os.environ.get("AUTOSPEC_RUN_SECONDS", "0"))
+RUN_TOKENS = int(os.environ.get("AUTOSPEC_RUN_TOKENS", "0"))
+BUDGET_LOW = float(os.environ.get("AUTOSPEC_BUDGET_LOW", "0.2"))
+
+logger = logging.getLogger("autospec.budget")
+
+
+def max_tool_iterations(node_name):
+    """节点最多的工具调用轮数"""
+    value = os.environ.get(f"AUTOSPEC_MAX_TOOL_ITERATIONS_{node_name.upper()}")
+    return int(value) if value else MAX_TOOL_ITERATIONS
+
+
+def merge_tool_iterations(left, right):
+    """tool_iterations 的合并函数：计数只增不减，重复合并同一状态不会重复计数"""
+    merged = dict(left or {})
+    for node, count in (right or {}).items():
+        merged[node] = max(merged.get(node, 0), count)
+    return merged
+
+
+def tool_iteration_update(state, node_name):
+    """节点请求一轮工具调用时的计数更新"""
+    count = (state.get("tool_iterations") or {}).get(node_name, 0)
+    return {"tool_iterations": {node_name: count + 1}}
+
+
+class RunBudget:
+    """单次运行的时间与 token 预算"""
+
+    def __init__(self, seconds=None, tokens=None):
+        self.seconds = RUN_SECONDS if seconds is None else seconds
+        self.tokens = RUN_TOKENS if tokens is None else tokens
+        self.started = time.monotonic()
+        self.used_tokens = 0
+        self.forced = {}
+        self._lock = threading.Lock()
+
+    def charge(self, tokens):
+        """计入 token 消耗"""
+        with self._lock:
+            self.used_tokens += tokens
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining_fraction(self):
+        """剩余预算比例，取时间与 token 中较少的一个；都不限制时为 1"""
+        fractions = []
+        if self.seconds:
+            fractions.append(1 - self.elapsed / self.seconds)
+        if self.tokens:
+            fractions.append(1 - self.used_tokens / self.tokens)
+        return max(min(fractions), 0.0) if fractions else 1.0
+
+    def low(self):
+        return self.remaining_fraction() <= BUDGET_LOW
+
+    def exhausted(self):
+        return self.remaining_fraction() <= 0
+
+    def note_forced(self, node_name, reason):
+        """记录被强制跳过工具调用的节点"""
+        with self._lock:
+            first = node_name not in self.forced
+            self.forced.setdefault(node_name, reason)
+        if first:
+            print(f"[BUDGET] {node_name}: {reason}，不再调用工具，直接生成")
+
+    def report(self, tool_iterations=None):
+        """预算使用情况"""
+        with self._lock:
+            used_tokens, forced = self.used_tokens, dict(self.forced)
+        return {
+            "elapsed_s": round(self.elapsed, 2),
+            "time_limit_s": self.seconds or None,
+            "tokens": used_tokens,
+            "token_limit": self.tokens or None,
+            "remaining": round(self.remaining_fraction(), 3),
+            "exhausted": self.exhausted(),
+            "forced_no_tool": forced,
+            "tool_iterations": dict(tool_iterations or {}),
+        }
+
+
+_run_budget = ContextVar("autospec_run_budget", default=None)
+
+
+@contextmanager
+def run_budget(seconds=None, tokens=None):
+    """在 with 块内为当前运行设置预算"""
+    budget = RunBudget(seconds, tokens)
+    token = _run_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _run_budget.reset(token)
+
+
+def get_run_budget():
+    """当前运行的预算，没有设置时返回 None"""
+    return _run_budget.get()
+
+
+def charge_response(response, messages, llm):
+    """把一次模型调用计入当前运行的预算：优先使用 usage_metadata，没有时按字符估算"""
+    budget = get_run_budget()
+    if budget is None:
+        return
+    usage = getattr(response, "usage_metadata", None) or {}
+    tokens = usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    if not tokens:
+        model, _ = model_context(llm)
+        prompt = "".join(m.get("content", "") if isinstance(m, dict) else str(getattr(m, "content", "")) for m in messages)
+        tokens = count_tokens(prompt, model) + count_tokens(str(getattr(response, "content", "")), model)
+    budget.charge(tokens)
+
+
+def tools_allowed(node_name, state):
+    """调度判断：节点本次是否还可以调用工具"""
+    budget = get_run_budget()
+    iterations = (state.get("tool_iterations") or {}).get(node_name, 0)
+    if iterations >= max_tool_iterations(node_name):
+        reason = f"工具调用已达上限 {iterations} 轮"
+    elif budget is not None and budget.low():
+        reason = "运行预算即将用尽" if not budget.exhausted() else "运行预算已用尽"
+    else:
+        return True
+    if budget is not None:
+        budget.note_forced(node_name, reason)
+    else:
+        # 没有设置运行预算（demo、基准测试或直接调用节点）时每次判断都会走到这里，只记录调试日志
+        logger.debug(f"{node_name}: {reason}，不再调用工具，直接生成")
+    return False
+
+
+def budget_report(tool_iterations=None):
+    """当前运行的预算报告；没有设置预算时只包含工具调用次数"""
+    budget = get_run_budget()
+    if budget is None:
+        return {"tool_iterations": dict(tool_iterations or {})}
+    return budget.report(tool_iterations)
+
+
+def format_budget_report(report):
+    """格式化的预算报告"""
+    if not report:
+        return "[BUDGET] 无预算信息"
+    text = f"[BUDGET] 工具调用轮数 {report.get('tool_iterations') or {}}"
+    if "elapsed_s" in report:
+        text += f"，耗时 {report['elapsed_s']}s，约 {report['tokens']} tokens，剩余 {report['remaining']:.0%}"
+        if report["exhausted"]:
+            text += "，预算已用尽"
+    if report.get("forced_no_tool"):
+        text += "，跳过工具的节点: " + "，".join(f"{node}（{reason}）" for node, reason in report["forced_no_tool"].items())
+    return text
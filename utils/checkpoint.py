@@ -0,0 +1,110 @@
+"""
+按项目目录保存流水线检查点，支持从第一个未完成的节点恢复
+
+每个阶段完成后在 <project_dir>/.kiro/checkpoint.json 中记录：
+    content_hash  阶段产物（.kiro 下的文档）的内容哈希
+    input_hash    生成该阶段时上游文档的内容哈希
+
+恢复时依次检查各阶段：产物存在且上游内容哈希未变化的阶段直接跳过，从第一个需要重新生成的阶段开始运行。
+用户手动修改了某个文档时，该文档作为新的阶段产物，其下游阶段的 input_hash 随之失效并重新生成。
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from utils.utils import read_file
+from utils.memory import latest_user_message
+
+
+CHECKPOINT_FILE = os.path.join(".kiro", "checkpoint.json")
+
+# (节点名, 状态键, 产物路径, 上游状态键)
+STAGES = (
+    ("generate_requirements", "requirements_content", os.path.join(".kiro", "requirements.md"), "user_input"),
+    ("generate_design", "design_content", os.path.join(".kiro", "design.md"), "requirements_content"),
+    ("generate_tasks", "tasks_content", os.path.join(".kiro", "tasks.md"), "design_content"),
+    ("generate_code", "code_content", os.path.join(".kiro", "code.md"), "tasks_content"),
+)
+
+
+def content_hash(content):
+    """计算内容哈希"""
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(project_dir):
+    """读取检查点，不存在或损坏时返回空检查点"""
+    path = os.path.join(project_dir, CHECKPOINT_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"user_input": "", "stages": {}}
+
+
+def save_checkpoint(project_dir, checkpoint):
+    """原子写入检查点"""
+    path = os.path.join(project_dir, CHECKPOINT_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def record_stage(node_name, state, update):
+    """节点完成后记录检查点（工具调用请求与非开发请求不记录）"""
+    if not isinstance(update, dict) or update.get("next") == "tools":
+        return
+    new_dir = update.get("new_dir") or state.get("new_dir")
+    if not new_dir or new_dir == ".":
+        return
+
+    checkpoint = load_checkpoint(new_dir)
+    if node_name == "intent_recognition":
+        # 复用或复制的相似项目保留原有检查点
+        if update.get("reused_from"):
+            return
+        checkpoint["user_input"] = latest_user_message(state)
+        checkpoint["stages"] = {}
+        save_checkpoint(new_dir, checkpoint)
+        return
+
+    for stage, key, _, upstream_key in STAGES:
+        if stage != node_name:
+            continue
+        upstream = checkpoint.get("user_input", "") if upstream_key == "user_input" else state.get(upstream_key, "")
+        checkpoint["stages"][stage] = {
+            "content_hash": content_hash(update.get(key, "")),
+            "input_hash": content_hash(upstream),
+            "completed_at": time.time(),
+        }
+        save_checkpoint(new_dir, checkpoint)
+        return
+
+
+def plan_resume(project_dir):
+    """根据检查点构造恢复用的初始状态，返回 (state, resume_from)，全部完成时 resume_from 为 None"""
+    checkpoint = load_checkpoint(project_dir)
+    user_input = checkpoint.get("user_input", "")
+    state = {
+        "messages": [{"role": "user", "content": user_input}],
+        "next": "",
+        "new_dir": project_dir,
+        "source_node": "",
+    }
+    contents = {"user_input": user_input}
+
+    for stage, key, artifact, upstream_key in STAGES:
+        record = checkpoint.get("stages", {}).get(stage)
+        artifact_path = os.path.join(project_dir, artifact)
+        if not record or not os.path.exists(artifact_path):
+            return state, stage
+        # 上游内容变化（包括用户手动修改了上游文档）时需要重新生成
+        if record.get("input_hash") != content_hash(contents.get(upstream_key, "")):
+            return state, stage
+        contents[key] = state[key] = read_file(artifact_path)
+
+    return state, None
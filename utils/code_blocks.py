@@ -0,0 +1,185 @@
+"""
+增量代码块提取
+
+CodeBlockExtractor 是一个按行工作的状态机，可以直接接收模型的 token 流：
+每收到一个完整的行就推进状态，代码块的结束围栏到达时立即回调 on_block(filename, code)，
+因此文件可以边生成边写入 src/，内存占用只与当前代码块的大小有关。
+
+文件名按以下顺序识别：
+    1. 围栏信息串：```python filename=app/main.py（也支持 file= / path= / title=，或 ```python app/main.py）
+    2. 代码块首行注释：# file: app/main.py、// file: app/main.py、<!-- file: index.html -->
+    3. 围栏前一行的标题或说明：### app/main.py、**app/main.py**、文件：`app/main.py`
+"""
+
+import os
+import re
+
+
+FENCE = re.compile(r"^\s*(`{3,}|~{3,})\s*(.*?)\s*$")
+INFO_FILENAME = re.compile(r"""(?:filename|file|path|title)\s*=\s*["']?([^\s"']+)["']?""")
+COMMENT_FILENAME = re.compile(
+    r"""^\s*(?:#|//|--|/\*|<!--|;)\s*(?:file(?:name)?|path|文件(?:名)?)\s*[:：]\s*`?([^\s`*]+?)`?\s*(?:\*/|-->)?\s*$""",
+    re.IGNORECASE,
+)
+PATH_LIKE = re.compile(r"(?<![\w./-])((?:[\w-]+/)*(?:[\w.-]*\.[A-Za-z0-9]+|Dockerfile|Makefile))(?![\w/-])")
+HINT_LINE = re.compile(r"^\s*(?:#{1,6}\s|\*\*|`|[-*]\s|(?:文件|file(?:name)?|path)\s*[:：])", re.IGNORECASE)
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _path_in(text):
+    """从一段文本中取出形如文件路径的部分"""
+    for match in PATH_LIKE.finditer(text):
+        candidate = match.group(1).strip(".")
+        # 排除版本号、纯数字扩展名等非路径内容
+        if candidate and not re.fullmatch(r"[\d.]+", candidate):
+            return match.group(1)
+    return None
+
+
+def safe_code_path(code_dir, filename):
+    """把代码块文件名解析为 code_dir 下的路径，越出 code_dir 的文件名返回 None"""
+    filename = filename.strip().replace("\\", "/")
+    if not filename or filename.startswith("/") or re.match(r"^[A-Za-z]:", filename):
+        return None
+    root = os.path.realpath(code_dir)
+    path = os.path.realpath(os.path.join(root, filename))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    return path
+
+
+class CodeBlockExtractor:
+    """从文本流中增量提取带文件名的代码块"""
+
+    def __init__(self, on_block=None, keep_code=True):
+        self.on_block = on_block
+        # keep_code 为 False 时 blocks 只记录文件名，代码交给 on_block 后即释放
+        self.keep_code = keep_code
+        self.blocks = []
+        self._partial = ""
+        self._fence = None
+        self._filename = None
+        self._hint = None
+        self._lines = []
+        self._first_line = False
+        self._in_think = False
+
+    def feed(self, text):
+        """接收一段文本（可以是单个 token），处理其中的完整行"""
+        if not text:
+            return
+        text = self._partial + text
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self):
+        """处理剩余文本；未闭合的代码块按已收到的内容结束，返回全部代码块"""
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        if self._fence is not None:
+            self._end_block()
+        return self.blocks
+
+    def _line(self, line):
+        if self._fence is None:
+            self._outside(line)
+        else:
+            self._inside(line)
+
+    def _outside(self, line):
+        # 思考过程中的代码块不写入文件
+        if self._in_think:
+            if THINK_CLOSE in line:
+                self._in_think = False
+            return
+        if THINK_OPEN in line and THINK_CLOSE not in line:
+            self._in_think = True
+            return
+
+        match = FENCE.match(line)
+        if match:
+            self._fence = match.group(1)
+            self._filename = self._info_filename(match.group(2)) or self._hint
+            self._hint = None
+            self._lines = []
+            self._first_line = True
+            return
+        if line.strip():
+            # 只有紧挨在围栏前的标题 / 说明行（或以冒号结尾的引导句）才作为文件名提示
+            is_hint = HINT_LINE.match(line) or line.rstrip().endswith((":", "："))
+            self._hint = _path_in(line) if is_hint else None
+
+    def _inside(self, line):
+        stripped = line.strip()
+        # 结束围栏：与开始围栏同类字符且不短于开始围栏，后面没有其他内容
+        if stripped and stripped[0] == self._fence[0] and set(stripped) == {self._fence[0]} and len(stripped) >= len(self._fence):
+            self._end_block()
+            return
+        if self._first_line:
+            self._first_line = False
+            match = COMMENT_FILENAME.match(line)
+            if match:
+                if not self._filename:
+                    self._filename = match.group(1)
+                return
+        self._lines.append(line)
+
+    def _end_block(self):
+        filename = self._filename
+        lines = self._lines
+        self._fence = None
+        self._filename = None
+        self._lines = []
+        if filename and lines:
+            code = "\n".join(lines) + "\n"
+            self.blocks.append({"filename": filename, "code": code if self.keep_code else None})
+            if self.on_block is not None:
+                self.on_block(filename, code)
+
+    @staticmethod
+    def _info_filename(info):
+        if not info:
+            return None
+        match = INFO_FILENAME.search(info)
+        if match:
+            return match.group(1)
+        parts = info.split()
+        # ```python app/main.py 或 ```app/main.py
+        for part in parts[1:] if len(parts) > 1 else []:
+            path = _path_in(part)
+            if path:
+                return path
+        if len(parts) == 1 and ("/" in parts[0] or "." in parts[0]):
+            return _path_in(parts[0])
+        return None
+
+
+def extract_code_blocks(content):
+    """从完整文本中提取带文件名的代码块"""
+    extractor = CodeBlockExtractor()
+    extractor.feed(content)
+    return extractor.close()
+
+
+class CodeFileWriter:
+    """代码块结束时立即写入 src 目录，记录已写入的文件"""
+
+    def __init__(self, new_dir):
+        self.code_dir = os.path.join(new_dir, "src")
+        self.written = []
+        self.rejected = []
+
+    def __call__(self, filename, code):
+        path = safe_code_path(self.code_dir, filename)
+        if path is None:
+            self.rejected.append(filename)
+            print(f"[generate_code] 忽略不安全的文件名: {filename}")
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(code)
+        self.written.append(filename)
@@ -0,0 +1,126 @@
+"""
+限制同时进行中的 LLM 调用数量
+
+批量模式与多会话场景下，多个流水线共享同一个模型服务，
+InFlightLimiter 限制同时发往模型的请求数，超出的调用在本地排队等待。
+"""
+
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+
+class InFlightLimiter:
+    """进行中 LLM 调用的计数信号量"""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _enter_wait(self):
+        with self._lock:
+            self.waiting += 1
+
+    def _leave_wait(self, acquired):
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _acquire_until(self, abandoned):
+        """在线程中等待名额，abandoned 被设置后放弃等待；返回是否取得名额"""
+        while not abandoned.is_set():
+            if self._slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def _release_abandoned(self, waiter):
+        """被取消的等待在线程中仍取得了名额时归还"""
+        if not waiter.cancelled() and waiter.exception() is None and waiter.result():
+            self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        """同步获取一个调用名额"""
+        self._enter_wait()
+        acquired = False
+        try:
+            self._slots.acquire()
+            acquired = True
+        finally:
+            self._leave_wait(acquired)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """异步获取一个调用名额（在线程中等待，不阻塞事件循环）
+
+        等待中的任务被取消时，等待线程放弃等待；若线程已经取得名额则立即归还，不会泄漏名额。
+        """
+        self._enter_wait()
+        acquired = False
+        try:
+            if self._slots.acquire(blocking=False):
+                acquired = True
+            else:
+                abandoned = threading.Event()
+                waiter = asyncio.ensure_future(asyncio.to_thread(self._acquire_until, abandoned))
+                try:
+                    acquired = await asyncio.shield(waiter)
+                except asyncio.CancelledError:
+                    abandoned.set()
+                    waiter.add_done_callback(self._release_abandoned)
+                    raise
+        finally:
+            self._leave_wait(acquired)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def saturated(self):
+        """名额已满且有调用在排队"""
+        with self._lock:
+            return self.in_flight >= self.max_in_flight and self.waiting > 0
+
+
+class LimitedLLM:
+    """包装聊天模型，使 invoke/ainvoke/stream/astream 受 InFlightLimiter 约束"""
+
+    def __init__(self, llm, limiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def invoke(self, *args, **kwargs):
+        with self.limiter.slot():
+            return self.llm.invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        async with self.limiter.aslot():
+            return await self.llm.ainvoke(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        with self.limiter.slot():
+            yield from self.llm.stream(*args, **kwargs)
+
+    async def astream(self, *args, **kwargs):
+        async with self.limiter.aslot():
+            async for chunk in self.llm.astream(*args, **kwargs):
+                yield chunk
+
+    def bind_tools(self, *args, **kwargs):
+        return LimitedLLM(self.llm.bind_tools(*args, **kwargs), self.limiter)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
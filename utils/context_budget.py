@@ -0,0 +1,229 @@
+"""
+按 token 预算构造提示词
+
+下游节点的提示词会嵌入完整的上游文档，文档较长时会超出模型的上下文窗口（num_ctx），
+Ollama 会静默截断提示词，同时浪费预填充时间。fit_prompt 先估算提示词模板本身的 token 数，
+把剩余预算分配给各个文档段落，超出预算的段落按标题 / 列表项抽取压缩。
+有段落被压缩时在控制台输出 [CONTEXT] 报告，其他提示词的 token 数只记录在调试日志（autospec.context）中。
+
+token 数按模型系列用字符数估算（中文按字数、其他字符按平均每 token 字符数），
+需要精确计数时可以用 set_token_counter 为某个模型系列注册分词函数。
+
+环境变量：
+    AUTOSPEC_NUM_CTX          模型未设置 num_ctx 时使用的上下文窗口（默认 4096，与 Ollama 默认值一致）
+    AUTOSPEC_OUTPUT_RESERVE   为模型输出预留的比例（默认 0.25）
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_NUM_CTX = int(os.environ.get("AUTOSPEC_NUM_CTX", "4096"))
+OUTPUT_RESERVE = float(os.environ.get("AUTOSPEC_OUTPUT_RESERVE", "0.25"))
+
+# 各模型系列的估算参数：其他字符平均每 token 的字符数、每个中日韩字符的 token 数
+MODEL_PROFILES = {
+    "llama3": {"chars_per_token": 4.0, "cjk_tokens_per_char": 1.0},
+    "qwen": {"chars_per_token": 4.0, "cjk_tokens_per_char": 0.7},
+    "deepseek": {"chars_per_token": 4.0, "cjk_tokens_per_char": 0.7},
+    "mistral": {"chars_per_token": 3.5, "cjk_tokens_per_char": 1.5},
+}
+# 未知模型使用偏保守的估算
+DEFAULT_PROFILE = {"chars_per_token": 3.5, "cjk_tokens_per_char": 1.2}
+
+CJK = re.compile(r"[　-〿㐀-䶿一-鿿가-힯＀-￯]")
+HEADING = re.compile(r"^\s*#{1,6}\s+\S")
+BULLET = re.compile(r"^\s*(?:[-*+]\s+|\d+[.)、]\s*)\S")
+SENTENCE_END = re.compile(r"(?<=[。！？.!?])\s*")
+
+# 已注册的精确分词函数：模型系列前缀 -> fn(text) -> token 数
+_token_counters = {}
+
+# 压缩结果缓存：(文本哈希, 预算, 模型系列) -> 压缩后的文本
+_compact_cache = OrderedDict()
+_compact_cache_lock = threading.Lock()
+COMPACT_CACHE_SIZE = 64
+
+logger = logging.getLogger("autospec.context")
+
+
+def _family(model):
+    """按名称前缀确定模型系列，例如 llama3.1:8b -> llama3"""
+    name = (model or "").lower()
+    for prefix in list(_token_counters) + list(MODEL_PROFILES):
+        if name.startswith(prefix):
+            return prefix
+    return ""
+
+
+def set_token_counter(model_prefix, counter):
+    """为某个模型系列注册精确的分词计数函数 counter(text) -> int，counter 为 None 时取消"""
+    if counter is None:
+        _token_counters.pop(model_prefix, None)
+    else:
+        _token_counters[model_prefix] = counter
+
+
+def count_tokens(text, model=None):
+    """估算文本在指定模型下的 token 数"""
+    if not text:
+        return 0
+    family = _family(model)
+    if family in _token_counters:
+        return _token_counters[family](text)
+    profile = MODEL_PROFILES.get(family, DEFAULT_PROFILE)
+    cjk = len(CJK.findall(text))
+    other = len(text) - cjk
+    return int(cjk * profile["cjk_tokens_per_char"] + other / profile["chars_per_token"]) + 1
+
+
+def model_context(llm):
+    """取得 llm 的模型名称与上下文窗口，兼容 bind_tools、并发限制等包装
+
+    备用链取主模型的名称与链中最小的上下文窗口，切换到备用模型时提示词仍然放得下。
+    """
+    model, num_ctx = None, None
+    current = llm
+    for _ in range(4):
+        if current is None:
+            break
+        fallbacks = getattr(current, "fallbacks", None)
+        if isinstance(fallbacks, (list, tuple)) and fallbacks:
+            primary_model, primary_ctx = model_context(current.runnable)
+            windows = [primary_ctx] + [model_context(fallback)[1] for fallback in fallbacks]
+            return model or primary_model, int(num_ctx or min(windows))
+        model = model or getattr(current, "model", None) or getattr(current, "model_name", None)
+        num_ctx = num_ctx or getattr(current, "num_ctx", None)
+        current = getattr(current, "bound", None) or getattr(current, "llm", None)
+    return (model if isinstance(model, str) else None), int(num_ctx or DEFAULT_NUM_CTX)
+
+
+def _line_priority(line, paragraph_start):
+    """抽取优先级：标题 0，列表项与段落首行 1，其他正文 2"""
+    if HEADING.match(line):
+        return 0
+    if BULLET.match(line) or paragraph_start:
+        return 1
+    return 2
+
+
+def _compact(text, budget, model):
+    lines = text.splitlines()
+    entries = []
+    paragraph_start = True
+    for index, line in enumerate(lines):
+        if not line.strip():
+            paragraph_start = True
+            continue
+        priority = _line_priority(line, paragraph_start)
+        if priority == 1 and not BULLET.match(line):
+            # 段落只保留首句
+            first = SENTENCE_END.split(line.strip(), 1)[0]
+            line = first if len(first) < len(line.strip()) else line
+        entries.append((priority, index, line, count_tokens(line, model) + 1))
+        # 标题后的第一行视为新段落的开始
+        paragraph_start = priority == 0
+
+    # 按优先级、再按出现顺序贪心选择，输出时恢复原顺序
+    selected = []
+    used = 0
+    for priority, index, line, tokens in sorted(entries, key=lambda e: (e[0], e[1])):
+        if used + tokens > budget:
+            if priority == 0:
+                continue
+            break
+        selected.append((index, line))
+        used += tokens
+    selected.sort()
+    return "\n".join(line for _, line in selected) + "\n（内容已按上下文预算压缩）"
+
+
+def compact_document(text, budget, model=None):
+    """把文档压缩到约 budget 个 token：优先保留标题，其次列表项和段落首句"""
+    if count_tokens(text, model) <= budget:
+        return text
+    key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), budget, _family(model))
+    with _compact_cache_lock:
+        if key in _compact_cache:
+            _compact_cache.move_to_end(key)
+            return _compact_cache[key]
+    compacted = _compact(text, budget, model)
+    with _compact_cache_lock:
+        _compact_cache[key] = compacted
+        while len(_compact_cache) > COMPACT_CACHE_SIZE:
+            _compact_cache.popitem(last=False)
+    return compacted
+
+
+def allocate_budget(sizes, budget, weights=None):
+    """按权重分配各段落的预算；用不完预算的段落把剩余部分让给其他段落"""
+    weights = weights or {}
+    allocation = {}
+    remaining = dict(sizes)
+    left = max(budget, 0)
+    while remaining:
+        total_weight = sum(weights.get(name, 1) for name in remaining)
+        shares = {name: left * weights.get(name, 1) / total_weight for name in remaining}
+        fits = [name for name, size in remaining.items() if size <= shares[name]]
+        if not fits:
+            for name in remaining:
+                allocation[name] = int(shares[name])
+            break
+        for name in fits:
+            allocation[name] = remaining.pop(name)
+            left -= allocation[name]
+    return allocation
+
+
+def fit_prompt(node, llm, build, weights=None, reserve=None, system="", **sections):
+    """按上下文预算构造提示词
+
+    build(**sections) 返回完整提示词（或 system 之后的可变部分）；超出预算的段落会先被压缩再传给 build。
+    weights 为各段落分配预算时的权重，reserve 为预留给输出的 token 数，system 为同时发送的固定 system 提示词。
+    返回 (prompt, report)。
+    """
+    model, num_ctx = model_context(llm)
+    reserve = int(num_ctx * OUTPUT_RESERVE) if reserve is None else reserve
+    system_tokens = count_tokens(system, model)
+    template_tokens = system_tokens + count_tokens(build(**{name: "" for name in sections}), model)
+    budget = num_ctx - reserve - template_tokens
+
+    sizes = {name: count_tokens(text, model) for name, text in sections.items()}
+    compacted = {}
+    if sum(sizes.values()) > budget:
+        allocation = allocate_budget(sizes, budget, weights)
+        sections = {
+            name: compact_document(text, allocation[name], model) if sizes[name] > allocation[name] else text
+            for name, text in sections.items()
+        }
+        compacted = {name: (sizes[name], count_tokens(sections[name], model))
+                     for name in sizes if sizes[name] > allocation[name]}
+
+    prompt = build(**sections)
+    report = {
+        "node": node,
+        "model": model,
+        "num_ctx": num_ctx,
+        "prompt_tokens": system_tokens + count_tokens(prompt, model),
+        "budget": num_ctx - reserve,
+        "compacted": compacted,
+    }
+    # 按任务生成代码时每个任务都会构造一次提示词，只在确实压缩了内容时输出
+    if compacted:
+        print(format_context_report(report))
+    else:
+        logger.debug(format_context_report(report))
+    return prompt, report
+
+
+def format_context_report(report):
+    """格式化的提示词 token 报告"""
+    text = f"[CONTEXT] {report['node']}: 提示词约 {report['prompt_tokens']} tokens（预算 {report['budget']} / num_ctx {report['num_ctx']}）"
+    if report["compacted"]:
+        parts = [f"{name} {before}→{after}" for name, (before, after) in report["compacted"].items()]
+        text += "，已压缩: " + "，".join(parts)
+    return text
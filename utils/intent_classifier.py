@@ -0,0 +1,177 @@
+"""
+本地意图分类：在调用模型之前判断用户输入是否为开发需求
+
+先用关键词规则处理明显的情况（紧邻的动词 + 软件对象，例如"开发一个……系统"；问候、天气等闲聊），
+其余输入交给字符 n-gram 朴素贝叶斯模型，模型在 utils/intent_samples.jsonl 的标注样本上训练（首次使用时训练，耗时约几毫秒）。
+动词与软件对象相距较远或只作修饰语时（"设计一个系统的学习计划"）不按规则判断，模型结果的置信度也不超过 HINT_CONFIDENCE。
+每个结果带有置信度，置信度低于 AUTOSPEC_INTENT_CONFIDENCE 时由意图识别节点回退到模型判断。
+
+环境变量：
+    AUTOSPEC_INTENT_CLASSIFIER    auto（默认，置信度不足时回退到模型）、local（只用本地分类）或 off（只用模型）
+    AUTOSPEC_INTENT_CONFIDENCE    采用本地结果的最低置信度（默认 0.85）
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, namedtuple
+
+
+INTENT_CLASSIFIER = os.environ.get("AUTOSPEC_INTENT_CLASSIFIER", "auto")
+INTENT_CONFIDENCE = float(os.environ.get("AUTOSPEC_INTENT_CONFIDENCE", "0.85"))
+SAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_samples.jsonl")
+
+DEV, OTHER = "dev", "other"
+
+# 开发动作 + 软件对象
+DEV_ACTION_ZH = r"(?:开发|创建|实现|编写|写|做|搭建|构建|设计|生成|制作|重构)"
+DEV_OBJECT_ZH = (r"(?:应用|系统|网站|网页|页面|小程序|程序|工具|平台|接口|服务器|服务|脚本|爬虫|游戏|插件|机器人|后台|前端|后端|"
+                 r"数据库|模块|组件|框架|命令行|(?<![a-z])(?:app|api|sdk|cli|bot)(?![a-z]))")
+DEV_ACTION_EN = r"\b(?:build|create|develop|implement|write|make|design)\b"
+DEV_OBJECT_EN = r"\b(?:app|api|sdk|cli|bot|service|website|web ?page|landing page|tool|script|system|game|server|library|plugin)s?\b"
+# 对象位于短语末尾（之后是标点、语气词，或英文中引出用途的介词），排除"系统的学习计划"、"game plan"这类修饰用法
+PHRASE_END_ZH = r"(?=$|[\s，。！？,.!?；;：:、]|吗|吧|呢)"
+PHRASE_END_EN = r"(?=\s*$|\s*[,.!?;:]|\s+(?:for|to|that|which|with|in|using|on)\b)"
+# 动作与对象紧邻：中文最多相隔 12 个字（不跨标点、不含"关于"），英文最多相隔 3 个词（不含 about、of 等引出话题的词）
+DEV_RULE = re.compile(
+    DEV_ACTION_ZH + r"(?:(?!关于)[^\s，。！？,.!?；;：:、]){0,12}?" + DEV_OBJECT_ZH + PHRASE_END_ZH
+    + "|" + DEV_ACTION_EN + r"(?:\s+(?!(?:about|of|on|regarding|like)\b)[\w'-]+){0,3}?\s+" + DEV_OBJECT_EN + PHRASE_END_EN,
+    re.IGNORECASE,
+)
+# 动作与对象相距较远或对象不在短语末尾：可能是开发需求，也可能只是提到了这些词（"写一篇关于程序员的文章"）
+DEV_HINT = re.compile(DEV_ACTION_ZH + r".{0,20}?" + DEV_OBJECT_ZH + "|" + DEV_ACTION_EN + r".{0,40}?" + DEV_OBJECT_EN, re.IGNORECASE)
+# 明确的技术词汇：出现时倾向于开发需求
+TECH_TERMS = re.compile(
+    r"(?:python|java(?:script)?|typescript|golang|\bgo\b|rust|react|vue|flask|django|spring|node\.?js|sql|redis|docker|"
+    r"restful|websocket|http|前端|后端|数据库|需求文档|架构|代码)",
+    re.IGNORECASE,
+)
+# 闲聊：问候、感谢、天气、常识问答等
+CHAT_RULE = re.compile(
+    r"^(?:你好|您好|嗨|hi|hello|早上好|晚上好|下午好|晚安|谢谢|多谢|thanks|thank you|再见|bye)[\s!！。.~～呀啊]*$"
+    r"|天气|气温|下雨|笑话|是谁|叫什么名字|翻译",
+    re.IGNORECASE,
+)
+
+# 规则命中时的置信度
+RULE_CONFIDENCE = 0.97
+DEV_RULE_CONFIDENCE = 0.9
+# 只命中 DEV_HINT 时置信度的上限：低于默认阈值，auto 模式下交给模型判断
+HINT_CONFIDENCE = 0.6
+
+IntentResult = namedtuple("IntentResult", ["label", "confidence", "source"])
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def features(text):
+    """字符 1~3-gram 加英文单词"""
+    text = _normalize(text)
+    grams = []
+    padded = f"^{text}$"
+    for n in (1, 2, 3):
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    grams.extend("w:" + word for word in re.findall(r"[a-z][a-z0-9.+#-]*", text))
+    return grams
+
+
+class NaiveBayesIntent:
+    """多项式朴素贝叶斯（拉普拉斯平滑）"""
+
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self.counts = {DEV: Counter(), OTHER: Counter()}
+        self.totals = {DEV: 0, OTHER: 0}
+        self.docs = {DEV: 0, OTHER: 0}
+        self.vocabulary = set()
+
+    def fit(self, samples):
+        for text, label in samples:
+            grams = features(text)
+            self.counts[label].update(grams)
+            self.totals[label] += len(grams)
+            self.docs[label] += 1
+            self.vocabulary.update(grams)
+        return self
+
+    def _log_likelihood(self, label, grams):
+        counts, total = self.counts[label], self.totals[label] + self.alpha * (len(self.vocabulary) + 1)
+        prior = math.log((self.docs[label] + 1) / (sum(self.docs.values()) + 2))
+        return prior + sum(math.log((counts.get(gram, 0) + self.alpha) / total) for gram in grams)
+
+    def predict(self, text):
+        """返回 (标签, 置信度)
+
+        朴素贝叶斯的后验在长文本上几乎总是接近 0 或 1，这里把对数似然差按特征数的平方根缩放后再取 sigmoid，
+        使置信度随证据强度平滑变化。
+        """
+        grams = features(text)
+        if not grams:
+            return OTHER, 0.5
+        margin = (self._log_likelihood(DEV, grams) - self._log_likelihood(OTHER, grams)) / math.sqrt(len(grams))
+        p_dev = 1 / (1 + math.exp(-max(min(margin, 50), -50)))
+        return (DEV, p_dev) if p_dev >= 0.5 else (OTHER, 1 - p_dev)
+
+
+def load_samples(path=SAMPLES_PATH):
+    """读取标注样本，返回 [(文本, 标签)]"""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                samples.append((record["text"], record["label"]))
+    return samples
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_intent_model():
+    """进程内共享的分类模型（首次使用时训练）"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = NaiveBayesIntent().fit(load_samples())
+        return _model
+
+
+def classify_intent(text, model=None):
+    """本地意图分类，返回 IntentResult(label, confidence, source)"""
+    normalized = _normalize(text)
+    if not normalized:
+        return IntentResult(OTHER, RULE_CONFIDENCE, "rules")
+    if DEV_RULE.search(normalized):
+        return IntentResult(DEV, DEV_RULE_CONFIDENCE, "rules")
+    if CHAT_RULE.search(normalized) and not TECH_TERMS.search(normalized):
+        return IntentResult(OTHER, RULE_CONFIDENCE, "rules")
+    label, confidence = (model or get_intent_model()).predict(normalized)
+    if DEV_HINT.search(normalized):
+        confidence = min(confidence, HINT_CONFIDENCE)
+    return IntentResult(label, round(confidence, 4), "model")
+
+
+def local_intent(text):
+    """意图识别节点使用的本地判断：可以直接采用时返回 IntentResult，需要模型判断时返回 None"""
+    if INTENT_CLASSIFIER == "off":
+        return None
+    result = classify_intent(text)
+    if INTENT_CLASSIFIER == "local" or result.confidence >= INTENT_CONFIDENCE:
+        return result
+    return None
+
+
+def parse_intent_answer(text):
+    """解析模型的"是 / 否"回答：看回答开头，避免"不是"中的"是"被误判"""
+    answer = re.sub(r"^[\s\"'“”‘’*#>:：\-]+", "", text or "").lower()
+    if answer.startswith(("不是", "否", "不", "no")):
+        return False
+    if answer.startswith(("是", "yes", "对")):
+        return True
+    # 开头没有明确结论时，按全文中肯定与否定的出现情况判断
+    return "是" in answer and "不是" not in answer and "否" not in answer
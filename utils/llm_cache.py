@@ -0,0 +1,282 @@
+"""
+持久化的 LLM 响应缓存（SQLite），替代进程内的 InMemoryCache
+
+缓存键由完整的 llm_string（包括绑定的工具）与提示词组成。ChatOllama 默认的 llm_string 只有 _type 与 stop，
+因此模型客户端使用 KeyedChatOllama，把模型名、采样参数、num_ctx、format 与 stop 加入 llm_string，
+不同模型或采样配置不会共享缓存条目。支持按条目数与总字节数的 LRU 淘汰，并记录命中/未命中次数。
+
+命令行用法：
+    python -m utils.llm_cache stats
+    python -m utils.llm_cache list [--limit 20]
+    python -m utils.llm_cache purge [--model llama3.1:8b] [--older-than 7d]
+"""
+
+import argparse
+import ast
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_ollama import ChatOllama
+
+from utils.metrics import record_cache
+
+
+DEFAULT_CACHE_PATH = os.environ.get("AUTOSPEC_LLM_CACHE", os.path.join(".autospec_cache", "llm_cache.sqlite"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("AUTOSPEC_LLM_CACHE_MAX_ENTRIES", "5000"))
+DEFAULT_MAX_BYTES = int(os.environ.get("AUTOSPEC_LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# 影响模型输出、必须加入缓存键的模型参数
+KEY_ATTRIBUTES = ("model", "temperature", "top_k", "top_p", "num_ctx", "format", "stop")
+
+
+def llm_key_params(llm):
+    """模型对象自身影响输出的参数；实例的 stop 记为 model_stop，避免被调用时传入的 stop 覆盖"""
+    params = {}
+    for name in KEY_ATTRIBUTES:
+        value = getattr(llm, name, None)
+        if value is not None:
+            params["model_stop" if name == "stop" else name] = value
+    return params
+
+
+class CacheKeyParams:
+    """混入类：把 llm_key_params 加入 _identifying_params，从而进入 llm_string"""
+
+    @property
+    def _identifying_params(self):
+        return {**super()._identifying_params, **llm_key_params(self)}
+
+
+class KeyedChatOllama(CacheKeyParams, ChatOllama):
+    """llm_string 包含模型名与采样参数的 ChatOllama"""
+
+
+def normalize_prompt(prompt):
+    """规范化提示词：只统一换行符，代码中的空白有意义，不做折叠"""
+    return prompt.replace("\r\n", "\n")
+
+
+def parse_llm_string(llm_string):
+    """从 llm_string 中提取模型名（用于统计与按模型清理）"""
+    # 非序列化模型的 llm_string 形如 "[('model', 'x'), ('temperature', 0.2), ...]"
+    param_string = llm_string.rsplit("---", 1)[-1]
+    try:
+        parsed = ast.literal_eval(param_string)
+        params = dict(item for item in parsed if isinstance(item, tuple) and len(item) == 2)
+    except (ValueError, SyntaxError, TypeError):
+        params = {}
+    model = params.get("model") or params.get("model_name")
+    if not model:
+        match = re.search(r"['\"]model(?:_name)?['\"]\s*[:,]\s*['\"]([^'\"]+)['\"]", llm_string)
+        model = match.group(1) if match else "unknown"
+    return model
+
+
+def make_cache_key(prompt, llm_string):
+    """生成缓存键，返回 (key, model)：完整的 llm_string 与提示词都参与哈希"""
+    model = parse_llm_string(llm_string)
+    raw = "\x1f".join([llm_string, normalize_prompt(prompt)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest(), model
+
+
+class SQLiteLLMCache(BaseCache):
+    """基于 SQLite 的持久化 LLM 缓存，带 LRU 与总大小淘汰"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                prompt_preview TEXT,
+                value TEXT,
+                size INTEGER,
+                created REAL,
+                last_access REAL,
+                hits INTEGER DEFAULT 0
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+
+    def _bump_stat(self, name):
+        self._conn.execute(
+            "INSERT INTO cache_stats(name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def lookup(self, prompt, llm_string):
+        """查找缓存，反序列化成功后才计为命中并更新访问时间"""
+        key, model = make_cache_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        value = None
+        if row is not None:
+            try:
+                value = loads(row[0])
+            except Exception:
+                # 反序列化失败视为未命中
+                value = None
+        with self._lock:
+            if value is None:
+                self._bump_stat("misses")
+            else:
+                self._conn.execute(
+                    "UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                    (time.time(), key),
+                )
+                self._bump_stat("hits")
+            self._conn.commit()
+        record_cache("llm", "miss" if value is None else "hit", model)
+        return value
+
+    def update(self, prompt, llm_string, return_val):
+        """写入缓存并执行淘汰"""
+        key, model = make_cache_key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, model, prompt_preview, value, size, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, model, " ".join(prompt.split())[:200], value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """按最近最少使用顺序淘汰，直到满足条目数与总大小限制"""
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            evicted += 1
+        if evicted:
+            self._conn.execute(
+                "INSERT INTO cache_stats(name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                (evicted, evicted),
+            )
+
+    def clear(self, **kwargs):
+        """清空缓存（保留统计计数）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def purge(self, model=None, older_than=None):
+        """按模型或最后访问时间删除条目，返回删除数量"""
+        clauses, args = [], []
+        if model:
+            clauses.append("model = ?")
+            args.append(model)
+        if older_than is not None:
+            clauses.append("last_access < ?")
+            args.append(time.time() - older_than)
+        sql = "DELETE FROM llm_cache" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            deleted = self._conn.execute(sql, args).rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def entries(self, limit=20):
+        """按最近访问顺序列出缓存条目"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT model, size, hits, last_access, prompt_preview FROM llm_cache "
+                "ORDER BY last_access DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+
+_llm_cache = None
+
+
+def init_llm_cache(path=None):
+    """初始化并注册全局持久化缓存（重复调用返回同一实例）"""
+    global _llm_cache
+    from langchain_core.globals import set_llm_cache
+
+    if _llm_cache is None or (path and path != _llm_cache.path):
+        _llm_cache = SQLiteLLMCache(path or DEFAULT_CACHE_PATH)
+        set_llm_cache(_llm_cache)
+    return _llm_cache
+
+
+def _parse_duration(text):
+    """解析 30s / 10m / 12h / 7d 形式的时长，返回秒数"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd]?)", text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"无法解析时长: {text}")
+    return float(match.group(1)) * units[match.group(2) or "s"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看或清理 AutoSpec 的 LLM 响应缓存")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH, help="缓存文件路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="显示命中率、条目数和大小")
+    list_parser = sub.add_parser("list", help="列出最近访问的缓存条目")
+    list_parser.add_argument("--limit", type=int, default=20)
+    purge_parser = sub.add_parser("purge", help="删除缓存条目")
+    purge_parser.add_argument("--model", help="只删除该模型的条目")
+    purge_parser.add_argument("--older-than", type=_parse_duration, help="只删除超过该时长未访问的条目，如 7d")
+    args = parser.parse_args(argv)
+
+    cache = SQLiteLLMCache(args.path)
+    if args.command == "stats":
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+    elif args.command == "list":
+        for model, size, hits, last_access, preview in cache.entries(args.limit):
+            accessed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_access))
+            print(f"[{accessed}] {model} {size}B hits={hits} {preview[:80]}")
+    elif args.command == "purge":
+        deleted = cache.purge(model=args.model, older_than=args.older_than)
+        print(f"已删除 {deleted} 条缓存")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+有界的消息历史
+
+每次工具调用都会向 messages 追加带完整搜索结果的 AIMessage / ToolMessage，消息列表只增不减，
+后续的模型调用会越来越慢。这里的窗口策略让每次调用的提示词大小基本保持不变：
+    - 最近 AUTOSPEC_HISTORY_TURNS 轮对话（每轮从一条用户消息开始）原样保留，
+      当前轮次内最多保留最近 AUTOSPEC_HISTORY_MESSAGES 条消息；
+    - 窗口之外的消息从状态中删除（RemoveMessage），其要点折叠进 history_summary；
+    - 已经被节点使用过的工具结果替换为简短占位（按消息 id 覆盖）。
+"""
+
+import os
+
+from langchain_core.messages import RemoveMessage, SystemMessage, ToolMessage
+
+
+HISTORY_TURNS = int(os.environ.get("AUTOSPEC_HISTORY_TURNS", "3"))
+HISTORY_MESSAGES = int(os.environ.get("AUTOSPEC_HISTORY_MESSAGES", "12"))
+SUMMARY_CHARS = int(os.environ.get("AUTOSPEC_SUMMARY_CHARS", "2000"))
+SUMMARY_LINE_CHARS = 120
+STUB_PREFIX = "[工具结果已使用"
+
+
+def _role(message):
+    if isinstance(message, dict):
+        return message.get("role", "")
+    return getattr(message, "type", "")
+
+
+def _content(message):
+    content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def _is_user(message):
+    return _role(message) in ("user", "human")
+
+
+def latest_user_message(state):
+    """最近一条用户消息的内容（工具调用之后最后一条消息不一定是用户消息）"""
+    for message in reversed(state.get("messages") or []):
+        if _is_user(message):
+            return _content(message)
+    return ""
+
+
+def _window(messages):
+    """返回窗口内保留的消息下标：最近若干轮，且当前轮次的用户消息始终保留"""
+    users = [i for i, message in enumerate(messages) if _is_user(message)]
+    start = users[-HISTORY_TURNS] if len(users) >= HISTORY_TURNS else 0
+    start = max(start, len(messages) - HISTORY_MESSAGES)
+    # 不从工具结果开始，避免把工具调用与其结果拆开
+    while start > 0 and isinstance(messages[start], ToolMessage):
+        start -= 1
+    keep = list(range(start, len(messages)))
+    if users and users[-1] < start:
+        keep.insert(0, users[-1])
+    return keep
+
+
+def summarize_messages(messages, summary=""):
+    """把消息的要点追加到摘要中，摘要超过 SUMMARY_CHARS 时丢弃最早的内容"""
+    lines = [summary] if summary else []
+    for message in messages:
+        role = _role(message)
+        text = " ".join(_content(message).split())
+        # 工具结果与只包含工具调用的消息不进入摘要
+        if role in ("tool", "system") or not text or text.startswith(STUB_PREFIX):
+            continue
+        label = "用户" if _is_user(message) else "助手"
+        lines.append(f"- {label}：{text[:SUMMARY_LINE_CHARS]}")
+    summary = "\n".join(lines)
+    if len(summary) > SUMMARY_CHARS:
+        summary = summary[-SUMMARY_CHARS:]
+        summary = summary[summary.find("\n") + 1:]
+    return summary
+
+
+def stub_tool_results(messages):
+    """把工具结果替换为占位消息（相同 id，由 add_messages 覆盖原消息）"""
+    stubs = []
+    for message in messages:
+        if isinstance(message, ToolMessage) and message.id and not _content(message).startswith(STUB_PREFIX):
+            stubs.append(ToolMessage(
+                content=f"{STUB_PREFIX}，原始 {len(_content(message))} 字符已省略]",
+                tool_call_id=message.tool_call_id,
+                name=message.name,
+                id=message.id,
+            ))
+    return stubs
+
+
+def compact_history(state, consumed=True):
+    """计算压缩消息历史的状态更新
+
+    窗口之外的消息被删除并折叠进摘要；consumed 为 True 时（节点已读取过工具结果）
+    把窗口内的工具结果替换为占位。返回可以合并到节点更新中的字典。
+    """
+    messages = list(state.get("messages") or [])
+    keep = set(_window(messages))
+    folded = [message for i, message in enumerate(messages) if i not in keep]
+    recent = [message for i, message in enumerate(messages) if i in keep]
+
+    updates = [RemoveMessage(id=message.id) for message in folded if getattr(message, "id", None)]
+    if consumed:
+        updates += stub_tool_results(recent)
+
+    result = {}
+    if updates:
+        result["messages"] = updates
+    if folded:
+        result["history_summary"] = summarize_messages(folded, state.get("history_summary", ""))
+    return result
+
+
+def history_messages(state):
+    """供模型使用的对话历史：此前对话的摘要加窗口内的消息"""
+    messages = list(state.get("messages") or [])
+    keep = _window(messages)
+    window = [messages[i] for i in keep]
+    # 状态尚未压缩时，窗口之外的消息临时折叠进摘要
+    kept = set(keep)
+    folded = [message for i, message in enumerate(messages) if i not in kept]
+    summary = summarize_messages(folded, state.get("history_summary", ""))
+    if summary:
+        return [SystemMessage(content=f"此前对话的摘要：\n{summary}")] + window
+    return window
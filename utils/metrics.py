@@ -0,0 +1,349 @@
+"""
+节点、模型与工具调用的结构化指标
+
+MetricsCallbackHandler 作为图运行的回调，记录每个节点的耗时，以及每次模型调用的耗时、首个 token 时间、
+提示词 / 输出 token 数；工具调用、LLM 缓存与搜索缓存的命中情况在调用处直接记录。
+每条记录以 JSON 行写入指标日志，同时累加到进程内的注册表，flush_metrics 把注册表写成 Prometheus 文本文件
+（供 node_exporter 的 textfile collector 读取）。
+
+环境变量：
+    AUTOSPEC_LOG_LEVEL          控制台日志级别（默认 INFO）
+    AUTOSPEC_METRICS_LOG        JSON 指标日志的路径，"-" 表示输出到标准错误（默认不输出）
+    AUTOSPEC_METRICS_TEXTFILE   Prometheus 文本文件的路径（默认不写入）
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+
+
+LOG_LEVEL = os.environ.get("AUTOSPEC_LOG_LEVEL", "INFO")
+METRICS_LOG = os.environ.get("AUTOSPEC_METRICS_LOG", "")
+METRICS_TEXTFILE = os.environ.get("AUTOSPEC_METRICS_TEXTFILE", "")
+
+# 耗时直方图的桶（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    "autospec_node_seconds": ("histogram", "节点执行耗时"),
+    "autospec_llm_seconds": ("histogram", "模型调用耗时"),
+    "autospec_llm_ttft_seconds": ("histogram", "模型调用的首个 token 时间（仅流式调用）"),
+    "autospec_llm_calls_total": ("counter", "模型调用次数"),
+    "autospec_llm_errors_total": ("counter", "模型调用失败次数"),
+    "autospec_llm_prompt_tokens_total": ("counter", "提示词 token 数"),
+    "autospec_llm_completion_tokens_total": ("counter", "输出 token 数"),
+    "autospec_cache_lookups_total": ("counter", "缓存查询次数，result 为 hit / miss / coalesced"),
+    "autospec_tool_seconds": ("histogram", "工具调用耗时"),
+    "autospec_tool_calls_total": ("counter", "工具调用次数，status 为 ok / error / timeout / bad_name"),
+    "autospec_tool_iterations_total": ("counter", "节点请求的工具调用轮数"),
+    "autospec_intent_decisions_total": ("counter", "意图判断次数，source 为 rules / model（本地）或 llm"),
+    "autospec_speculation_total": ("counter", "推测生成次数，outcome 为 hit（保留生成结果）/ miss（探测请求工具，丢弃生成）"),
+    "autospec_speculation_seconds": ("histogram", "推测生成中探测与生成重叠的时间：hit 时为节省的时间，miss 时为浪费的生成时间"),
+}
+
+logger = logging.getLogger("autospec")
+metrics_logger = logging.getLogger("autospec.metrics")
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """每条指标记录输出为一行 JSON"""
+
+    def format(self, record):
+        payload = {"ts": round(record.created, 3), "event": record.getMessage()}
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None, metrics_log=None):
+    """配置控制台日志与 JSON 指标日志（重复调用只生效一次）"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(console)
+        logger.setLevel(level or LOG_LEVEL)
+
+        # 指标日志不进入控制台
+        metrics_logger.propagate = False
+        metrics_logger.setLevel(logging.INFO)
+        path = METRICS_LOG if metrics_log is None else metrics_log
+        if path:
+            if path == "-":
+                handler = logging.StreamHandler()
+            else:
+                dir_name = os.path.dirname(path)
+                if dir_name:
+                    os.makedirs(dir_name, exist_ok=True)
+                handler = logging.FileHandler(path, encoding="utf-8")
+            handler.setFormatter(JSONFormatter())
+            metrics_logger.addHandler(handler)
+
+
+def log_event(event, **fields):
+    """写入一条 JSON 指标记录"""
+    if metrics_logger.handlers:
+        metrics_logger.info(event, extra={"fields": fields})
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+class MetricsRegistry:
+    """进程内的计数器与直方图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            buckets, total, count = self._histograms.get(key) or ([0] * len(LATENCY_BUCKETS), 0.0, 0)
+            buckets = [n + (value <= bound) for n, bound in zip(buckets, LATENCY_BUCKETS)]
+            self._histograms[key] = (buckets, total + value, count + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters), dict(self._histograms)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus 文本格式"""
+        counters, histograms = self.snapshot()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            series = counters if kind == "counter" else histograms
+            items = sorted((labels, value) for (metric, labels), value in series.items() if metric == name)
+            if not items:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in items:
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                buckets, total, count = value
+                for bound, n in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {n}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {round(total, 6)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """进程内共享的指标注册表"""
+    return _registry
+
+
+def flush_metrics(path=None):
+    """把指标写入 Prometheus 文本文件（先写临时文件再替换，采集端不会读到半个文件）"""
+    path = path or METRICS_TEXTFILE
+    if not path:
+        return None
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_registry.render())
+    os.replace(tmp_path, path)
+    return path
+
+
+def current_node():
+    """当前正在执行的图节点（在节点内部调用时有效）"""
+    config = var_child_runnable_config.get() or {}
+    return (config.get("metadata") or {}).get("langgraph_node")
+
+
+def record_cache(cache, result, model=None):
+    """记录一次缓存查询，result 为 hit / miss / coalesced"""
+    node = current_node()
+    _registry.inc("autospec_cache_lookups_total", cache=cache, result=result, node=node)
+    log_event("cache", cache=cache, result=result, node=node, model=model)
+
+
+def record_tool(tool, seconds, status):
+    """记录一次工具调用"""
+    _registry.inc("autospec_tool_calls_total", tool=tool, status=status)
+    _registry.observe("autospec_tool_seconds", seconds, tool=tool)
+    log_event("tool", tool=tool, seconds=round(seconds, 4), status=status)
+
+
+def record_tool_iteration(node):
+    """记录节点请求的一轮工具调用"""
+    _registry.inc("autospec_tool_iterations_total", node=node)
+    log_event("tool_iteration", node=node)
+
+
+def record_intent(source, label, confidence=None):
+    """记录一次意图判断"""
+    _registry.inc("autospec_intent_decisions_total", source=source, label=label)
+    log_event("intent", source=source, label=label, confidence=confidence)
+
+
+def record_speculation(node, outcome, seconds):
+    """记录一次推测生成"""
+    _registry.inc("autospec_speculation_total", node=node, outcome=outcome)
+    _registry.observe("autospec_speculation_seconds", seconds, node=node, outcome=outcome)
+    log_event("speculation", node=node, outcome=outcome, seconds=round(seconds, 4))
+
+
+def _usage(response):
+    """从 LLMResult 中取得 (提示词 token, 输出 token)"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """记录一次运行中各节点与模型调用的指标，同时汇总本次运行的数据"""
+
+    # 回调只做计数，直接在调用线程中执行
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._nodes = {}
+        self._llm_calls = {}
+        self.node_seconds = {}
+        self.llm = {"calls": 0, "errors": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    # 节点：只记录节点最外层的运行
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if not node or node.startswith("__"):
+            return
+        with self._lock:
+            self._runs[run_id] = node
+            if self._runs.get(parent_run_id) != node:
+                self._nodes[run_id] = (node, time.perf_counter())
+
+    def _end_chain(self, run_id, status):
+        with self._lock:
+            self._runs.pop(run_id, None)
+            started = self._nodes.pop(run_id, None)
+            if started is None:
+                return
+            node, at = started
+            seconds = time.perf_counter() - at
+            self.node_seconds[node] = self.node_seconds.get(node, 0.0) + seconds
+        _registry.observe("autospec_node_seconds", seconds, node=node)
+        log_event("node", node=node, seconds=round(seconds, 4), status=status)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_chain(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_chain(run_id, "error")
+
+    # 模型调用
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        metadata = metadata or {}
+        with self._lock:
+            self._llm_calls[run_id] = {
+                "node": metadata.get("langgraph_node"),
+                "model": metadata.get("ls_model_name"),
+                "started": time.perf_counter(),
+                "ttft": None,
+            }
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, [], run_id=run_id, metadata=metadata, **kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            call = self._llm_calls.get(run_id)
+            if call and call["ttft"] is None:
+                call["ttft"] = time.perf_counter() - call["started"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            call = self._llm_calls.pop(run_id, None)
+        if call is None:
+            return
+        seconds = time.perf_counter() - call["started"]
+        prompt_tokens, completion_tokens = _usage(response)
+        labels = {"node": call["node"], "model": call["model"]}
+        _registry.inc("autospec_llm_calls_total", **labels)
+        _registry.observe("autospec_llm_seconds", seconds, **labels)
+        if call["ttft"] is not None:
+            _registry.observe("autospec_llm_ttft_seconds", call["ttft"], **labels)
+        _registry.inc("autospec_llm_prompt_tokens_total", prompt_tokens, **labels)
+        _registry.inc("autospec_llm_completion_tokens_total", completion_tokens, **labels)
+        with self._lock:
+            self.llm["calls"] += 1
+            self.llm["seconds"] += seconds
+            self.llm["prompt_tokens"] += prompt_tokens
+            self.llm["completion_tokens"] += completion_tokens
+        log_event(
+            "llm", seconds=round(seconds, 4),
+            ttft=round(call["ttft"], 4) if call["ttft"] is not None else None,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, **labels,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            call = self._llm_calls.pop(run_id, None)
+            if call is not None:
+                self.llm["errors"] += 1
+        if call is None:
+            return
+        _registry.inc("autospec_llm_errors_total", node=call["node"], model=call["model"])
+        log_event("llm_error", node=call["node"], model=call["model"], error=f"{type(error).__name__}: {error}")
+
+    def summary(self):
+        """本次运行的指标汇总"""
+        with self._lock:
+            nodes = {node: round(seconds, 3) for node, seconds in self.node_seconds.items()}
+            llm = dict(self.llm, seconds=round(self.llm["seconds"], 3))
+        return {"nodes": dict(sorted(nodes.items(), key=lambda item: -item[1])), "llm": llm}
+
+
+def format_metrics_summary(summary):
+    """格式化的运行指标：按耗时从高到低列出节点"""
+    if not summary or not summary.get("nodes"):
+        return "[METRICS] 无指标"
+    llm = summary["llm"]
+    nodes = "，".join(f"{node} {seconds}s" for node, seconds in summary["nodes"].items())
+    return (f"[METRICS] 节点耗时: {nodes}；模型调用 {llm['calls']} 次，{llm['seconds']}s，"
+            f"提示词 {llm['prompt_tokens']} tokens，输出 {llm['completion_tokens']} tokens")
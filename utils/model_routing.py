@@ -0,0 +1,132 @@
+"""
+按节点选择模型
+
+路由配置（JSON，默认 models.json，可用 AUTOSPEC_MODELS 指定）为每个节点指定模型、采样参数与备用模型：
+
+    {
+      "default": {"model": "llama3.1:8b", "temperature": 0.7, "streaming": true},
+      "routes": {
+        "intent_recognition": {"model": "llama3.2:3b", "temperature": 0.1, "fallbacks": ["llama3.1:8b"]},
+        "generate_code": {"model": "qwen3-coder:30b", "fallbacks": [{"model": "qwen2.5-coder:7b", "num_ctx": 8192}]}
+      },
+      "models": {
+        "llama3.1:8b": {"keep_alive": "30m", "num_ctx": 8192}
+      }
+    }
+
+路由名为图节点名，另有 project_name（意图识别中的项目命名）与 work_report（工作汇报）。
+路由中未写的参数继承 default；备用模型可以只写模型名（继承所在路由的参数），也可以写完整配置。
+主模型调用失败（例如模型未下载、服务不可用）时依次尝试备用模型；需要工具时先为每个模型绑定工具，再组合备用链。
+未启用路由时各节点使用调用方传入的模型。
+
+"models" 段按模型固定参数（见 utils/registry.pin_model_options），覆盖路由中的同名参数：同一个模型被多个路由使用时
+num_ctx 保持一致，Ollama 不会因此重新加载模型而丢弃 KV 缓存。配置文件只有 "models" 段时只固定参数，不启用路由。
+"""
+
+import json
+import os
+import threading
+
+from utils.registry import get_llm, get_llm_with_tools, pin_model_options
+
+
+MODELS_PATH = os.environ.get("AUTOSPEC_MODELS", "models.json")
+DEFAULT_ROUTE = {"model": "llama3.1:8b", "temperature": 0.7, "streaming": True}
+
+
+def load_routing(path=None):
+    """读取路由配置，文件不存在时返回 None"""
+    path = path or MODELS_PATH
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if "default" in config or "routes" in config:
+        config.setdefault("default", dict(DEFAULT_ROUTE))
+        config.setdefault("routes", {})
+    return config
+
+
+def _specs(config, route):
+    """路由对应的模型配置列表：主模型在前，备用模型在后"""
+    default = dict(config.get("default") or DEFAULT_ROUTE)
+    default.pop("fallbacks", None)
+    entry = dict(config["routes"].get(route) or {})
+    fallbacks = entry.pop("fallbacks", None)
+    if fallbacks is None:
+        fallbacks = [] if route == "default" else (config.get("default") or {}).get("fallbacks", [])
+    primary = dict(default, **entry)
+    specs = [primary]
+    for fallback in fallbacks:
+        spec = {"model": fallback} if isinstance(fallback, str) else dict(fallback)
+        specs.append(dict(primary, **spec))
+    return specs
+
+
+class ModelRouter:
+    """按路由名创建（并复用）带备用链的模型"""
+
+    def __init__(self, config, wrap=None):
+        self.config = config
+        self.wrap = wrap
+        self._lock = threading.Lock()
+        self._llms = {}
+
+    def specs(self, route):
+        return _specs(self.config, route)
+
+    def llm(self, route, tools=None):
+        """路由对应的模型；tools 不为空时返回绑定了工具的模型"""
+        key = (route, tuple(tool.name for tool in tools or []))
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = self._llms[key] = self._build(route, tools)
+            return llm
+
+    def _build(self, route, tools):
+        llms = []
+        for spec in self.specs(route):
+            params = dict(spec)
+            model = params.pop("model")
+            # 工具要绑定在每个模型上，备用链本身不支持 bind_tools
+            llms.append(get_llm_with_tools(model, tools, **params) if tools else get_llm(model, **params))
+        llm = llms[0].with_fallbacks(llms[1:]) if len(llms) > 1 else llms[0]
+        return self.wrap(llm) if self.wrap else llm
+
+    def describe(self):
+        """各路由使用的模型"""
+        routes = ["default"] + sorted(self.config["routes"])
+        return {route: [spec["model"] for spec in self.specs(route)] for route in routes}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def set_model_routing(config, wrap=None):
+    """启用路由配置（config 为 None 时停用），wrap 用于包装每个路由的模型（例如并发限制）"""
+    global _router
+    for model, options in ((config or {}).get("models") or {}).items():
+        pin_model_options(model, **options)
+    with _router_lock:
+        _router = ModelRouter(config, wrap) if config and "routes" in config else None
+        return _router
+
+
+def enable_model_routing(path=None, wrap=None):
+    """从配置文件启用路由，文件不存在时保持停用，返回路由器或 None"""
+    return set_model_routing(load_routing(path), wrap)
+
+
+def get_model_router():
+    """当前的路由器，未启用时返回 None"""
+    return _router
+
+
+def routed_llm(route, default, tools=None):
+    """路由对应的模型；未启用路由时返回 default"""
+    router = _router
+    if router is None:
+        return default
+    return router.llm(route, tools)
@@ -0,0 +1,206 @@
+"""
+不依赖模型的项目命名与项目目录分配
+
+项目名由用户需求直接生成：英文单词直接使用，中文按关键词表（最长匹配）翻译为英文单词，
+表中没有的中文在安装了 pypinyin 时转为拼音，否则忽略；"开发""一个""简单"等无意义的词会被跳过。
+结果为不超过 30 个字符的驼峰名称。
+
+目录分配用 os.mkdir 原子创建：目录已存在时从计数提示文件记录的后缀继续尝试，不需要逐个检查 _1、_2……，
+多个流水线同时分配同名目录时也不会拿到同一个目录。
+
+环境变量：
+    AUTOSPEC_PROJECT_NAMING   local（默认，本地生成）、auto（本地无法生成有意义的名称时再调用模型）或 llm（总是调用模型）
+"""
+
+import os
+import re
+import threading
+
+
+PROJECT_NAMING = os.environ.get("AUTOSPEC_PROJECT_NAMING", "local")
+DEFAULT_PROJECT_NAME = "Project"
+MAX_NAME_LENGTH = 30
+MAX_WORDS = 4
+# 目录计数提示文件所在的子目录（位于 base_dir 下）
+INDEX_DIR = os.path.join(".autospec_cache", "project_index")
+
+# 中文关键词 -> 英文单词
+KEYWORDS = {
+    "待办事项": "Todo", "待办": "Todo", "任务": "Task", "清单": "List", "日程": "Schedule", "提醒": "Reminder",
+    "图书": "Book", "书籍": "Book", "读书": "Reading", "笔记": "Note", "博客": "Blog", "论坛": "Forum", "社区": "Community",
+    "新闻": "News", "文章": "Article", "知识库": "Wiki", "问答": "QA", "简历": "Resume", "作品集": "Portfolio",
+    "电商": "Shop", "商城": "Shop", "购物": "Shopping", "订单": "Order", "库存": "Inventory", "支付": "Payment",
+    "外卖": "Delivery", "点餐": "Ordering", "餐厅": "Restaurant", "酒店": "Hotel", "预订": "Booking", "预约": "Booking",
+    "二手": "Secondhand", "租房": "Rental", "物流": "Logistics", "停车": "Parking", "快递": "Express",
+    "聊天": "Chat", "即时通讯": "Messenger", "社交": "Social", "投票": "Vote", "问卷": "Survey", "抽奖": "Lottery",
+    "记账": "Ledger", "账本": "Ledger", "财务": "Finance", "工资": "Payroll", "考勤": "Attendance", "员工": "Employee",
+    "客户": "Customer", "会员": "Member", "用户": "User", "登录": "Login", "注册": "Signup", "权限": "Permission",
+    "学生": "Student", "成绩": "Grade", "选课": "Course", "课程": "Course", "考试": "Exam", "教育": "Education",
+    "背单词": "Vocabulary", "单词": "Vocabulary", "医院": "Hospital", "挂号": "Registration", "健身": "Fitness",
+    "打卡": "Checkin", "体重": "Weight", "健康": "Health", "宠物": "Pet", "领养": "Adoption",
+    "天气": "Weather", "音乐": "Music", "播放器": "Player", "视频": "Video", "弹幕": "Danmaku", "图片": "Image",
+    "相册": "Album", "文件": "File", "上传": "Upload", "下载": "Download", "压缩": "Compress", "备份": "Backup",
+    "重命名": "Rename", "转换": "Converter", "合并": "Merge", "搜索": "Search", "搜索引擎": "SearchEngine",
+    "爬虫": "Crawler", "监控": "Monitor", "日志": "Log", "分析": "Analytics", "数据": "Data", "可视化": "Visualization",
+    "仪表盘": "Dashboard", "报表": "Report", "周报": "WeeklyReport", "缓存": "Cache", "代理": "Proxy",
+    "短链接": "ShortLink", "链接": "Link", "计算器": "Calculator", "倒计时": "Countdown", "番茄钟": "Pomodoro",
+    "贪吃蛇": "Snake", "五子棋": "Gomoku", "游戏": "Game", "白板": "Whiteboard", "看板": "Kanban",
+    "会议室": "MeetingRoom", "会议": "Meeting", "智能家居": "SmartHome", "机器人": "Bot", "区块链": "Blockchain",
+    "翻译": "Translator", "地图": "Map", "旅游": "Travel", "菜谱": "Recipe", "识别": "Recognition", "查询": "Query",
+    "推荐": "Recommend", "人脸": "Face", "图像": "Image", "语音": "Voice", "文本": "Text", "邮件": "Mail", "短信": "Sms",
+    "管理系统": "Manager", "管理": "Manager", "系统": "System", "平台": "Platform", "网站": "Site", "网页": "Web",
+    "官网": "Site", "小程序": "MiniApp", "应用": "App", "工具": "Tool", "服务": "Service", "后台": "Admin",
+    "插件": "Plugin", "脚本": "Script", "接口": "Api",
+}
+# 跳过的中文词
+STOPWORDS = (
+    "帮我", "给我", "请你", "请", "我想要", "我想", "我要", "我需要", "需要", "能不能", "可以", "一下",
+    "创建", "开发", "实现", "编写", "设计", "搭建", "构建", "生成", "制作", "做个", "做", "写个", "写",
+    "一个", "一款", "一套", "个", "简单", "简易", "基于", "支持", "用于", "用来", "能够", "能", "的", "和", "与",
+)
+# 跳过的英文单词
+ENGLISH_STOPWORDS = {
+    "a", "an", "the", "and", "or", "for", "with", "to", "of", "in", "on", "my", "me", "i", "that", "which",
+    "please", "build", "create", "make", "write", "develop", "implement", "design", "simple", "basic", "need", "want",
+}
+# 通用的对象词：名称中已有其他单词时放在最后，只有对象词时也可以单独使用
+GENERIC_WORDS = {"App", "System", "Platform", "Site", "Web", "Tool", "Service", "MiniApp", "Manager", "Script"}
+
+_CJK = re.compile(r"[一-鿿]+")
+_TOKEN = re.compile(r"[A-Za-z][A-Za-z0-9]*|[一-鿿]+")
+# 按首字索引的词表（长词在前），匹配时只比较同一首字的词
+_lexicon = {}
+for _word in sorted(list(KEYWORDS) + list(STOPWORDS), key=len, reverse=True):
+    _lexicon.setdefault(_word[0], []).append(_word)
+
+
+_lazy_pinyin = None
+
+
+def _pinyin(text):
+    """中文转拼音单词，未安装 pypinyin 时返回空列表"""
+    global _lazy_pinyin
+    if _lazy_pinyin is None:
+        try:
+            from pypinyin import lazy_pinyin as _lazy_pinyin
+        except ImportError:
+            _lazy_pinyin = False
+    if not _lazy_pinyin:
+        return []
+    return ["".join(_lazy_pinyin(text)).capitalize()]
+
+
+def _chinese_words(segment):
+    """按关键词表最长匹配切分中文片段"""
+    words = []
+    unknown = ""
+    i = 0
+    while i < len(segment):
+        match = next((word for word in _lexicon.get(segment[i], ()) if segment.startswith(word, i)), None)
+        if match is None:
+            unknown += segment[i]
+            i += 1
+            continue
+        if unknown:
+            words.extend(_pinyin(unknown))
+            unknown = ""
+        if match in KEYWORDS:
+            words.append(KEYWORDS[match])
+        i += len(match)
+    if unknown:
+        words.extend(_pinyin(unknown))
+    return words
+
+
+def slugify_request(text):
+    """由用户需求生成驼峰项目名，无法提取有意义的单词时返回空字符串"""
+    words = []
+    for token in _TOKEN.findall(text or ""):
+        if _CJK.match(token):
+            words.extend(_chinese_words(token))
+        elif token.lower() not in ENGLISH_STOPWORDS:
+            words.append(token[0].upper() + token[1:])
+
+    # 去重并把通用对象词放到最后（"系统管理图书" -> BookManager）
+    unique = []
+    for word in words:
+        if word not in unique:
+            unique.append(word)
+    specific = [word for word in unique if word not in GENERIC_WORDS]
+    generic = [word for word in unique if word in GENERIC_WORDS]
+    words = specific[:MAX_WORDS - 1] + generic[:1] if specific else generic[:1]
+
+    name = ""
+    for word in words:
+        if len(name) + len(word) > MAX_NAME_LENGTH:
+            break
+        name += word
+    return name
+
+
+def local_project_name(user_message):
+    """意图识别节点使用的本地命名：可以直接采用时返回项目名，需要模型命名时返回 None"""
+    if PROJECT_NAMING == "llm":
+        return None
+    name = slugify_request(user_message)
+    # auto 模式下只提取到通用对象词（例如只有 System）时也交给模型命名
+    if PROJECT_NAMING == "auto" and (not name or name in GENERIC_WORDS):
+        return None
+    return name or DEFAULT_PROJECT_NAME
+
+
+def sanitize_project_name(project_name):
+    """清理模型生成的项目文件夹名称：只保留字母、数字、下划线与连字符，且以字母开头"""
+    name = re.sub(r"[^A-Za-z0-9_-]", "", (project_name or "").strip())[:MAX_NAME_LENGTH]
+    if not name:
+        return DEFAULT_PROJECT_NAME
+    if not name[0].isalpha():
+        name = (DEFAULT_PROJECT_NAME + name)[:MAX_NAME_LENGTH]
+    return name
+
+
+def _hint_path(base_dir, name):
+    return os.path.join(base_dir or ".", INDEX_DIR, name)
+
+
+def _read_hint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_hint(path, value):
+    """原子更新计数提示；提示只是下一次尝试的起点，并发写入时取到较小的值也只会多尝试几次"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(value))
+    os.replace(tmp_path, path)
+
+
+def allocate_project_dir(project_name, base_dir="."):
+    """在 base_dir 下原子地创建项目目录，重名时添加数字后缀，返回创建的目录路径"""
+    def path_for(name):
+        return os.path.join(base_dir, name) if base_dir and base_dir != "." else name
+
+    if base_dir and base_dir != ".":
+        os.makedirs(base_dir, exist_ok=True)
+    try:
+        os.mkdir(path_for(project_name))
+        return path_for(project_name)
+    except FileExistsError:
+        pass
+
+    hint_path = _hint_path(base_dir, project_name)
+    counter = _read_hint(hint_path)
+    while True:
+        counter += 1
+        new_dir = path_for(f"{project_name}_{counter}")
+        try:
+            os.mkdir(new_dir)
+        except FileExistsError:
+            continue
+        _write_hint(hint_path, counter)
+        return new_dir
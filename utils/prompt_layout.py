@@ -0,0 +1,26 @@
+"""
+KV 缓存友好的提示词布局
+
+Ollama 为每个已加载的模型保留最近请求的 KV 缓存，新请求与缓存有相同前缀时跳过这部分的预填充（prefill）。
+因此各节点的提示词分为两部分：
+    - 节点模块中的 SYSTEM_PROMPT：固定的指令与输出结构，每次运行逐字节相同，作为 system 消息放在最前；
+    - 可变内容（用户需求、上游文档等）：由 build_*_prompt 构造，作为 user 消息放在最后。
+工具探测在正式生成的消息之后追加一条固定的问题，两次调用共享 system 与可变内容的前缀，
+探测的预填充同时为随后的生成预热了缓存，而模型对探测只需简短回答。
+
+SYSTEM_PROMPT 中不要出现需求、文档类型、目录、时间等随运行变化的内容，否则整个前缀都无法复用。
+模型的 num_ctx 不同会导致 Ollama 重新加载模型并丢弃缓存，可以用 utils.registry.pin_model_options 为每个模型固定。
+"""
+
+
+PROBE_INSTRUCTION = "先不要开始生成。如果完成上述任务需要查询资料，请调用 search_tool；否则只回复“不需要”。"
+
+
+def prompt_messages(system_prompt, content):
+    """固定的 system 前缀在前、可变内容在后的消息列表"""
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": content}]
+
+
+def tool_probe_messages(messages):
+    """工具探测的消息：与正式生成的消息前缀相同，末尾追加固定的探测问题"""
+    return list(messages) + [{"role": "user", "content": PROBE_INSTRUCTION}]
@@ -0,0 +1,107 @@
+"""
+进程级的模型客户端与已编译图注册表
+
+模型客户端按 (模型名, 参数) 复用，已编译的图按调用方给定的键复用，
+避免每次提问都重新创建 ChatOllama、重新绑定工具和重新编译 StateGraph。
+
+同一个模型的所有客户端应使用相同的 keep_alive 与 num_ctx：num_ctx 不同时 Ollama 会重新加载模型并丢弃 KV 缓存，
+keep_alive 过短时模型在两次运行之间被卸载。pin_model_options 为模型固定这些参数（覆盖调用方传入的同名参数），
+路由配置的 "models" 段（见 utils/model_routing.py）与环境变量 AUTOSPEC_KEEP_ALIVE（所有模型的默认值，
+例如 30m，-1 表示常驻）最终都通过它生效。
+"""
+
+import os
+import threading
+
+
+_lock = threading.RLock()
+_llms = {}
+_tool_llms = {}
+_graphs = {}
+_llm_factory = None
+# 模型名 -> 固定的参数
+_model_options = {}
+KEEP_ALIVE = os.environ.get("AUTOSPEC_KEEP_ALIVE", "").strip()
+
+
+def _default_llm_factory(model, **params):
+    from utils.llm_cache import KeyedChatOllama
+
+    return KeyedChatOllama(model=model, **params)
+
+
+def set_llm_factory(factory):
+    """替换模型客户端的构造函数（基准测试或离线运行时使用），并清空已缓存的客户端与图"""
+    global _llm_factory
+    with _lock:
+        _llm_factory = factory
+        clear_registry()
+
+
+def _config_key(model, params):
+    return (model, tuple(sorted((name, repr(value)) for name, value in params.items())))
+
+
+def _keep_alive(value):
+    """整数形式的 keep_alive 按秒传给 Ollama，其他按时长字符串（例如 30m）"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def pin_model_options(model, **options):
+    """为模型固定参数（keep_alive、num_ctx 等），之后获取的该模型客户端都使用这些参数；不传参数时取消固定"""
+    with _lock:
+        if options:
+            _model_options[model] = dict(options)
+        else:
+            _model_options.pop(model, None)
+
+
+def model_options(model):
+    """模型固定的参数（包括 AUTOSPEC_KEEP_ALIVE 给出的默认 keep_alive）"""
+    options = {"keep_alive": _keep_alive(KEEP_ALIVE)} if KEEP_ALIVE else {}
+    with _lock:
+        options.update(_model_options.get(model, {}))
+    return options
+
+
+def get_llm(model, **params):
+    """获取（必要时创建）指定配置的模型客户端"""
+    params.update(model_options(model))
+    key = _config_key(model, params)
+    with _lock:
+        llm = _llms.get(key)
+        if llm is None:
+            factory = _llm_factory or _default_llm_factory
+            llm = _llms[key] = factory(model, **params)
+        return llm
+
+
+def get_llm_with_tools(model, tools, **params):
+    """获取绑定了工具的模型客户端"""
+    params.update(model_options(model))
+    key = (_config_key(model, params), tuple(tool.name for tool in tools))
+    with _lock:
+        llm_with_tool = _tool_llms.get(key)
+        if llm_with_tool is None:
+            llm_with_tool = _tool_llms[key] = get_llm(model, **params).bind_tools(tools)
+        return llm_with_tool
+
+
+def get_graph(key, builder):
+    """获取（必要时编译）键对应的图，builder 为无参构造函数"""
+    with _lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = _graphs[key] = builder()
+        return graph
+
+
+def clear_registry():
+    """清空所有缓存的客户端与图"""
+    with _lock:
+        _llms.clear()
+        _tool_llms.clear()
+        _graphs.clear()
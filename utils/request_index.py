@@ -0,0 +1,301 @@
+"""
+近似请求索引：为与历史需求几乎相同的新需求复用或复制已生成的项目文档
+
+每个完成了需求文档的项目按用户需求记录在本地索引中（SQLite，默认 .autospec_cache/request_index.sqlite）。
+条目按项目所在的 base_dir 分开记录与查找：多会话服务中每个用户的项目位于各自的 base_dir 下，
+一个用户的需求不会匹配到其他用户的项目。
+需求先做规范化（小写、去掉空白标点与"帮我""创建""一个""简单"等无意义的词），
+"做一个待办事项应用"与"创建一个简单的待办事项应用"规范化后相同，直接作为同一条记录。
+
+查找分两步：
+    1. 字符 2~3-gram 的 MinHash 签名按 LSH 分段放入哈希桶，只取与查询落在同一桶中的条目作为候选，
+       查找耗时与索引大小基本无关；
+    2. 对候选计算字符 n-gram TF-IDF 余弦相似度，不低于阈值的按相似度排序返回。
+
+意图识别节点找到相似项目后按策略处理：
+    reuse  直接在原项目目录中继续（从第一个未完成的阶段开始，全部完成时直接结束）
+    fork   把原项目复制到新的项目目录后继续，原项目保持不变
+    ask    交互模式下询问用户（main.py），其他入口视为 off
+    off    总是重新生成
+
+环境变量：
+    AUTOSPEC_REQUEST_INDEX        索引文件路径
+    AUTOSPEC_SIMILAR_REQUESTS     上述策略之一（默认 ask）
+    AUTOSPEC_SIMILAR_THRESHOLD    TF-IDF 余弦相似度阈值（默认 0.85）
+"""
+
+import hashlib
+import math
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from collections import Counter, namedtuple
+
+from utils.checkpoint import plan_resume
+from utils.memory import latest_user_message
+from utils.metrics import record_cache
+from utils.project_naming import STOPWORDS
+
+
+DEFAULT_REQUEST_INDEX_PATH = os.environ.get("AUTOSPEC_REQUEST_INDEX", os.path.join(".autospec_cache", "request_index.sqlite"))
+SIMILAR_REQUESTS = os.environ.get("AUTOSPEC_SIMILAR_REQUESTS", "ask")
+SIMILARITY_THRESHOLD = float(os.environ.get("AUTOSPEC_SIMILAR_THRESHOLD", "0.85"))
+
+# MinHash 签名按 LSH 分为 BANDS 段、每段 ROWS 个值，Jaccard 相似度 0.6 的两条需求落入同一桶的概率约 97%
+BANDS = 8
+ROWS = 2
+# 签名估计的 Jaccard 相似度低于该值的候选不再计算 TF-IDF 相似度
+MIN_ESTIMATED_JACCARD = 0.3
+# 每个桶只保留最近的若干条目，避免大量相似需求使候选集无限增长
+BUCKET_LIMIT = 64
+# 每次查找最多比较签名的候选数（按共同桶数排序），以及其中最多计算 TF-IDF 相似度的候选数（按估计的 Jaccard 相似度排序）
+MAX_CANDIDATES = 32
+MAX_SCORED = 5
+
+_SIGNATURE_SIZE = BANDS * ROWS
+_UNPACK = struct.Struct(f"<{_SIGNATURE_SIZE}I").unpack
+# 需求中的语气词
+PARTICLES = ("吧", "呢", "啊", "呀", "哦", "嘛", "谢谢", "please", "thanks")
+_FILLERS = re.compile("|".join(sorted(map(re.escape, STOPWORDS + PARTICLES), key=len, reverse=True)))
+_NOISE = re.compile(r"[\s\W_]+")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS requests ("
+    "id INTEGER PRIMARY KEY, base_dir TEXT, normalized TEXT, text TEXT, project_dir TEXT, signature BLOB, created REAL, "
+    "UNIQUE(base_dir, normalized))"
+)
+
+SimilarRequest = namedtuple("SimilarRequest", ["score", "text", "project_dir"])
+
+
+def _scope(base_dir):
+    """条目所属的范围：base_dir 的绝对路径"""
+    return os.path.abspath(base_dir or ".")
+
+
+def normalize_request(text):
+    """规范化需求：小写，去掉无意义的词、空白与标点"""
+    text = (text or "").lower()
+    stripped = _NOISE.sub("", _FILLERS.sub("", text))
+    # 全部是无意义的词时保留原文，避免不同的空需求互相匹配
+    return stripped or _NOISE.sub("", text)
+
+
+def grams(normalized):
+    """字符 2~3-gram（过短的文本使用单字）"""
+    if len(normalized) < 2:
+        return Counter(normalized)
+    result = Counter(normalized[i:i + 2] for i in range(len(normalized) - 1))
+    result.update(normalized[i:i + 3] for i in range(len(normalized) - 2))
+    return result
+
+
+def minhash(gram_set):
+    """MinHash 签名：每个 gram 的 blake2b 摘要拆成 BANDS * ROWS 个 32 位哈希，逐列取最小值（跨进程稳定）"""
+    rows = [_UNPACK(hashlib.blake2b(gram.encode("utf-8"), digest_size=4 * _SIGNATURE_SIZE).digest()) for gram in gram_set]
+    return array("I", map(min, zip(*rows))) if rows else array("I", bytes(4 * _SIGNATURE_SIZE))
+
+
+def _band_keys(signature, scope):
+    # 桶按范围区分，查找只会取到同一 base_dir 下的候选
+    return [hash((scope, band) + tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+class RequestIndex:
+    """历史需求的近似查找索引"""
+
+    def __init__(self, path=DEFAULT_REQUEST_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._entries = {}
+        self._signatures = {}
+        self._buckets = {}
+        self._df = Counter()
+        # idf 缓存，写入新条目时清空
+        self._idf = {}
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._migrate()
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def _migrate(self):
+        """旧版索引没有 base_dir 列（需求全局唯一）：按项目目录的上级目录补上 base_dir"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(requests)")]
+        if not columns or "base_dir" in columns:
+            return
+        rows = self._conn.execute("SELECT normalized, text, project_dir, signature, created FROM requests").fetchall()
+        self._conn.execute("DROP TABLE requests")
+        self._conn.execute(_SCHEMA)
+        self._conn.executemany(
+            "INSERT INTO requests(base_dir, normalized, text, project_dir, signature, created) VALUES (?, ?, ?, ?, ?, ?)",
+            [(os.path.dirname(row[2]),) + tuple(row) for row in rows],
+        )
+        self._conn.commit()
+
+    def _index(self, entry_id, scope, normalized, text, project_dir, signature):
+        """把条目加入内存索引（调用方持有锁）"""
+        self._entries[entry_id] = (normalized, text, project_dir)
+        self._signatures[entry_id] = signature
+        self._df.update(grams(normalized).keys())
+        self._idf.clear()
+        for key in _band_keys(signature, scope):
+            bucket = self._buckets.setdefault(key, [])
+            bucket.append(entry_id)
+            if len(bucket) > BUCKET_LIMIT:
+                del bucket[0]
+
+    def _load(self):
+        """首次使用时从数据库载入内存索引（调用方持有锁）"""
+        if self._loaded:
+            return
+        for entry_id, scope, normalized, text, project_dir, signature in self._conn.execute(
+            "SELECT id, base_dir, normalized, text, project_dir, signature FROM requests ORDER BY created"
+        ):
+            self._index(entry_id, scope, normalized, text, project_dir, array("I", signature))
+        self._loaded = True
+
+    def add(self, text, project_dir, base_dir="."):
+        """记录需求与对应的项目目录；同一 base_dir 下规范化后相同的需求只保留最新的项目"""
+        normalized = normalize_request(text)
+        if not normalized:
+            return
+        project_dir = os.path.abspath(project_dir)
+        scope = _scope(base_dir)
+        signature = minhash(grams(normalized))
+        with self._lock:
+            self._load()
+            row = self._conn.execute(
+                "SELECT id FROM requests WHERE base_dir = ? AND normalized = ?", (scope, normalized)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE requests SET text = ?, project_dir = ?, created = ? WHERE id = ?",
+                    (text, project_dir, time.time(), row[0]),
+                )
+                self._conn.commit()
+                self._entries[row[0]] = (normalized, text, project_dir)
+                return
+            entry_id = self._conn.execute(
+                "INSERT INTO requests(base_dir, normalized, text, project_dir, signature, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, normalized, text, project_dir, signature.tobytes(), time.time()),
+            ).lastrowid
+            self._conn.commit()
+            self._index(entry_id, scope, normalized, text, project_dir, signature)
+
+    def _idf_of(self, gram, total):
+        idf = self._idf.get(gram)
+        if idf is None:
+            idf = self._idf[gram] = math.log((total + 1) / (self._df.get(gram, 0) + 1)) + 1
+        return idf
+
+    def _vector(self, counts, total):
+        """TF-IDF 向量（调用方持有锁）"""
+        vector = {gram: count * self._idf_of(gram, total) for gram, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {gram: weight / norm for gram, weight in vector.items()}
+
+    def search(self, text, threshold=None, limit=5, base_dir="."):
+        """查找 base_dir 下相似度不低于阈值的历史需求，按相似度从高到低返回 [SimilarRequest]"""
+        threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+        normalized = normalize_request(text)
+        if not normalized:
+            return []
+        query_grams = grams(normalized)
+        signature = minhash(query_grams)
+        keys = _band_keys(signature, _scope(base_dir))
+        with self._lock:
+            self._load()
+            hits = Counter()
+            for key in keys:
+                hits.update(self._buckets.get(key, ()))
+            # 先用签名估计 Jaccard 相似度筛选候选，只对最接近的几条计算 TF-IDF 余弦相似度
+            min_equal = MIN_ESTIMATED_JACCARD * _SIGNATURE_SIZE
+            estimated = []
+            for entry_id, _ in hits.most_common(MAX_CANDIDATES):
+                equal = sum(map(int.__eq__, signature, self._signatures[entry_id]))
+                if equal >= min_equal:
+                    estimated.append((equal, entry_id))
+            estimated.sort(reverse=True)
+
+            total = len(self._entries)
+            query = self._vector(query_grams, total)
+            matches = []
+            for _, entry_id in estimated[:MAX_SCORED]:
+                entry_normalized, entry_text, project_dir = self._entries[entry_id]
+                if entry_normalized == normalized:
+                    score = 1.0
+                else:
+                    candidate = self._vector(grams(entry_normalized), total)
+                    score = sum(weight * candidate.get(gram, 0.0) for gram, weight in query.items())
+                if score >= threshold:
+                    matches.append(SimilarRequest(round(score, 4), entry_text, project_dir))
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return matches[:limit]
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+
+_request_index = None
+_request_index_lock = threading.Lock()
+
+
+def get_request_index():
+    """获取进程内共享的需求索引"""
+    global _request_index
+    with _request_index_lock:
+        if _request_index is None:
+            _request_index = RequestIndex()
+        return _request_index
+
+
+def set_request_index(index):
+    """替换进程内共享的需求索引（基准测试时使用临时索引）"""
+    global _request_index
+    with _request_index_lock:
+        _request_index = index
+
+
+def remember_request(node_name, state, update):
+    """需求文档生成后把需求与项目目录记入索引（此时项目才有可复用的文档）"""
+    if node_name != "generate_requirements" or not isinstance(update, dict) or update.get("next") == "tools":
+        return
+    new_dir = update.get("new_dir") or state.get("new_dir")
+    if new_dir and new_dir != ".":
+        get_request_index().add(latest_user_message(state), new_dir, state.get("base_dir", "."))
+
+
+def find_similar_project(user_message, threshold=None, base_dir="."):
+    """查找 base_dir 下可复用的相似项目：返回 (SimilarRequest, 恢复用状态, 第一个未完成的阶段)，没有时返回 None
+
+    项目目录已被删除、不在 base_dir 下或还没有任何完成的阶段时跳过，继续检查下一个候选。
+    """
+    scope = _scope(base_dir)
+    for match in get_request_index().search(user_message, threshold, base_dir=scope):
+        if os.path.dirname(match.project_dir) != scope or not os.path.isdir(match.project_dir):
+            continue
+        state, resume_from = plan_resume(match.project_dir)
+        if resume_from == "generate_requirements":
+            continue
+        record_cache("similar_request", "hit")
+        return match, state, resume_from
+    record_cache("similar_request", "miss")
+    return None
+
+
+def fork_project(project_dir, new_dir):
+    """把已有项目的文档与代码复制到新分配的项目目录"""
+    shutil.copytree(project_dir, new_dir, dirs_exist_ok=True)
+    return new_dir
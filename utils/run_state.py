@@ -0,0 +1,27 @@
+"""
+单次运行的初始状态与最终响应
+
+main.py、batch.py 与 server.py 共用；本模块没有导入时的副作用（不配置日志、不初始化缓存、不创建模型客户端）。
+"""
+
+
+def initial_state(user_input, reuse_policy=""):
+    """构造图的初始状态，reuse_policy 覆盖 AUTOSPEC_SIMILAR_REQUESTS"""
+    return {
+        "messages": [{"role": "user", "content": user_input}],
+        "next": "",
+        "new_dir": ".",
+        "requirements_content": "",
+        "design_content": "",
+        "tasks_content": "",
+        "code_content": "",
+        "source_node": "",
+        "reuse_policy": reuse_policy,
+    }
+
+
+def final_response(result):
+    """获取最后一条消息作为响应"""
+    if result and "messages" in result and result["messages"]:
+        return result["messages"][-1].content
+    return "抱歉，无法生成响应。"
@@ -0,0 +1,327 @@
+"""
+逐 token 流式生成
+
+生成节点通过 stream_generate 调用模型：每个 token 到达后立即推送给当前的事件消费者（默认打印到控制台），
+同时追加写入目标文件，用户可以在几秒内看到输出，而不是等完整文档生成后才写文件。
+
+事件消费者签名为 sink(node, event, data)，event 取值：
+    start        开始生成，data 为目标文件路径
+    first_token  首个 token 到达，data 为耗时（秒）
+    token        新 token，data 为文本
+    end          生成结束，data 为 {"ttft": 首 token 耗时, "elapsed": 总耗时, "chars": 字符数}
+
+消费者保存在 contextvar 中，不同会话 / 协程可以设置各自的消费者。
+
+备用链（RunnableWithFallbacks，见 utils/model_routing.py）在这里拆开逐个尝试，流式结果按实际响应的模型写入 LLM 缓存，
+备用模型的输出不会缓存在主模型的键下。与备用链相同，已经输出内容后失败不再切换模型。
+
+推测生成（见 utils/tool_decision.py 的 speculative 模式）通过 SpeculationGate 暂存输出：
+闸门打开前 token 只在内存中累积，打开后补发暂存的内容并继续实时输出；闸门被丢弃时停止生成，不产生任何输出。
+"""
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from langchain_core.globals import get_llm_cache
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, convert_to_messages
+from langchain_core.outputs import ChatGeneration
+from langchain_core.runnables import RunnableWithFallbacks
+
+from utils.budget import charge_response
+from utils.concurrency import LimitedLLM
+
+
+STREAMING = os.environ.get("AUTOSPEC_STREAMING", "1") != "0"
+
+_token_sink = ContextVar("autospec_token_sink", default=None)
+# 控制台上正在进行的生成
+_console_active = set()
+
+
+def console_sink(node, event, data):
+    """把流式输出打印到控制台；多个生成同时进行时只打印开始与结束，避免输出交错"""
+    if event == "start":
+        _console_active.add(node)
+        print(f"\n[{node}] 正在生成...", flush=True)
+    elif event == "token":
+        if len(_console_active) <= 1:
+            print(data, end="", flush=True)
+    elif event == "end":
+        _console_active.discard(node)
+        ttft = data["ttft"]
+        ttft_text = f"{ttft:.2f}s" if ttft is not None else "-"
+        print(f"\n[{node}] 生成完成：首个 token {ttft_text}，总耗时 {data['elapsed']:.2f}s，{data['chars']} 字符", flush=True)
+
+
+def set_token_sink(sink):
+    """设置当前上下文的事件消费者，返回用于恢复的 token"""
+    return _token_sink.set(sink)
+
+
+def reset_token_sink(token):
+    """恢复之前的事件消费者"""
+    _token_sink.reset(token)
+
+
+def get_token_sink():
+    """获取当前上下文的事件消费者"""
+    return _token_sink.get() or console_sink
+
+
+def _chunk_text(chunk):
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    # 多模态内容块只取文本部分
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def _cache_args(llm, messages):
+    """计算与 invoke 相同的缓存参数，使流式结果与普通调用共享 LLM 缓存"""
+    cache = get_llm_cache()
+    model = getattr(llm, "bound", llm)
+    if cache is None or getattr(model, "cache", None) is False or not hasattr(model, "_get_llm_string"):
+        return None
+    kwargs = getattr(llm, "kwargs", {}) if model is not llm else {}
+    try:
+        return cache, dumps(convert_to_messages(messages)), model._get_llm_string(**kwargs)
+    except Exception:
+        return None
+
+
+def _fallback_chain(llm):
+    """依次尝试的模型与触发切换的异常：备用链拆为主模型与各备用模型，LimitedLLM 包装在每个模型外层"""
+    if isinstance(llm, LimitedLLM):
+        models, exceptions = _fallback_chain(llm.llm)
+        return [LimitedLLM(model, llm.limiter) for model in models], exceptions
+    if isinstance(llm, RunnableWithFallbacks):
+        return [llm.runnable, *llm.fallbacks], llm.exceptions_to_handle
+    return [llm], ()
+
+
+def _cache_lookup(cache_args):
+    if cache_args is None:
+        return None
+    cache, prompt, llm_string = cache_args
+    generations = cache.lookup(prompt, llm_string)
+    if generations:
+        return generations[0].message
+    return None
+
+
+def _cache_update(cache_args, message):
+    if cache_args is None:
+        return
+    cache, prompt, llm_string = cache_args
+    cached = AIMessage(content=message.content, tool_calls=getattr(message, "tool_calls", []) or [])
+    cache.update(prompt, llm_string, [ChatGeneration(message=cached)])
+
+
+class SpeculationGate:
+    """推测生成的输出闸门：决定之前暂存输出操作，open 后按顺序补发并直接执行，discard 后全部忽略"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decision = None
+        self._pending = []
+
+    @property
+    def discarded(self):
+        return self._decision is False
+
+    def run(self, action, *args):
+        """执行一个输出操作（写文件、推送 token、计入预算等）"""
+        with self._lock:
+            if self._decision is None:
+                self._pending.append((action, args))
+                return
+            if self._decision is False:
+                return
+        action(*args)
+
+    def open(self):
+        """保留生成结果：补发暂存的输出（已决定时不再改变）"""
+        with self._lock:
+            if self._decision is not None:
+                return
+            pending, self._pending = self._pending, []
+            self._decision = True
+            # 持有锁补发，保证与生成线程后续的输出保持顺序
+            for action, args in pending:
+                action(*args)
+
+    def discard(self):
+        """丢弃生成结果：暂存的输出不再执行，正在进行的流式生成在下一个 token 时停止（已决定时不再改变）"""
+        with self._lock:
+            if self._decision is not None:
+                return
+            self._decision = False
+            self._pending = []
+
+
+def _run(gate, action, *args):
+    if gate is None:
+        action(*args)
+    else:
+        gate.run(action, *args)
+
+
+class _StreamWriter:
+    """把 token 推送给消费者并追加写入文件，同时记录耗时；指定 gate 时输出经过闸门"""
+
+    def __init__(self, node, path, on_text=None, gate=None):
+        self.node = node
+        self.path = path
+        self.on_text = on_text
+        self.gate = gate
+        self.sink = get_token_sink()
+        self.started = time.perf_counter()
+        self.ttft = None
+        self.chars = 0
+        self.file = None
+        _run(gate, self._start)
+
+    def _start(self):
+        self.sink(self.node, "start", self.path)
+
+    def _open(self):
+        """收到第一段文本时才打开（截断）目标文件：模型只返回工具调用时原有文档保持不变"""
+        dir_name = os.path.dirname(self.path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.file = open(self.path, "w", encoding="utf-8")
+
+    def _emit(self, text):
+        self.sink(self.node, "token", text)
+        if self.on_text is not None:
+            self.on_text(text)
+        if self.path:
+            if self.file is None:
+                self._open()
+            self.file.write(text)
+            if "\n" in text:
+                self.file.flush()
+
+    def write(self, text):
+        if not text:
+            return
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+            _run(self.gate, self.sink, self.node, "first_token", self.ttft)
+        self.chars += len(text)
+        _run(self.gate, self._emit, text)
+
+    def _end(self, stats):
+        if self.file:
+            self.file.close()
+        self.sink(self.node, "end", stats)
+
+    def close(self):
+        _run(self.gate, self._end, {"ttft": self.ttft, "elapsed": time.perf_counter() - self.started, "chars": self.chars})
+
+
+def _stream_model(llm, messages, writer, gate):
+    """用一个模型流式生成（先查缓存），返回完整消息；闸门被丢弃时返回 None"""
+    cache_args = _cache_args(llm, messages)
+    cached = _cache_lookup(cache_args)
+    if cached is not None:
+        writer.write(cached.content)
+        return cached
+    full = None
+    for chunk in llm.stream(messages):
+        if gate is not None and gate.discarded:
+            # 关闭生成器会中断模型的流式响应
+            return None
+        full = chunk if full is None else full + chunk
+        writer.write(_chunk_text(chunk))
+    if full is None:
+        full = AIMessage(content="")
+    _cache_update(cache_args, full)
+    return full
+
+
+async def _astream_model(llm, messages, writer, gate):
+    """_stream_model 的异步版本"""
+    cache_args = _cache_args(llm, messages)
+    cached = _cache_lookup(cache_args)
+    if cached is not None:
+        writer.write(cached.content)
+        return cached
+    full = None
+    async for chunk in llm.astream(messages):
+        if gate is not None and gate.discarded:
+            return None
+        full = chunk if full is None else full + chunk
+        writer.write(_chunk_text(chunk))
+    if full is None:
+        full = AIMessage(content="")
+    _cache_update(cache_args, full)
+    return full
+
+
+def stream_generate(node, llm, messages, path=None, on_text=None, gate=None):
+    """流式调用模型，token 推送给消费者并追加写入 path，返回完整消息（含工具调用）
+
+    on_text 不为空时每段新文本也会传给 on_text（例如增量提取代码块）。
+    gate 不为空时输出经过闸门，闸门被丢弃时停止生成并返回 None。
+    """
+    models, exceptions = _fallback_chain(llm)
+    writer = _StreamWriter(node, path, on_text, gate)
+    try:
+        for index, model in enumerate(models):
+            try:
+                return _stream_model(model, messages, writer, gate)
+            except exceptions:
+                if index == len(models) - 1 or writer.chars:
+                    raise
+    finally:
+        writer.close()
+
+
+async def astream_generate(node, llm, messages, path=None, on_text=None, gate=None):
+    """stream_generate 的异步版本"""
+    models, exceptions = _fallback_chain(llm)
+    writer = _StreamWriter(node, path, on_text, gate)
+    try:
+        for index, model in enumerate(models):
+            try:
+                return await _astream_model(model, messages, writer, gate)
+            except exceptions:
+                if index == len(models) - 1 or writer.chars:
+                    raise
+    finally:
+        writer.close()
+
+
+def generate(node, llm, messages, path=None, on_text=None, gate=None):
+    """生成入口：指定了输出文件且开启流式时逐 token 流式写入，否则普通调用（完整内容一次性传给 on_text）
+
+    gate 不为空时为推测生成：输出与预算计入经过闸门，闸门被丢弃时返回 None。
+    """
+    if STREAMING and path:
+        response = stream_generate(node, llm, messages, path, on_text, gate)
+    else:
+        response = llm.invoke(messages)
+        if on_text is not None:
+            _run(gate, on_text, _chunk_text(response))
+    if response is None or (gate is not None and gate.discarded):
+        return None
+    _run(gate, charge_response, response, messages, llm)
+    return response
+
+
+async def agenerate(node, llm, messages, path=None, on_text=None, gate=None):
+    """generate 的异步版本"""
+    if STREAMING and path:
+        response = await astream_generate(node, llm, messages, path, on_text, gate)
+    else:
+        response = await llm.ainvoke(messages)
+        if on_text is not None:
+            _run(gate, on_text, _chunk_text(response))
+    if response is None or (gate is not None and gate.discarded):
+        return None
+    _run(gate, charge_response, response, messages, llm)
+    return response
@@ -0,0 +1,117 @@
+"""
+把 tasks.md 解析为任务依赖图（DAG）
+
+任务以 `### T1 任务名称`（或 `任务1：任务名称`、`- [ ] T1. 任务名称` 等）开头，
+正文中包含“依赖”的行列出其依赖的任务编号（如 `依赖任务：T1、T2`，无依赖写“无”）。
+"""
+
+import re
+from collections import deque
+
+
+# 任务标题：可选的标题/列表/复选框前缀 + 任务编号 + 分隔符 + 名称
+TASK_HEADER = re.compile(
+    r"^\s*(?:#{2,6}\s*|[-*]\s+(?:\[[ xX]\]\s*)?|\d+[.、]\s*)?\**\s*"
+    r"(?:T|任务\s*)(\d+(?:\.\d+)*)\s*\**\s*[:：.、\s-]\s*\**(.+?)\**\s*$"
+)
+TASK_REF = re.compile(r"(?:T|任务\s*)(\d+(?:\.\d+)*)")
+SECTION_HEADER = re.compile(r"^\s*#{1,2}\s+\S")
+
+
+class Task:
+    """任务图中的一个任务"""
+
+    def __init__(self, task_id, title):
+        self.id = task_id
+        self.title = title
+        self.lines = []
+        self.deps = []
+
+    @property
+    def text(self):
+        return "\n".join(self.lines).strip()
+
+    def __repr__(self):
+        return f"Task({self.id!r}, deps={self.deps!r})"
+
+
+def parse_tasks(tasks_content):
+    """解析任务文档，返回按出现顺序排列的任务列表"""
+    tasks = []
+    current = None
+    for line in tasks_content.splitlines():
+        match = TASK_HEADER.match(line)
+        if match:
+            current = Task(f"T{match.group(1)}", match.group(2).strip())
+            current.lines.append(line.strip())
+            tasks.append(current)
+            continue
+        if current is None:
+            continue
+        # 遇到新的一级/二级章节时结束当前任务
+        if SECTION_HEADER.match(line):
+            current = None
+            continue
+        current.lines.append(line)
+        if "依赖" in line:
+            for ref in TASK_REF.findall(line.split("依赖", 1)[1]):
+                dep = f"T{ref}"
+                if dep != current.id and dep not in current.deps:
+                    current.deps.append(dep)
+
+    # 同一编号出现多次时保留第一次；忽略指向不存在任务的依赖
+    unique = {}
+    for task in tasks:
+        unique.setdefault(task.id, task)
+    for task in unique.values():
+        task.deps = [dep for dep in task.deps if dep in unique]
+    return list(unique.values())
+
+
+def _cycle_task(remaining, by_id, order_index):
+    """从出现最早的未完成任务出发沿未完成的依赖前进，直到遇到走过的任务，返回环上出现最早的任务
+
+    无法调度时每个未完成任务都至少有一个未完成的依赖，因此一定会走进某个环；起点本身可能只是环的下游。
+    """
+    tid = min(remaining, key=order_index.get)
+    path = []
+    position = {}
+    while tid not in position:
+        position[tid] = len(path)
+        path.append(tid)
+        tid = min((dep for dep in by_id[tid].deps if dep in remaining), key=order_index.get)
+    return min(path[position[tid]:], key=order_index.get)
+
+
+def topological_order(tasks):
+    """返回拓扑序；存在环时断开环上出现最早的任务的剩余依赖"""
+    by_id = {task.id: task for task in tasks}
+    order_index = {task.id: i for i, task in enumerate(tasks)}
+    indegree = {task.id: len(task.deps) for task in tasks}
+    dependents = {task.id: [] for task in tasks}
+    for task in tasks:
+        for dep in task.deps:
+            dependents[dep].append(task.id)
+
+    ready = deque(sorted((tid for tid, d in indegree.items() if d == 0), key=order_index.get))
+    order = []
+    done = set()
+    while len(order) < len(tasks):
+        if not ready:
+            # 存在环：忽略环上一个任务的剩余依赖
+            remaining = {tid for tid in order_index if tid not in done}
+            tid = _cycle_task(remaining, by_id, order_index)
+            for dep in by_id[tid].deps:
+                if dep in remaining:
+                    dependents[dep].remove(tid)
+            by_id[tid].deps = [dep for dep in by_id[tid].deps if dep in done]
+            indegree[tid] = 0
+            ready.append(tid)
+        tid = ready.popleft()
+        order.append(by_id[tid])
+        done.add(tid)
+        for child in dependents[tid]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    return order
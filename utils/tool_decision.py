@@ -0,0 +1,295 @@
+"""
+节点的工具判断与生成调用
+
+probe 模式（默认）：先用 llm_with_tool 探测是否需要调用工具，再用 llm 进行正式生成，共两次调用。
+fused 模式：把正式生成的提示词直接交给 llm_with_tool，模型发出工具调用时转到工具节点，
+否则同一次响应直接作为生成结果，每个阶段只需一次调用。
+speculative 模式：与 probe 模式相同的两次调用，但探测与正式生成同时开始；生成的输出先暂存，
+探测结果为不需要工具时补发并继续实时输出，需要工具时取消生成并丢弃。节点耗时从"探测 + 生成"变为二者中较长的一个，
+探测请求工具时多消耗一次（被取消的）生成。各节点的命中率与节省 / 浪费的时间见 speculation_stats()。
+
+节点达到工具调用上限或运行预算不足时（见 utils/budget.py），各模式都跳过工具，直接用 llm 生成。
+工具节点返回后，各模式的探测与生成消息都带上刚完成的一轮工具调用（见 tool_round_messages），
+探测能看到搜索结果而不是逐字节重复上一次的请求，生成也能用上这些结果。
+
+模式可按节点选择：
+    环境变量 AUTOSPEC_TOOL_MODE=fused                      所有节点的默认模式（probe / fused / speculative）
+    环境变量 AUTOSPEC_TOOL_MODE_GENERATE_DESIGN=fused      单个节点的模式
+    set_call_mode("generate_design", "fused")              运行时修改
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from utils.budget import charge_response, tools_allowed
+from utils.prompt_layout import PROBE_INSTRUCTION
+from utils.metrics import record_speculation
+from utils.streaming import SpeculationGate, generate, agenerate
+
+
+PROBE = "probe"
+FUSED = "fused"
+SPECULATIVE = "speculative"
+CALL_MODES = (PROBE, FUSED, SPECULATIVE)
+# speculative 模式下同时进行的探测调用数
+PROBE_WORKERS = int(os.environ.get("AUTOSPEC_PROBE_WORKERS", "8"))
+
+# 运行时设置的节点模式，优先于环境变量
+_node_call_modes = {}
+
+
+def get_call_mode(node_name):
+    """获取节点的调用模式"""
+    mode = _node_call_modes.get(node_name)
+    if mode is None:
+        mode = os.environ.get(f"AUTOSPEC_TOOL_MODE_{node_name.upper()}") or os.environ.get("AUTOSPEC_TOOL_MODE", PROBE)
+    mode = mode.strip().lower()
+    return mode if mode in CALL_MODES else PROBE
+
+
+def set_call_mode(node_name, mode):
+    """设置节点的调用模式，mode 为 None 时恢复默认"""
+    if mode is None:
+        _node_call_modes.pop(node_name, None)
+        return
+    if mode not in CALL_MODES:
+        raise ValueError(f"未知的调用模式: {mode}，可选值: {', '.join(CALL_MODES)}")
+    _node_call_modes[node_name] = mode
+
+
+def has_tool_calls(response):
+    """判断模型响应中是否包含工具调用"""
+    return bool(getattr(response, "tool_calls", None))
+
+
+def tool_round_messages(state):
+    """取出消息末尾刚完成的一轮工具调用（AIMessage + ToolMessage），用于 fused 模式回到节点后继续生成"""
+    messages = list(state.get("messages") or [])
+    tail = []
+    while messages and isinstance(messages[-1], ToolMessage):
+        tail.insert(0, messages.pop())
+    if tail and messages and isinstance(messages[-1], AIMessage) and has_tool_calls(messages[-1]):
+        return [messages[-1]] + tail
+    return []
+
+
+def with_tool_round(messages, state):
+    """在消息中加入刚完成的一轮工具调用：探测消息中放在末尾的探测指令之前，其他消息追加在末尾"""
+    messages = list(messages)
+    tool_round = tool_round_messages(state)
+    if not tool_round:
+        return messages
+    if messages and isinstance(messages[-1], dict) and messages[-1].get("content") == PROBE_INSTRUCTION:
+        return messages[:-1] + tool_round + messages[-1:]
+    return messages + tool_round
+
+
+def tool_request_update(node_name, tool_response):
+    """构造转到工具节点的状态更新"""
+    return {"messages": [tool_response], "next": "tools", "source_node": node_name}
+
+
+def probe_tools(node_name, state, llm_with_tool, probe_messages):
+    """用 llm_with_tool 探测是否需要调用工具，返回工具调用响应；不需要或不允许调用工具时返回 None"""
+    if not tools_allowed(node_name, state):
+        return None
+    probe_messages = with_tool_round(probe_messages, state)
+    tool_response = llm_with_tool.invoke(probe_messages)
+    charge_response(tool_response, probe_messages, llm_with_tool)
+    return tool_response if has_tool_calls(tool_response) else None
+
+
+async def aprobe_tools(node_name, state, llm_with_tool, probe_messages):
+    """probe_tools 的异步版本"""
+    if not tools_allowed(node_name, state):
+        return None
+    probe_messages = with_tool_round(probe_messages, state)
+    tool_response = await llm_with_tool.ainvoke(probe_messages)
+    charge_response(tool_response, probe_messages, llm_with_tool)
+    return tool_response if has_tool_calls(tool_response) else None
+
+
+_probe_executor = None
+_speculation_lock = threading.Lock()
+# 节点名 -> {"hits", "misses", "saved_s", "wasted_s"}
+_speculation_stats = {}
+
+
+def _get_probe_executor():
+    """延迟创建探测线程池"""
+    global _probe_executor
+    with _speculation_lock:
+        if _probe_executor is None:
+            _probe_executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="tool-probe")
+        return _probe_executor
+
+
+def _record_speculation(node_name, hit, probe_seconds, generation_seconds):
+    """记录一次推测生成：命中时节省的时间为探测与生成重叠的部分，未命中时浪费的是被取消前的生成时间"""
+    seconds = min(probe_seconds, generation_seconds)
+    with _speculation_lock:
+        stats = _speculation_stats.setdefault(node_name, {"hits": 0, "misses": 0, "saved_s": 0.0, "wasted_s": 0.0})
+        stats["hits" if hit else "misses"] += 1
+        stats["saved_s" if hit else "wasted_s"] += seconds
+    record_speculation(node_name, "hit" if hit else "miss", seconds)
+
+
+def speculation_stats():
+    """各节点推测生成的命中次数、命中率与节省 / 浪费的时间"""
+    with _speculation_lock:
+        snapshot = {node: dict(stats) for node, stats in _speculation_stats.items()}
+    for stats in snapshot.values():
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+        stats["saved_s"] = round(stats["saved_s"], 4)
+        stats["wasted_s"] = round(stats["wasted_s"], 4)
+    return snapshot
+
+
+def reset_speculation_stats():
+    """清空推测生成统计"""
+    with _speculation_lock:
+        _speculation_stats.clear()
+
+
+def speculation_report():
+    """格式化的推测生成统计，没有推测生成时返回空字符串"""
+    stats = speculation_stats()
+    if not stats:
+        return ""
+    parts = [f"{node} 命中 {item['hits']}/{item['hits'] + item['misses']}（{item['hit_rate']:.0%}），"
+             f"节省 {item['saved_s']:.2f}s，浪费 {item['wasted_s']:.2f}s" for node, item in sorted(stats.items())]
+    return "[SPECULATION] " + "；".join(parts)
+
+
+def speculate(node_name, state, llm_with_tool, probe_messages, work):
+    """推测执行：探测在线程池中进行，work(gate) 在当前线程经过闸门执行，返回 (tool_response, work 的结果)
+
+    需要工具时丢弃闸门（work 中的输出不会执行）并返回 (tool_response, None)。
+    """
+    gate = SpeculationGate()
+    started = time.perf_counter()
+    probe_done = []
+
+    def decide(future):
+        # 探测一结束就决定：不需要工具时打开闸门恢复实时输出，需要工具或探测失败时停止生成
+        probe_done.append(time.perf_counter() - started)
+        if future.exception() is None and future.result() is None:
+            gate.open()
+        else:
+            gate.discard()
+
+    probe = _get_probe_executor().submit(copy_context().run, probe_tools, node_name, state, llm_with_tool, probe_messages)
+    probe.add_done_callback(decide)
+    result = error = None
+    try:
+        result = work(gate)
+    except Exception as e:
+        error = e
+    generation_seconds = time.perf_counter() - started
+
+    tool_response = probe.result()
+    probe_seconds = probe_done[0] if probe_done else generation_seconds
+    if tool_response is not None:
+        gate.discard()
+        _record_speculation(node_name, False, probe_seconds, generation_seconds)
+        return tool_response, None
+    if error is not None:
+        raise error
+    # 生成先于探测完成时，回调可能还没有执行
+    gate.open()
+    _record_speculation(node_name, True, probe_seconds, generation_seconds)
+    return None, result
+
+
+async def aspeculate(node_name, state, llm_with_tool, probe_messages, work):
+    """speculate 的异步版本：work(gate) 返回协程，探测与其各为一个任务，需要工具时取消 work 的任务"""
+    gate = SpeculationGate()
+    started = time.perf_counter()
+    generation = asyncio.ensure_future(work(gate))
+    generation_done = []
+    generation.add_done_callback(lambda _: generation_done.append(time.perf_counter() - started))
+    try:
+        tool_response = await aprobe_tools(node_name, state, llm_with_tool, probe_messages)
+    except BaseException:
+        gate.discard()
+        generation.cancel()
+        raise
+    probe_seconds = time.perf_counter() - started
+
+    if tool_response is not None:
+        gate.discard()
+        generation.cancel()
+        try:
+            await generation
+        except (asyncio.CancelledError, Exception):
+            pass
+        generation_seconds = generation_done[0] if generation_done else time.perf_counter() - started
+        _record_speculation(node_name, False, probe_seconds, generation_seconds)
+        return tool_response, None
+
+    gate.open()
+    result = await generation
+    _record_speculation(node_name, True, probe_seconds, generation_done[0] if generation_done else probe_seconds)
+    return None, result
+
+
+def _speculate(node_name, state, llm_with_tool, llm, probe_messages, messages, stream_path, on_text):
+    """探测与正式生成同时进行，返回 (tool_response, response)"""
+    return speculate(node_name, state, llm_with_tool, probe_messages,
+                     lambda gate: generate(node_name, llm, messages, stream_path, on_text, gate=gate))
+
+
+async def _aspeculate(node_name, state, llm_with_tool, llm, probe_messages, messages, stream_path, on_text):
+    """_speculate 的异步版本"""
+    return await aspeculate(node_name, state, llm_with_tool, probe_messages,
+                            lambda gate: agenerate(node_name, llm, messages, stream_path, on_text, gate=gate))
+
+
+def invoke_with_tools(node_name, state, llm_with_tool, llm, probe_messages, messages, stream_path=None, on_text=None):
+    """按节点模式执行工具判断与生成，返回 (tool_response, response)
+
+    tool_response 不为 None 时表示模型请求调用工具，此时 response 为 None。
+    stream_path 不为空时正式生成的 token 会实时输出并追加写入该文件，同时传给 on_text。
+    """
+    # 各模式的生成都带上刚完成的工具调用结果（探测消息在 probe_tools 中加入）
+    messages = with_tool_round(messages, state)
+    if get_call_mode(node_name) == FUSED and tools_allowed(node_name, state):
+        # 单次调用：生成提示词直接交给带工具的模型
+        response = generate(node_name, llm_with_tool, messages, stream_path, on_text)
+        if has_tool_calls(response):
+            return response, None
+        return None, response
+
+    if get_call_mode(node_name) == SPECULATIVE and tools_allowed(node_name, state):
+        return _speculate(node_name, state, llm_with_tool, llm, probe_messages, messages, stream_path, on_text)
+
+    # 先检查是否需要工具调用
+    tool_response = None if get_call_mode(node_name) == FUSED else probe_tools(node_name, state, llm_with_tool, probe_messages)
+    if tool_response is not None:
+        return tool_response, None
+    return None, generate(node_name, llm, messages, stream_path, on_text)
+
+
+async def ainvoke_with_tools(node_name, state, llm_with_tool, llm, probe_messages, messages, stream_path=None, on_text=None):
+    """invoke_with_tools 的异步版本"""
+    messages = with_tool_round(messages, state)
+    if get_call_mode(node_name) == FUSED and tools_allowed(node_name, state):
+        response = await agenerate(node_name, llm_with_tool, messages, stream_path, on_text)
+        if has_tool_calls(response):
+            return response, None
+        return None, response
+
+    if get_call_mode(node_name) == SPECULATIVE and tools_allowed(node_name, state):
+        return await _aspeculate(node_name, state, llm_with_tool, llm, probe_messages, messages, stream_path, on_text)
+
+    tool_response = None if get_call_mode(node_name) == FUSED else await aprobe_tools(node_name, state, llm_with_tool, probe_messages)
+    if tool_response is not None:
+        return tool_response, None
+    return None, await agenerate(node_name, llm, messages, stream_path, on_text)
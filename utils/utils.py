@@ -1,3 +1,4 @@
+import asyncio
 import os
 import re
 
@@ -32,4 +33,14 @@ def write_file(file_path, content):
             f.write(content)
         return f"成功写入文件: {file_path}"
     except Exception as e:
-        return f"写入文件时出错: {str(e)}"
\ No newline at end of file
+        return f"写入文件时出错: {str(e)}"
+
+
+async def aread_file(file_path):
+    """异步读取文件内容（在线程中执行，避免阻塞事件循环）"""
+    return await asyncio.to_thread(read_file, file_path)
+
+
+async def awrite_file(file_path, content):
+    """异步写入内容到文件（在线程中执行，避免阻塞事件循环）"""
+    return await asyncio.to_thread(write_file, file_path, content)